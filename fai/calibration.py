@@ -0,0 +1,405 @@
+import hashlib
+import json
+import os
+import numpy as np
+import scipy.ndimage as ndi
+from fai import config, files, interact, process, profile
+
+
+def _cache_key(filenames):
+    """Key that identifies a set of calibration files and their contents"""
+    key = hashlib.sha1()
+    for filename in filenames:
+        stat = os.stat(filename)
+        key.update(f"{os.path.abspath(filename)}:{stat.st_size}:"
+                   f"{stat.st_mtime_ns}".encode())
+    return key.hexdigest()[:16]
+
+
+def _average(filenames):
+    """Average of all the frames of the given image files"""
+    total = None
+    count = 0
+    for filename in filenames:
+        stack = files.imread(filename).raw_data
+        if stack.ndim == 2:
+            stack = stack[np.newaxis]
+        frames = stack.sum(axis=0, dtype=np.float64)
+        total = frames if total is None else total + frames
+        count += len(stack)
+    return total / count
+
+
+def split_channels(image, midpoint, diff, shift=0):
+    """Perpendicular and parallel channels of images of the sensor.
+
+    Parameters
+    ----------
+    image : (S, N, M) array
+
+    midpoint : int
+        Split line of the sensor, the perpendicular channel is above it.
+
+    diff : int
+        Rows of the parallel channel before the split line.
+
+    shift : int, optional
+        Shift of the parallel channel, in columns. Only the columns that
+        overlap once the parallel channel is shifted are kept.
+
+    Returns
+    -------
+    perpendicular, parallel : (S, N', M') arrays
+        Views of the image, see `estimate_split`.
+    """
+    y = image.shape[-1]
+    columns = (slice(shift, y), slice(0, y - shift)) if shift >= 0 else \
+        (slice(0, y + shift), slice(-shift, y))
+    return (image[:, :midpoint, columns[0]],
+            image[:, midpoint - diff:, columns[1]])
+
+
+def dark_flat_maps(dark_files, flat_files, split=None):
+    """Per pixel dark and flat field maps from calibration images.
+
+    Parameters
+    ----------
+    dark_files : list of str
+        Images acquired without light, giving the offset of each pixel.
+
+    flat_files : list of str
+        Images of a uniform sample, giving the gain of each pixel.
+
+    split : int, optional
+        Split line of the sensor, see `estimate_split`. Defaults to the
+        middle of the sensor, as in `segment.separate_channels`.
+
+    Returns
+    -------
+    dark : (N, M) float32 array
+        Offset of each pixel
+
+    gain : (N, M) float32 array
+        Inverse of the relative gain of each pixel. The flat field is
+        normalized separately in the perpendicular and parallel halves of
+        the sensor so that the correction does not change the relative
+        intensity of the channels, which is accounted for by the g-factor.
+    """
+    dark = _average(dark_files)
+    flat = _average(flat_files) - dark
+
+    if split is None:
+        split = int(flat.shape[0] / 2)
+    for half in (flat[:split], flat[split:]):
+        half /= half[half > 0].mean()
+
+    gain = np.ones_like(flat)
+    np.divide(1, flat, out=gain, where=flat > 0)
+
+    return dark.astype(np.float32), gain.astype(np.float32)
+
+
+def _save_atomic(array, filename):
+    """Save an array so that other processes never read a partial file"""
+    temporary = f"{filename[:-len('.npy')]}.{os.getpid()}.tmp.npy"
+    files.arsave(array, temporary)
+    os.replace(temporary, filename)
+    return
+
+
+def build(dark_files, flat_files, cachedir="./calibration", split=None):
+    """Build the dark and flat field maps, or read them from the cache.
+
+    The maps are cached as numpy binary files, in a folder specific to the
+    calibration files, and are memory-mapped when read.
+
+    Parameters
+    ----------
+    dark_files : list of str
+        Images acquired without light.
+
+    flat_files : list of str
+        Images of a uniform sample.
+
+    cachedir : str, optional
+        Folder where the maps are cached.
+
+    split : dict or int, optional
+        Channel split profile of the instrument, see `estimate_split`, or
+        its split line, see `dark_flat_maps`.
+
+    Returns
+    -------
+    calibration : dict
+        `dark` and `gain` maps, as returned by `dark_flat_maps`, and `path`
+        of the cached maps.
+    """
+    if isinstance(split, dict):
+        split = split["split"]
+
+    key = _cache_key(list(dark_files) + list(flat_files))
+    if split is not None:
+        key += f"_split{split}"
+    path = os.path.join(cachedir, key)
+    dark_file = os.path.join(path, "dark.npy")
+    gain_file = os.path.join(path, "gain.npy")
+
+    if not (files.file_exists(dark_file) and files.file_exists(gain_file)):
+        dark, gain = dark_flat_maps(dark_files, flat_files, split)
+        files.mkdir(path)
+        _save_atomic(dark, dark_file)
+        _save_atomic(gain, gain_file)
+
+    return {"dark": np.load(dark_file, mmap_mode="r"),
+            "gain": np.load(gain_file, mmap_mode="r"),
+            "path": path}
+
+
+def _channel_maps(maps, metadata):
+    """Maps of the perpendicular and parallel regions of interest, split,
+    binned and cropped as the channels (see `segment.separate_channels` and
+    `segment.apply_roi`)"""
+    binning = metadata.get("binning", 1)
+    perpendicular, parallel = split_channels(
+        np.asarray(maps)[np.newaxis], metadata["midpoint"], metadata["diff"],
+        metadata.get("shift", 0))
+
+    channels = {}
+    for channel, image in (("perpendicular", perpendicular),
+                           ("parallel", parallel)):
+        if binning > 1:
+            image = process.bin_pixels(image, binning)
+        if "coords" in metadata:
+            image = interact.create_rectangular_mask(image,
+                                                     *metadata["coords"])
+        channels[channel] = image
+    return channels
+
+
+@profile.profiled
+def correct(dataclass, calibration):
+    """Subtract the dark frame from the regions of interest of the channels,
+    and correct them for the flat field.
+
+    Only the pixels of the regions of interest are corrected, so that the
+    correction costs little more than subtracting a constant background.
+    When the channels are binned, the gain of a binned pixel is the mean
+    gain of its pixels.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        `parallel_roi` and `perpendicular_roi` attributes, and the secondary
+        ones when multiplexing, cropped by `segment.apply_roi` or
+        `segment.define_roi`.
+
+    calibration : dict
+        Calibration maps returned by `build`, for the split line of the
+        channels.
+
+    Returns
+    -------
+    dataclass : AnisotropyData dataclass
+        The regions of interest are replaced with the corrected images, in
+        the precision of `config.compute_dtype`. As the offset is already
+        subtracted, anisotropy is to be calculated with a background value
+        of 0.
+    """
+    metadata = dataclass.metadata
+    if "coords" not in metadata and "centers" not in metadata:
+        raise ValueError("The regions of interest have to be cropped before "
+                         "the correction")
+
+    # binned pixels sum the offsets, and average the gains
+    binning = metadata.get("binning", 1)
+    dark = _channel_maps(calibration["dark"], metadata)
+    gain = {channel: image / binning**2 for channel, image in
+            _channel_maps(calibration["gain"], metadata).items()}
+
+    dtype = config.compute_dtype()
+    for prefix in ("", "secondary_"):
+        for channel in ("parallel", "perpendicular"):
+            attribute = prefix + channel + "_roi"
+            image = getattr(dataclass, attribute)
+            if image is None:
+                continue
+
+            if image.shape[1:] != dark[channel].shape[1:]:
+                raise ValueError(f"Calibration maps of shape "
+                                 f"{calibration['dark'].shape} do not match "
+                                 f"the channels of the image")
+
+            corrected = np.subtract(image, dark[channel], dtype=dtype)
+            corrected *= gain[channel]
+            if "centers" in metadata:
+                # pixels outside of a circular region stay 0
+                corrected *= interact.create_circular_mask(
+                    image, metadata["centers"], metadata["radius"])
+            setattr(dataclass, attribute, corrected)
+
+    metadata.update({"calibration": calibration["path"]})
+
+    return dataclass
+
+
+def _split_line(image):
+    """Row of the dark gap between the channels, near the middle of the
+    sensor"""
+    rows = ndi.gaussian_filter1d(image.mean(axis=1), 5)
+    n = len(rows)
+    start, stop = n // 4, 3 * n // 4
+    central = rows[start:stop]
+
+    # without a clear gap, the candidate closest to the middle is chosen
+    darkest = np.flatnonzero(central <= central.min() +
+                             0.01 * np.ptp(rows))
+    return int(start + darkest[np.argmin(np.abs(start + darkest - n // 2))])
+
+
+def _offset(reference, moving):
+    """Integer translation (dy, dx) such that moving[y, x] matches
+    reference[y + dy, x + dx], from the peak of their cross-correlation"""
+    shape = reference.shape
+    f = np.fft.rfft2(reference - reference.mean())
+    g = np.fft.rfft2(moving - moving.mean())
+    correlation = np.fft.irfft2(f * np.conj(g), s=shape)
+
+    peak = np.unravel_index(np.argmax(correlation), shape)
+    return tuple(int(p) if p <= n // 2 else int(p - n)
+                 for p, n in zip(peak, shape))
+
+
+def estimate_split(image, split=None):
+    """Estimate the split line of the sensor, and the offset of the parallel
+    channel with respect to the perpendicular channel, from an image of
+    beads or of a calibration slide.
+
+    Parameters
+    ----------
+    image : (N, M) or (S, N, M) array
+        Calibration image, with the perpendicular channel on the top half of
+        the sensor and the parallel channel on the bottom half. Frames are
+        averaged.
+
+    split : int, optional
+        Known split line. By default, the dark gap between the channels
+        closest to the middle of the sensor.
+
+    Returns
+    -------
+    profile : dict
+        `split` line, `offset` (dy, dx) of the channels, and `shape` of the
+        sensor. The parallel channel starts `offset[0]` rows before the split
+        line, which is the `diff` of `segment.separate_channels`, and is
+        shifted by `offset[1]` columns.
+    """
+    image = np.asarray(image, dtype=np.float64)
+    if image.ndim == 3:
+        image = image.mean(axis=0)
+
+    if split is None:
+        split = _split_line(image)
+
+    height = min(split, image.shape[0] - split)
+    top = image[split - height:split]
+    bottom = image[split:split + height]
+    dy, dx = _offset(top, bottom)
+    # rows of the sensor, rather than of the cropped top half
+    dy += split - height
+
+    if not 0 <= dy < split:
+        raise ValueError(f"Offset of {dy} rows is not within the "
+                         f"perpendicular channel of {split} rows")
+
+    return {"split": int(split),
+            "offset": [dy, dx],
+            "shape": list(image.shape)}
+
+
+def _profile_file(instrument, profiledir):
+    """File of the channel split profile of an instrument"""
+    return os.path.join(profiledir, f"{instrument}.split.json")
+
+
+def save_split(split_profile, instrument, profiledir="./calibration"):
+    """Save the channel split profile of an instrument.
+
+    Parameters
+    ----------
+    split_profile : dict
+        Profile returned by `estimate_split`.
+
+    instrument : str
+        Name of the instrument configuration.
+
+    profiledir : str, optional
+
+    Returns
+    -------
+    None
+    """
+    files.mkdir(profiledir)
+    filename = _profile_file(instrument, profiledir)
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(split_profile, f, indent=2)
+    os.replace(temporary, filename)
+    return
+
+
+def load_split(instrument, profiledir="./calibration"):
+    """Read the channel split profile of an instrument.
+
+    Parameters
+    ----------
+    instrument : str
+
+    profiledir : str, optional
+
+    Returns
+    -------
+    profile : dict or None
+        Profile saved by `save_split`, None when the instrument is not
+        calibrated.
+    """
+    filename = _profile_file(instrument, profiledir)
+    if not files.file_exists(filename):
+        return None
+    with open(filename) as f:
+        return json.load(f)
+
+
+def calibrate_split(bead_files, instrument, profiledir="./calibration",
+                    split=None):
+    """Estimate the channel split profile of an instrument from images of
+    beads, or read it from its profile when the images are unchanged.
+
+    Parameters
+    ----------
+    bead_files : list of str
+        Images of beads, or of a calibration slide.
+
+    instrument : str
+        Name of the instrument configuration, under which the profile is
+        saved, see `save_split`.
+
+    profiledir : str, optional
+
+    split : int, optional
+        Known split line, see `estimate_split`.
+
+    Returns
+    -------
+    profile : dict
+        Profile returned by `estimate_split`, and the `source` key of the
+        bead images.
+    """
+    key = _cache_key(bead_files)
+    cached = load_split(instrument, profiledir)
+    if cached is not None and cached.get("source") == key:
+        return cached
+
+    split_profile = estimate_split(_average(bead_files), split)
+    split_profile["source"] = key
+    save_split(split_profile, instrument, profiledir)
+    return split_profile
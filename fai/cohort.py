@@ -0,0 +1,355 @@
+from dataclasses import dataclass, field
+import os
+import warnings
+import numpy as np
+from fai import data, stats
+
+
+# Time series of every cell in the table
+SERIES = ("mean", "median",
+          "mean_delta", "median_delta",
+          "mean_norm", "median_norm",
+          "ks", "sd")
+
+
+@dataclass
+class CohortTable:
+    # Key of every cell, and the treatment it belongs to
+    cells: list = field(default_factory=list)
+    treatments: list = field(default_factory=list)
+
+    # (cells, time) array of every series, padded with nan at the end of
+    # the shorter time series
+    series: dict = field(default_factory=dict)
+
+
+def cell_key(dataclass):
+    """Key that identifies a cell, from its file and nucleus number.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+
+    Returns
+    -------
+    key : str
+    """
+    metadata = dataclass.metadata or {}
+    if "nucleus" in metadata:
+        return f"{dataclass.filename}:{metadata['nucleus']}"
+    return str(dataclass.filename)
+
+
+def _series(dataclass):
+    """Time series of a cell, with `ks` and `sd` of the anisotropy maps when
+    they are available"""
+    values = {name: getattr(dataclass, name, None) for name in SERIES}
+
+    amaps = dataclass.anisotropy_round_median
+    if amaps is not None:
+        values["ks"] = [stats.ks(amaps[0], amap)[0] for amap in amaps]
+        values["sd"] = [stats.std(amap) for amap in amaps]
+    return values
+
+
+def _stack(rows, n_frames):
+    """(len(rows), n_frames) array of the rows, padded with nan"""
+    array = np.full((len(rows), n_frames), np.nan)
+    for number, row in enumerate(rows):
+        if row is not None:
+            array[number, :len(row)] = row
+    return array
+
+
+def _add(table, new, treatment):
+    """Add the (key, series) of cells to the table"""
+    if not new:
+        return table
+
+    lengths = [len(values[name]) for _, values in new for name in SERIES
+               if values[name] is not None]
+    old_frames = n_frames(table)
+    frames = max(lengths + [old_frames])
+
+    for name in SERIES:
+        old = table.series.get(name, np.empty((len(table.cells), 0)))
+        old = np.pad(old, ((0, 0), (0, frames - old.shape[1])),
+                     constant_values=np.nan)
+        rows = _stack([values[name] for _, values in new], frames)
+        table.series[name] = np.concatenate([old, rows])
+
+    table.cells.extend(key for key, _ in new)
+    table.treatments.extend([treatment] * len(new))
+    return table
+
+
+def add(table, list_of_dataclass, treatment, keys=None):
+    """Add cells to the table.
+
+    Parameters
+    ----------
+    table : CohortTable dataclass
+
+    list_of_dataclass : list of AnisotropyData dataclass
+
+    treatment : str
+
+    keys : list of str, optional
+        Key of every cell, `cell_key` by default.
+
+    Returns
+    -------
+    table : CohortTable dataclass
+    """
+    if keys is None:
+        keys = [cell_key(dataclass) for dataclass in list_of_dataclass]
+
+    return _add(table, [(key, _series(dataclass))
+                        for key, dataclass in zip(keys, list_of_dataclass)],
+                treatment)
+
+
+def series_filename(filename):
+    """File where the time series of a saved result are stored, next to it.
+
+    Parameters
+    ----------
+    filename : str
+        File of the pickled dataclass, see `data.save`.
+
+    Returns
+    -------
+    series_filename : str
+    """
+    return os.path.splitext(filename)[0] + ".series.npz"
+
+
+def write_series(dataclass, filename):
+    """Store the time series of a result next to its file, so that they are
+    read by `update` without reading the dataclass. Called by `data.save`.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+
+    filename : str
+        File of the pickled dataclass.
+
+    Returns
+    -------
+    None
+    """
+    summary = series_filename(filename)
+    temporary = f"{summary[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+    np.savez(temporary, **{name: np.asarray(series, dtype=np.float64)
+                           for name, series in _series(dataclass).items()
+                           if series is not None})
+    os.replace(temporary, summary)
+    return
+
+
+def read_series(filename):
+    """Time series of a saved result, stored by `write_series`.
+
+    Parameters
+    ----------
+    filename : str
+        File of the pickled dataclass.
+
+    Returns
+    -------
+    series : dict
+        Time series of every name in `SERIES`, None if it is not available.
+    """
+    summary = series_filename(filename)
+    if not os.path.isfile(summary):
+        raise FileNotFoundError(f"No time series for {filename}, store them "
+                                f"with `write_series`")
+    with np.load(summary) as arrays:
+        return {name: arrays[name] if name in arrays.files else None
+                for name in SERIES}
+
+
+def build(list_of_dataclass, treatment=""):
+    """Cohort table of a list of cells.
+
+    Parameters
+    ----------
+    list_of_dataclass : list of AnisotropyData dataclass
+
+    treatment : str, optional
+
+    Returns
+    -------
+    table : CohortTable dataclass
+    """
+    return add(CohortTable(), list_of_dataclass, treatment)
+
+
+def update(table, filenames, treatment):
+    """Add the cells of saved results (see `data.save`) to the table.
+
+    Files that are already in the table are skipped, so that a table can be
+    updated with new results without reading the older ones again. Only the
+    time series stored along with the new files are read, see `read_series`,
+    and not the dataclasses. The cells are identified by the name of the
+    file.
+
+    Parameters
+    ----------
+    table : CohortTable dataclass
+
+    filenames : list of str
+        Files of the pickled dataclasses.
+
+    treatment : str
+
+    Returns
+    -------
+    table : CohortTable dataclass
+    """
+    known = set(table.cells)
+    return _add(table, [(filename, read_series(filename))
+                        for filename in filenames if filename not in known],
+                treatment)
+
+
+def n_frames(table):
+    """Number of time points of the longest time series in the table"""
+    if not table.series:
+        return 0
+    return next(iter(table.series.values())).shape[1]
+
+
+def aggregate(values, groups=None):
+    """Mean, standard error in mean, median and number of cells of every
+    time point, for every group of cells. Missing values (nan) are ignored.
+
+    Parameters
+    ----------
+    values : (cells, time) array
+
+    groups : (cells,) int array, optional
+        Group of every cell, from 0. All the cells are in the same group by
+        default.
+
+    Returns
+    -------
+    aggregated : dict
+        `mean`, `sem`, `median` and `count` as (groups, time) arrays.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if groups is None:
+        groups = np.zeros(len(values), dtype=int)
+    n_groups = groups.max() + 1 if len(groups) else 0
+
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+
+    count = np.zeros((n_groups, values.shape[1]))
+    total = np.zeros((n_groups, values.shape[1]))
+    np.add.at(count, groups, valid)
+    np.add.at(total, groups, filled)
+
+    variance = np.full((n_groups, values.shape[1]), np.nan)
+    median = np.full((n_groups, values.shape[1]), np.nan)
+    for group in range(n_groups):
+        members = values[groups == group]
+        columns = valid[groups == group].any(axis=0)
+        median[group, columns] = np.nanmedian(members[:, columns], axis=0)
+        with warnings.catch_warnings():
+            # time points with a single cell have no variance
+            warnings.simplefilter("ignore", RuntimeWarning)
+            # sample variance, with ddof=1 as `stats.sem`
+            variance[group, columns] = np.nanvar(members[:, columns],
+                                                 axis=0, ddof=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        sem = np.sqrt(variance / count)
+    sem[count < 2] = np.nan
+
+    return {"mean": mean, "sem": sem, "median": median, "count": count}
+
+
+def group_by(table, series="mean"):
+    """Aggregate a series of the table over the cells of every treatment.
+
+    Parameters
+    ----------
+    table : CohortTable dataclass
+
+    series : str, optional
+        One of `SERIES`.
+
+    Returns
+    -------
+    treatments : list of str
+
+    aggregated : dict
+        `mean`, `sem`, `median` and `count` as (treatments, time) arrays, see
+        `aggregate`.
+    """
+    treatments, groups = np.unique(table.treatments, return_inverse=True)
+    return treatments.tolist(), aggregate(table.series[series], groups)
+
+
+def select(table, treatment):
+    """Cells of a treatment.
+
+    Parameters
+    ----------
+    table : CohortTable dataclass
+
+    treatment : str
+
+    Returns
+    -------
+    table : CohortTable dataclass
+    """
+    rows = np.asarray(table.treatments) == treatment
+    return CohortTable(cells=np.asarray(table.cells)[rows].tolist(),
+                       treatments=[treatment] * int(rows.sum()),
+                       series={name: values[rows]
+                               for name, values in table.series.items()})
+
+
+def save(table, filename):
+    """Save the table to a compressed npz file.
+
+    Parameters
+    ----------
+    table : CohortTable dataclass
+
+    filename : str
+
+    Returns
+    -------
+    None
+    """
+    arrays = {"series:" + name: values
+              for name, values in table.series.items()}
+    np.savez_compressed(filename,
+                        cells=np.asarray(table.cells, dtype=str),
+                        treatments=np.asarray(table.treatments, dtype=str),
+                        **arrays)
+    return
+
+
+def read(filename):
+    """Read a table saved by `save`.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    table : CohortTable dataclass
+    """
+    with np.load(filename) as arrays:
+        series = {key.split(":", 1)[1]: arrays[key]
+                  for key in arrays.files if key.startswith("series:")}
+        return CohortTable(cells=arrays["cells"].tolist(),
+                           treatments=arrays["treatments"].tolist(),
+                           series=series)
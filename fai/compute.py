@@ -3,18 +3,20 @@
 #   2. np.float() vs float()
 
 import numpy as np
-from fai import process, stats, util
+from fai import config, data, process, profile, stats, util
 import warnings
 
 
-def anisotropy(dataclass, g_factor, bg):
+@profile.profiled
+def anisotropy(dataclass, g_factor, bg, keep="all", secondary_g_factor=None):
     """Calculate anisotropy, given an image.
 
     Parameters
     ----------
     dataclass : AnisotropyData dataclass
         `parallel_roi_cropped` and `perpendicular_roi_reg_cropped` attributes
-        are used for the anisotropy calculation.
+        are used for the anisotropy calculation. When multiplexing, the
+        secondary channels are computed along with them.
 
     g_factor : float
         The correction factor for the bias in polarization.
@@ -23,18 +25,36 @@ def anisotropy(dataclass, g_factor, bg):
         The constant background value to be subtracted from the image before
         calculating anisotropy. This is usually the baseline of the sensor.
         This value is generally 100.0 in the case of Andor Zyla 4.2 sCMOS
-        camera.
+        camera. It is the background of a single pixel, which is scaled when
+        the channels are binned (see `segment.separate_channels`). If the
+        image is corrected with a dark frame (see `calibration.correct`), the
+        background is already subtracted and this value should be 0.
 
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    secondary_g_factor : float, optional
+        The correction factor for the second fluorophore, when multiplexing.
+        `g_factor` is used by default.
 
     Returns
     -------
     dataclass : AnisotropyData dataclass
-        The anisotropy map, rounded off to the 3rd decimal value is stored in
-        the `anisotropy_raw` attribute in the dataclass.
+        The anisotropy map is stored in the `anisotropy_raw` attribute in the
+        dataclass, in the precision of `config.compute_dtype`. Rounded off to
+        the 3rd decimal value, it is stored as integer codes in
+        `anisotropy_round` (see `config.encode`), and median filtered in
+        `anisotropy_round_median`. The results of the
+        second fluorophore are stored in the `secondary_` attributes.
 
     """
 
-    if bg is not 100:
+    if "calibration" in dataclass.metadata:
+        if bg != 0:
+            warnings.warn("Dark frame is subtracted, background value "
+                          "should be 0")
+    elif bg is not 100:
         warnings.warn("Background value should be 100")
 
     # read the raw data
@@ -44,29 +64,159 @@ def anisotropy(dataclass, g_factor, bg):
     # mask for cells
     mask = dataclass.mask_roi_cropped
 
+    # the second fluorophore shares the mask, and is computed along with the
+    # first one, stacked along a new first axis
+    multiplexed = dataclass.secondary_parallel_roi_cropped is not None
+    if multiplexed:
+        if secondary_g_factor is None:
+            secondary_g_factor = g_factor
+
+        parallel = np.stack(
+            [parallel, dataclass.secondary_parallel_roi_cropped])
+        perpendicular = np.stack(
+            [perpendicular, dataclass.secondary_perpendicular_roi_reg_cropped])
+        g_factors = np.array([g_factor, secondary_g_factor])
+        g_factors = g_factors[:, np.newaxis, np.newaxis, np.newaxis]
+    else:
+        g_factors = g_factor
+
     # calculate anisotropy for the given raw data
     anisotropy_map = _calculate_anisotropy(mask,
                                            parallel, perpendicular,
-                                           g_factor, bg)
+                                           g_factors,
+                                           _binned_bg(dataclass, bg))
+
+    # square frames, with the nucleus in the center
+    anisotropy_map = _pad(anisotropy_map)
+
     # discretize anisotropy maps
-    rounded_anisotropy = np.round(anisotropy_map, 3)
+    rounded_anisotropy = _discretize(anisotropy_map)
 
     # discretized median filtered anisotropy map
-    median_filtered = process.median(rounded_anisotropy, size=3)
+    median_filtered = _median_filter(rounded_anisotropy)
+
+    prefixes = ["", "secondary_"] if multiplexed else [""]
+    if not multiplexed:
+        anisotropy_map = [anisotropy_map]
+        rounded_anisotropy = [rounded_anisotropy]
+        median_filtered = [median_filtered]
+
+    for number, prefix in enumerate(prefixes):
+        # store the computed anisotropy values
+        setattr(dataclass, prefix + "anisotropy_raw", anisotropy_map[number])
+        setattr(dataclass, prefix + "anisotropy_round",
+                rounded_anisotropy[number])
+        setattr(dataclass, prefix + "anisotropy_round_median",
+                median_filtered[number])
+
+        # calculate different statistics for a given time series and
+        # store it in dataclass
+        _update_stats(dataclass, median_filtered[number], prefix)
 
-    # store the computed anisotropy values
-    dataclass.anisotropy_raw = anisotropy_map
-    dataclass.anisotropy_round = rounded_anisotropy
-    dataclass.anisotropy_round_median = median_filtered
+    metadata = dataclass.metadata
+    metadata.update({"bg": bg, "g_factor": g_factor,
+                     "dtype": config.compute_dtype().name})
+    if multiplexed:
+        metadata.update({"secondary_g_factor": secondary_g_factor})
+
+    data.retain(dataclass,
+                ["mask_roi_cropped", "parallel_roi_cropped",
+                 "perpendicular_roi_reg_cropped",
+                 "anisotropy_raw", "anisotropy_round",
+                 "secondary_parallel_roi_cropped",
+                 "secondary_perpendicular_roi_reg_cropped",
+                 "secondary_anisotropy_raw", "secondary_anisotropy_round"],
+                keep)
+    return dataclass
 
-    # calculate different statistics for a given time series and
-    # store it in dataclass
-    _update_stats(dataclass, dataclass.anisotropy_round_median)
 
-    metadata = dataclass.metadata
-    metadata.update({"bg": bg, "g_factor": g_factor})
+@profile.profiled
+def sweep(dataclass, g_factors, bgs):
+    """Calculate anisotropy statistics for a grid of g-factors and background
+    values.
 
-    return dataclass
+    The masking, rounding, median filtering and statistics of `anisotropy`
+    are evaluated for all the background values at once, by broadcasting,
+    one g-factor at a time to keep the memory bounded.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        `parallel_roi_cropped`, `perpendicular_roi_reg_cropped` and
+        `mask_roi_cropped` attributes are used, as in `anisotropy`.
+
+    g_factors : (n_g,) array
+        Correction factors for the bias in polarization.
+
+    bgs : (n_bg,) array
+        Constant background values to be subtracted from the image.
+
+    Returns
+    -------
+    results : dict
+        `mean`, `median`, `mean_norm`, `median_norm`, `mean_delta` and
+        `median_delta` as (n_g, n_bg, S) arrays, along with the `g_factor`
+        and `bg` values of the grid.
+    """
+    g_factors = np.atleast_1d(np.asarray(g_factors, dtype=float))
+    bgs = np.atleast_1d(np.asarray(bgs, dtype=float))
+
+    parallel = dataclass.parallel_roi_cropped
+    perpendicular = dataclass.perpendicular_roi_reg_cropped
+    mask = dataclass.mask_roi_cropped
+
+    # (n_bg, 1, 1, 1) to broadcast against the (S, N, M) stacks
+    bg = _binned_bg(dataclass, bgs[:, np.newaxis, np.newaxis, np.newaxis])
+
+    means = []
+    medians = []
+    for g_factor in g_factors:
+        anisotropy_map = _calculate_anisotropy(mask,
+                                               parallel, perpendicular,
+                                               g_factor, bg)
+        anisotropy_map = _pad(anisotropy_map)
+        rounded_anisotropy = _discretize(anisotropy_map)
+
+        # filter each background value independently, as `anisotropy` would
+        median_filtered = _median_filter(rounded_anisotropy)
+
+        mean, median = _frame_stats(median_filtered)
+        means.append(mean)
+        medians.append(median)
+
+    means = np.array(means)
+    medians = np.array(medians)
+
+    return {"g_factor": g_factors,
+            "bg": bgs,
+            "mean": means,
+            "median": medians,
+            "mean_norm": means / means[..., :1],
+            "median_norm": medians / medians[..., :1],
+            "mean_delta": means - means[..., :1],
+            "median_delta": medians - medians[..., :1]}
+
+
+def _frame_stats(anisotropy_maps):
+    """Mean and median of the non-zero values of every (N, M) frame in
+    a (..., N, M) array"""
+    nonzero = anisotropy_maps != 0
+    count = nonzero.sum(axis=(-2, -1))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = anisotropy_maps.sum(axis=(-2, -1)) / count
+
+    with warnings.catch_warnings():
+        # frames without any non-zero value give nan, as in `stats.median`
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(np.where(nonzero, anisotropy_maps, np.nan),
+                              axis=(-2, -1))
+    return mean, median
+
+
+def _binned_bg(dataclass, bg):
+    """Background of the binned pixels, which sum binning x binning pixels"""
+    return bg * dataclass.metadata.get("binning", 1)**2
 
 
 def _calculate_anisotropy(mask, parallel, perpendicular, g_factor, bg):
@@ -74,18 +224,43 @@ def _calculate_anisotropy(mask, parallel, perpendicular, g_factor, bg):
 
     # bg is also subtracted from regions outside the nucleus, which makes it
     # -100, resulting in incorrect anisotropy
-    parallel = parallel - bg
-    perpendicular = perpendicular - bg
+    dtype = config.compute_dtype()
+    parallel = np.subtract(parallel, bg, dtype=dtype)
+    perpendicular = np.subtract(perpendicular, bg, dtype=dtype)
 
     # To fix the above problem:
     # multiplied with nuclear RoI mask to set the outside nuclear region to 0.
-    parallel = parallel * mask
-    perpendicular = perpendicular * mask
+    parallel *= mask
+    perpendicular *= mask
 
     amap = calculate_r(parallel, perpendicular, g_factor)
     return amap
 
 
+def _pad(anisotropy_map):
+    """Square the frames of a (..., S, N, M) anisotropy map, with the nucleus
+    in the center"""
+    if anisotropy_map.ndim > 3:
+        return np.array([_pad(amap) for amap in anisotropy_map])
+    return util.pad(anisotropy_map)
+
+
+def _discretize(anisotropy_map):
+    """Round off anisotropy to the 3rd decimal value, as integer codes (see
+    `config.encode`)"""
+    return config.encode(anisotropy_map)
+
+
+@profile.profiled
+def _median_filter(codes):
+    """Median filter the integer codes of a discretized (..., S, N, M)
+    anisotropy time series, one (S, N, M) series at a time, and decode the
+    filtered anisotropy"""
+    size = (1,) * (codes.ndim - 3) + (3, 3, 3)
+    return config.decode(process.median(codes, size=size))
+
+
+@profile.profiled
 def calculate_r(parallel, perpendicular, g_factor):
     """
     Parameters
@@ -102,8 +277,13 @@ def calculate_r(parallel, perpendicular, g_factor):
     Returns
     -------
     anisotropy_map : ndarray
-        Anisotropy image
+        Anisotropy image, in the precision of the channels, or of
+        `config.compute_dtype` for integer channels.
     """
+    # the g-factor does not upcast single precision channels
+    dtype = np.result_type(parallel, perpendicular, config.compute_dtype())
+    g_factor = np.asarray(g_factor, dtype=dtype)
+
     numerator = (parallel - (g_factor * perpendicular))
     denominator = (parallel + (2 * g_factor * perpendicular))
 
@@ -117,16 +297,18 @@ def calculate_r(parallel, perpendicular, g_factor):
     return anisotropy_map
 
 
-def _update_stats(dataclass, anisotropy_timedata):
+@profile.profiled
+def _update_stats(dataclass, anisotropy_timedata, prefix=""):
     """Helper function to calculate stats from an anisotropy timeseries and
-    update to dataclass"""
-    dataclass.mean = util.iterate(
-        stats.mean, anisotropy_timedata, without_zero=True)
-    dataclass.median = util.iterate(
-        stats.median, anisotropy_timedata, without_zero=True)
+    update to dataclass, in the attributes starting with `prefix`"""
+    mean = util.iterate(stats.mean, anisotropy_timedata, without_zero=True)
+    median = util.iterate(stats.median, anisotropy_timedata, without_zero=True)
+
+    setattr(dataclass, prefix + "mean", mean)
+    setattr(dataclass, prefix + "median", median)
 
-    dataclass.mean_norm = stats.normalize(dataclass.mean)
-    dataclass.median_norm = stats.normalize(dataclass.median)
+    setattr(dataclass, prefix + "mean_norm", stats.normalize(mean))
+    setattr(dataclass, prefix + "median_norm", stats.normalize(median))
 
-    dataclass.mean_delta = stats.delta(dataclass.mean)
-    dataclass.median_delta = stats.delta(dataclass.median)
+    setattr(dataclass, prefix + "mean_delta", stats.delta(mean))
+    setattr(dataclass, prefix + "median_delta", stats.delta(median))
@@ -0,0 +1,68 @@
+import numpy as np
+
+
+# Types used by the pipeline, set once for a run with `set_dtypes`.
+# Camera images are unsigned 16 bit, and anisotropy is computed in single
+# precision, which is well below the noise of the measurement.
+DTYPES = {"raw": np.dtype(np.uint16),
+          "compute": np.dtype(np.float32)}
+
+# Anisotropy rounded off to the 3rd decimal value is stored as integer codes
+SCALE = 1000
+CODE_DTYPE = np.dtype(np.uint16)
+
+
+def set_dtypes(raw=None, compute=None):
+    """Set the types used by every module of the pipeline.
+
+    Parameters
+    ----------
+    raw : numpy dtype, optional
+        Type of the images read from disk, and of the registered channels.
+
+    compute : "float32" or "float64", optional
+        Precision of the anisotropy calculation.
+
+    Returns
+    -------
+    None
+    """
+    if raw is not None:
+        DTYPES["raw"] = np.dtype(raw)
+    if compute is not None:
+        compute = np.dtype(compute)
+        if compute.kind != "f":
+            raise ValueError(f"Anisotropy can not be computed as {compute}")
+        DTYPES["compute"] = compute
+    return
+
+
+def raw_dtype():
+    """Type of the images read from disk"""
+    return DTYPES["raw"]
+
+
+def compute_dtype():
+    """Precision of the anisotropy calculation"""
+    return DTYPES["compute"]
+
+
+def to_raw(image, dtype=None):
+    """Cast an image, such as a registered channel, to the raw type (or to
+    `dtype`), clipping values outside its range instead of wrapping them
+    around"""
+    dtype = raw_dtype() if dtype is None else np.dtype(dtype)
+    if dtype.kind in "iu":
+        info = np.iinfo(dtype)
+        image = np.clip(image, info.min, info.max)
+    return image.astype(dtype, copy=False)
+
+
+def encode(anisotropy_map):
+    """Round off anisotropy to the 3rd decimal value, as integer codes"""
+    return np.rint(anisotropy_map * SCALE).astype(CODE_DTYPE)
+
+
+def decode(codes):
+    """Anisotropy of the integer codes returned by `encode`"""
+    return np.true_divide(codes, SCALE, dtype=compute_dtype())
@@ -1,5 +1,6 @@
 import csv
 from dataclasses import dataclass
+from itertools import zip_longest
 import numpy as np
 import pickle
 
@@ -35,7 +36,8 @@ class AnisotropyData:
 
     # Calculated anisotropy
     anisotropy_raw: np.ndarray = None  # Raw data
-    anisotropy_round: np.ndarray = None  # Rounded to 3 decimal points
+    # Rounded to 3 decimal points, as integer codes (see config.decode)
+    anisotropy_round: np.ndarray = None
     # Median filtered after calculating anisotropy
     anisotropy_round_median: np.ndarray = None
 
@@ -53,11 +55,40 @@ class AnisotropyData:
 
     # If we are multiplexing, with a second fluorophore
     # For instance, two color live imaging of cb.
+    # The registration and the segmentation of the primary
+    # fluorophore are reused for the secondary fluorophore.
+    secondary_raw_data: np.ndarray = None
+
     secondary_parallel: np.ndarray = None
     secondary_perpendicular: np.ndarray = None
 
     secondary_parallel_roi: np.ndarray = None
     secondary_perpendicular_roi: np.ndarray = None
+    secondary_perpendicular_roi_reg: np.ndarray = None
+
+    secondary_parallel_roi_cropped: np.ndarray = None
+    secondary_perpendicular_roi_reg_cropped: np.ndarray = None
+
+    secondary_anisotropy_raw: np.ndarray = None
+    secondary_anisotropy_round: np.ndarray = None
+    secondary_anisotropy_round_median: np.ndarray = None
+
+    secondary_mean: list = None
+    secondary_median: list = None
+
+    secondary_mean_delta: list = None
+    secondary_median_delta: list = None
+
+    secondary_mean_norm: list = None
+    secondary_median_norm: list = None
+
+
+# Results of the pipeline, which are kept by the "final" retention policy
+FINAL_FIELDS = ("anisotropy_round_median",
+                "mean", "median",
+                "mean_delta", "median_delta",
+                "mean_norm", "median_norm")
+FINAL_FIELDS += tuple("secondary_" + field for field in FINAL_FIELDS)
 
 
 def save(dataclass_object, filename):
@@ -76,6 +107,11 @@ def save(dataclass_object, filename):
     """
     with open(filename, "wb") as file:
         pickle.dump(dataclass_object, file)
+
+    if isinstance(dataclass_object, AnisotropyData):
+        # the time series are also stored on their own, for `cohort.update`
+        from fai import cohort
+        cohort.write_series(dataclass_object, filename)
     return
 
 
@@ -107,15 +143,114 @@ def read(filename, minimal=True):
 
         data.mask_roi = None
         data.mask_roi_cropped = None
+
+        data.secondary_raw_data = None
+        data.secondary_parallel = None
+        data.secondary_parallel_roi = None
+
+        data.secondary_perpendicular = None
+        data.secondary_perpendicular_roi = None
+        data.secondary_perpendicular_roi_reg = None
     return data
 
 
+def _owner(array):
+    """Array that owns the memory of a view"""
+    while isinstance(array.base, np.ndarray):
+        array = array.base
+    return array
+
+
+def nbytes(dataclass_object):
+    """Number of bytes held by the arrays of a dataclass object.
+
+    Only the arrays that own their memory are counted, as views into them
+    do not hold any more memory.
+
+    Parameters
+    ----------
+    dataclass_object : dataclass
+
+    Returns
+    -------
+    size : int
+        Total size of the arrays in bytes
+    """
+    return sum(value.nbytes for value in vars(dataclass_object).values()
+               if isinstance(value, np.ndarray) and
+               not isinstance(value.base, np.ndarray))
+
+
+def retain(dataclass_object, consumed, keep="all"):
+    """Release the arrays that have been consumed by a stage of the pipeline,
+    according to a retention policy, and keep track of the peak size of the
+    arrays in `metadata["peak_nbytes"]`.
+
+    Parameters
+    ----------
+    dataclass_object : dataclass
+
+    consumed : list of str
+        Attributes that are not needed by the later stages of the pipeline.
+
+    keep : "all", "final" or list of str
+        if `keep` is "all" (default)
+            every attribute is kept.
+
+        if `keep` is "final"
+            consumed attributes are released, except for `FINAL_FIELDS`.
+
+        if `keep` is a list of attributes
+            consumed attributes are released, except for the listed ones.
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Arrays that are kept but are views into an array that is no longer held
+    by the dataclass, such as the crops of the raw data, are copied, so that
+    the memory of the whole array is freed. Views into memory-mapped files
+    are not copied.
+    """
+    metadata = dataclass_object.metadata
+    metadata["peak_nbytes"] = max(metadata.get("peak_nbytes", 0),
+                                  nbytes(dataclass_object))
+
+    if keep == "all":
+        return
+
+    kept = FINAL_FIELDS if keep == "final" else keep
+
+    for attribute in consumed:
+        value = getattr(dataclass_object, attribute)
+        if value is None:
+            continue
+
+        if attribute not in kept:
+            setattr(dataclass_object, attribute, None)
+
+    arrays = {attribute: value
+              for attribute, value in vars(dataclass_object).items()
+              if isinstance(value, np.ndarray)}
+    held = {id(value) for value in arrays.values()}
+    for attribute, value in arrays.items():
+        owner = _owner(value)
+        if (owner is not value and id(owner) not in held and
+                not isinstance(owner, np.memmap)):
+            setattr(dataclass_object, attribute, value.copy())
+    return
+
+
 def write_to_csv(lists, filename):
     """Write lists to a csv file.
 
     Parameters
     ----------
     lists : list of lists
+        Columns of the csv file. Shorter columns are padded with empty
+        values.
 
     filename : str
 
@@ -123,11 +258,8 @@ def write_to_csv(lists, filename):
     -------
     None
     """
-    column_transformed = np.array(lists).T
-
-    with open(filename, 'w') as csvfile:
+    with open(filename, 'w', newline='') as csvfile:
         wr = csv.writer(csvfile)
-        for column in column_transformed:
-            wr.writerow(column)
+        wr.writerows(zip_longest(*lists, fillvalue=""))
 
     return
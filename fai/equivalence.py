@@ -0,0 +1,254 @@
+import numpy as np
+from fai import compute, process, roi, segment, stats, synthetic
+
+
+# Reference implementations that accelerated variants are compared with
+REFERENCES = {
+    "calculate_r": compute.calculate_r,
+    "median": process.median,
+    "identify_nucleus": segment.identify_nucleus,
+    "stats.mean": stats.mean,
+    "stats.median": stats.median,
+    "stats.std": stats.std,
+    "stats.sem": stats.sem,
+}
+
+# Largest deviation allowed from the reference, or the smallest IoU of the
+# masks for `identify_nucleus`
+TOLERANCES = {
+    "calculate_r": 1e-6,
+    "median": 0,
+    "identify_nucleus": 0.99,
+    "stats.mean": 1e-6,
+    "stats.median": 1e-6,
+    "stats.std": 1e-6,
+    "stats.sem": 1e-6,
+}
+
+
+def fixture(n_frames=9, shape=(256, 256), seed=0, **kwds):
+    """Inputs of the reference implementations, from a synthetic acquisition
+    run through the pipeline.
+
+    Parameters
+    ----------
+    n_frames : int, optional
+
+    shape : (N, M) tuple, optional
+
+    seed : int, optional
+
+    kwds : optional kwds to pass to `synthetic.acquisition`
+
+    Returns
+    -------
+    fixture : dict
+        `parallel` and `perpendicular` background subtracted and masked
+        channels, `g_factor`, the `images` of the parallel channel, and the
+        rounded `anisotropy` map.
+    """
+    kwds.setdefault("radius", (shape[0] / 8, shape[0] / 6))
+    dataclass, truth = synthetic.acquisition(n_frames, shape, shift=(0, 0),
+                                             seed=seed, **kwds)
+    n, m = shape
+    segment.apply_roi(dataclass, roi.rectangle([[0, 0], [m, n]]))
+    dataclass.perpendicular_roi_reg = dataclass.perpendicular_roi
+    segment.nuclei(dataclass)
+
+    mask = dataclass.mask_roi_cropped
+    bg = truth["offset"]
+    parallel = np.subtract(dataclass.parallel_roi_cropped, bg,
+                           dtype=np.float64) * mask
+    perpendicular = np.subtract(dataclass.perpendicular_roi_reg_cropped, bg,
+                                dtype=np.float64) * mask
+
+    return {"parallel": parallel,
+            "perpendicular": perpendicular,
+            "g_factor": np.float64(truth["g_factor"]),
+            "images": dataclass.parallel_roi,
+            "anisotropy": np.round(compute.calculate_r(
+                parallel, perpendicular, truth["g_factor"]), 3)}
+
+
+def save_fixture(fixture_, filename, golden=True):
+    """Save a fixture, and the outputs of the reference implementations, to
+    a compressed npz file.
+
+    Parameters
+    ----------
+    fixture_ : dict
+        Fixture returned by `fixture`.
+
+    filename : str
+
+    golden : bool
+        if `golden` is True (default)
+            the outputs of `REFERENCES` are saved along with the fixture,
+            and are used instead of the references by `compare`.
+
+        if `golden` is False
+            only the fixture is saved.
+
+    Returns
+    -------
+    None
+    """
+    arrays = dict(fixture_)
+    if golden:
+        for name, reference in REFERENCES.items():
+            arrays["golden:" + name] = run(name, reference, fixture_)
+    np.savez_compressed(filename, **arrays)
+    return
+
+
+def load_fixture(filename):
+    """Read a fixture saved by `save_fixture`.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    fixture : dict
+    """
+    with np.load(filename) as arrays:
+        return {key: arrays[key] for key in arrays.files}
+
+
+def run(name, func, fixture_):
+    """Run an implementation of one of the `REFERENCES` on a fixture.
+
+    Parameters
+    ----------
+    name : str
+        Name of the reference implementation.
+
+    func : function
+        Implementation with the same signature as the reference.
+
+    fixture_ : dict
+
+    Returns
+    -------
+    output : array
+        Output of the implementation. Functions of a single frame are run
+        on every frame.
+    """
+    if name == "calculate_r":
+        return func(fixture_["parallel"], fixture_["perpendicular"],
+                    float(fixture_["g_factor"]))
+    if name == "median":
+        return func(fixture_["anisotropy"], size=3)
+    if name == "identify_nucleus":
+        return np.array([func(image) for image in fixture_["images"]])
+    if name.startswith("stats."):
+        return np.array([func(frame) for frame in fixture_["anisotropy"]])
+    raise ValueError(f"No reference implementation named '{name}'")
+
+
+def iou(mask1, mask2):
+    """Intersection over union of two masks, for every frame.
+
+    Parameters
+    ----------
+    mask1, mask2 : (S, N, M) bool array
+
+    Returns
+    -------
+    iou : (S,) array
+        1 where both masks are empty.
+    """
+    axes = (-2, -1)
+    intersection = np.logical_and(mask1, mask2).sum(axis=axes)
+    union = np.logical_or(mask1, mask2).sum(axis=axes)
+    return np.where(union > 0, intersection / np.maximum(union, 1), 1.0)
+
+
+def compare(name, candidate, fixture_, tolerance=None):
+    """Compare an accelerated implementation with the reference.
+
+    Parameters
+    ----------
+    name : str
+        Name of the reference implementation, in `REFERENCES`.
+
+    candidate : function
+        Accelerated implementation, with the same signature.
+
+    fixture_ : dict
+        Fixture returned by `fixture` or `load_fixture`. Stored golden outputs
+        are used when available.
+
+    tolerance : float, optional
+        Defaults to `TOLERANCES[name]`.
+
+    Returns
+    -------
+    report : dict
+        `max_deviation` and `mean_deviation` from the reference (or `min_iou`
+        and `mean_iou` of the masks), `per_frame` deviations (or IoU), and
+        whether the candidate `passed` within the tolerance.
+    """
+    if tolerance is None:
+        tolerance = TOLERANCES[name]
+
+    if "golden:" + name in fixture_:
+        expected = fixture_["golden:" + name]
+    else:
+        expected = run(name, REFERENCES[name], fixture_)
+    output = np.asarray(run(name, candidate, fixture_))
+
+    report = {"name": name, "tolerance": tolerance}
+
+    if name == "identify_nucleus":
+        per_frame = iou(expected, output)
+        report.update({"min_iou": per_frame.min(),
+                       "mean_iou": per_frame.mean(),
+                       "per_frame": per_frame,
+                       "passed": bool(per_frame.min() >= tolerance)})
+        return report
+
+    expected = expected.astype(np.float64)
+    output = output.astype(np.float64)
+    with np.errstate(invalid='ignore'):
+        deviation = np.abs(output - expected)
+    # nan only in one of them is a mismatch, nan in both is not
+    deviation[np.isnan(expected) & np.isnan(output)] = 0
+    deviation[np.isnan(deviation)] = np.inf
+
+    per_frame = deviation.reshape(len(deviation), -1).max(axis=1)
+    report.update({"max_deviation": deviation.max(),
+                   "mean_deviation": deviation.mean(),
+                   "per_frame": per_frame,
+                   "passed": bool(deviation.max() <= tolerance)})
+    return report
+
+
+def check(candidates, fixtures, tolerances=None):
+    """Compare accelerated implementations with the references on several
+    fixtures.
+
+    Parameters
+    ----------
+    candidates : dict
+        Name of the reference implementation mapped to the accelerated one.
+
+    fixtures : list of dict
+
+    tolerances : dict, optional
+        Tolerances that replace the `TOLERANCES`.
+
+    Returns
+    -------
+    reports : list of dict
+        Reports returned by `compare`, for every candidate and fixture.
+    """
+    tolerances = dict(TOLERANCES, **(tolerances or {}))
+
+    reports = []
+    for fixture_ in fixtures:
+        for name, candidate in candidates.items():
+            reports.append(compare(name, candidate, fixture_,
+                                   tolerances[name]))
+    return reports
@@ -0,0 +1,163 @@
+import csv
+import gzip
+import os
+import time
+import uuid
+import numpy as np
+from fai import cohort, files
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # results are exported as compressed csv instead
+    pa = None
+
+
+# Columns of the export, their types, and the series of the cohort table
+COLUMNS = (("cell", str, None),
+           ("treatment", str, None),
+           ("frame", np.int32, None),
+           ("mean", np.float64, "mean"),
+           ("median", np.float64, "median"),
+           ("delta", np.float64, "mean_delta"),
+           ("norm", np.float64, "mean_norm"),
+           ("ks", np.float64, "ks"),
+           ("sd", np.float64, "sd"))
+
+
+def columns(table):
+    """Long format columns of a cohort table, with a row for every time point
+    of every cell. Time points beyond the end of a series are left out.
+
+    Parameters
+    ----------
+    table : cohort.CohortTable dataclass
+
+    Returns
+    -------
+    columns : dict
+        Typed array of every column in `COLUMNS`.
+    """
+    n_cells, n_frames = len(table.cells), cohort.n_frames(table)
+    # an empty table has no series
+    series_of = {series: table.series.get(series, np.empty((n_cells, 0)))
+                 for _, _, series in COLUMNS if series is not None}
+    stacked = np.stack(list(series_of.values()))
+    present = ~np.isnan(stacked).all(axis=0).ravel()
+
+    result = {"cell": np.repeat(np.asarray(table.cells, dtype=str), n_frames),
+              "treatment": np.repeat(np.asarray(table.treatments, dtype=str),
+                                     n_frames),
+              "frame": np.tile(np.arange(n_frames, dtype=np.int32), n_cells)}
+    for name, dtype, series in COLUMNS:
+        if series is not None:
+            result[name] = series_of[series].ravel().astype(dtype)
+
+    return {name: values[present] for name, values in result.items()}
+
+
+def _format(path, format):
+    """Format of the export, from the name of the file or the export that
+    already exists at the path"""
+    if format is not None:
+        return format
+    if path.endswith((".csv", ".csv.gz")) or os.path.isfile(path):
+        return "csv"
+    if os.path.isdir(path) or pa is not None:
+        return "parquet"
+    raise ImportError(f"pyarrow is required to export to {path} as parquet, "
+                      "otherwise name it .csv.gz or give format='csv'")
+
+
+def append(results, path, treatment="", format=None):
+    """Append the time series of cells to an export, without rewriting it.
+
+    Parameters
+    ----------
+    results : cohort.CohortTable dataclass or list of AnisotropyData dataclass
+
+    path : str
+        if `format` is "parquet"
+            folder of the dataset, to which a part file is added for every
+            append.
+
+        if `format` is "csv"
+            gzip compressed csv file, to which a gzip member is appended.
+
+    treatment : str, optional
+        Treatment of the cells, when `results` is a list of dataclasses.
+
+    format : "parquet" or "csv", optional
+        Parquet, unless `path` ends with ".csv" or ".csv.gz", or is an
+        existing csv file. Parquet requires pyarrow, which is installed
+        with the `parquet` extra (`pip install fai[parquet]`).
+
+    Returns
+    -------
+    None
+    """
+    format = _format(path, format)
+    if not isinstance(results, cohort.CohortTable):
+        results = cohort.build(results, treatment)
+    result = columns(results)
+
+    if format == "parquet":
+        if pa is None:
+            raise ImportError("pyarrow is required to export to parquet")
+        files.mkdir(path)
+        # unique to every writer, in the order of the appends, and moved in
+        # place once written
+        name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:12]}"
+        temporary = os.path.join(path, name + ".tmp")
+        pq.write_table(pa.table(result), temporary)
+        os.replace(temporary, os.path.join(path, name + ".parquet"))
+        return
+
+    new = not files.file_exists(path)
+    with gzip.open(path, "at", newline="") as csvfile:
+        writer = csv.writer(csvfile)
+        if new:
+            writer.writerow([name for name, _, _ in COLUMNS])
+        writer.writerows(zip(*[result[name].tolist()
+                               for name, _, _ in COLUMNS]))
+    return
+
+
+def read(path, format=None):
+    """Read an export written by `append`.
+
+    Parameters
+    ----------
+    path : str
+
+    format : "parquet" or "csv", optional
+        As in `append`.
+
+    Returns
+    -------
+    columns : dict
+        Typed array of every column in `COLUMNS`.
+    """
+    if _format(path, format) == "parquet":
+        if pa is None:
+            raise ImportError("pyarrow is required to read parquet")
+        parts = sorted(os.path.join(path, name) for name in os.listdir(path)
+                       if name.endswith(".parquet"))
+        table = pa.concat_tables([pq.read_table(part) for part in parts])
+        return {name: table.column(name).to_numpy().astype(dtype)
+                for name, dtype, _ in COLUMNS}
+
+    with gzip.open(path, "rt", newline="") as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        rows = list(zip(*reader))
+
+    result = {}
+    for name, dtype, _ in COLUMNS:
+        values = rows[header.index(name)] if rows else []
+        if dtype is np.float64:
+            # missing values are written as nan
+            values = [float(value) for value in values]
+        result[name] = np.asarray(values, dtype=dtype)
+    return result
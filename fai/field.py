@@ -0,0 +1,270 @@
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                wait)
+import os
+import numpy as np
+import scipy.ndimage as ndi
+from fai import compute, config, data, segment
+
+
+# Columns of the nucleus table
+TABLE_COLUMNS = ("nucleus", "frame", "y", "x", "area", "mean", "median")
+
+
+def tiles(shape, size=512, overlap=128):
+    """Overlapping tiles that cover an image.
+
+    Parameters
+    ----------
+    shape : (N, M) tuple
+        Shape of the image.
+
+    size : int, optional
+        Size of the core of the tiles. The cores do not overlap, and cover
+        the whole image.
+
+    overlap : int, optional
+        Margin added around the core of every tile, at least the diameter of
+        the largest nuclei, so that the nuclei in the core are whole in the
+        tile. Nuclei cut by the edge of a tile are discarded by the
+        segmentation, see `segment.identify_nucleus`.
+
+    Returns
+    -------
+    tiles : list of tuple
+        For every tile, the slices of the tile in the image, the slices of
+        its core in the image, and the slices of its core in the tile.
+    """
+    result = []
+    for y in range(0, shape[0], size):
+        for x in range(0, shape[1], size):
+            core = (slice(y, min(y + size, shape[0])),
+                    slice(x, min(x + size, shape[1])))
+            tile = tuple(slice(max(s.start - overlap, 0),
+                               min(s.stop + overlap, n))
+                         for s, n in zip(core, shape))
+            inner = tuple(slice(c.start - t.start, c.stop - t.start)
+                          for c, t in zip(core, tile))
+            result.append((tile, core, inner))
+    return result
+
+
+def _register(parallel, perpendicular):
+    """Register the perpendicular channel of a tile, frame by frame"""
+    # SimpleElastix is only needed, in the workers, when registering
+    from fai import transform
+
+    return np.array([transform.align(transform.estimate(img1, img2), img2)
+                     for img1, img2 in zip(parallel, perpendicular)])
+
+
+def process_tile(parallel, perpendicular, g_factor, bg, register=True,
+                 binning=1):
+    """Register, segment and calculate the anisotropy of a tile.
+
+    Parameters
+    ----------
+    parallel, perpendicular : (S, N, M) array
+        Tile of the channels.
+
+    g_factor : float
+
+    bg : float
+
+    register : bool, optional
+        Register the perpendicular channel with `transform.register`.
+
+    binning : int, optional
+        Binning of the channels, see `segment.identify_nucleus`. `bg` is the
+        background of the binned pixels.
+
+    Returns
+    -------
+    mask : (S, N, M) bool array
+        Nuclei of the tile, see `segment.nuclei_mask`.
+
+    anisotropy : (S, N, M) float array
+        Rounded and median filtered anisotropy map, as
+        `anisotropy_round_median` of `compute.anisotropy`.
+    """
+    if register:
+        perpendicular = _register(parallel, perpendicular)
+
+    mask = segment.nuclei_mask(parallel, binning)
+
+    anisotropy_map = compute._calculate_anisotropy(mask, parallel,
+                                                   perpendicular,
+                                                   g_factor, bg)
+    anisotropy_map = compute._median_filter(
+        compute._discretize(anisotropy_map))
+    return mask, anisotropy_map
+
+
+def _allocate(shape, dtype, filename):
+    """Array of the whole field, memory-mapped when a filename is given"""
+    if filename is None:
+        return np.zeros(shape, dtype=dtype)
+    return np.lib.format.open_memmap(filename, mode="w+", dtype=dtype,
+                                     shape=shape)
+
+
+def whole_field(dataclass, g_factor, bg, size=512, overlap=128,
+                register=True, workers=None, out=None, keep="all"):
+    """Calculate the anisotropy of every nucleus in the field, without
+    cropping a region of interest.
+
+    The channels are split into overlapping tiles, which are registered,
+    segmented and whose anisotropy is calculated in parallel. The cores of
+    the tiles are stitched into maps of the whole field, and the nuclei are
+    labelled and tracked over the field. As the nuclei are segmented tile by
+    tile, with the threshold of every tile, the edges of a nucleus that spans
+    the cores of two tiles can differ slightly on either side.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        `parallel` and `perpendicular` attributes are used, see
+        `segment.separate_channels`. They can be memory-mapped, see
+        `files.imread`, as only the tiles being processed are read.
+
+    g_factor : float
+        The correction factor for the bias in polarization.
+
+    bg : float
+        The constant background value, see `compute.anisotropy`.
+
+    size, overlap : int, optional
+        Size of the core of the tiles, and of the margin around it, see
+        `tiles`. The memory used by every worker is bounded by the size of a
+        tile. The overlap is in pixels of the binned channels.
+
+    register : bool, optional
+        Register the channels tile by tile. Requires SimpleElastix.
+
+    workers : int, optional
+        Number of processes.
+
+    out : str, optional
+        Prefix of the numpy files where the masks, labels and maps of the
+        whole field are memory-mapped, instead of being kept in memory.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    Returns
+    -------
+    dataclass : AnisotropyData dataclass
+        `mask_roi` is populated with the tracked nuclei of the whole field
+        (labels), and `anisotropy_round_median` with the anisotropy map of
+        the whole field.
+
+    table : dict
+        Columns `TABLE_COLUMNS` with the centroid, area, mean and median
+        anisotropy of every nucleus in every frame, see `nucleus_table`.
+    """
+    parallel = dataclass.parallel
+    perpendicular = dataclass.perpendicular
+    binning = dataclass.metadata.get("binning", 1)
+
+    # the parallel channel is longer by the overlap of the channels
+    n_frames = len(parallel)
+    shape = (min(parallel.shape[1], perpendicular.shape[1]),
+             min(parallel.shape[2], perpendicular.shape[2]))
+
+    mask = _allocate((n_frames,) + shape, bool,
+                     None if out is None else out + "_mask.npy")
+    anisotropy_map = _allocate((n_frames,) + shape, config.compute_dtype(),
+                               None if out is None else out +
+                               "_anisotropy.npy")
+
+    def stitch(future, core, inner):
+        tile_mask, tile_anisotropy = future.result()
+        mask[(slice(None),) + core] = tile_mask[(slice(None),) + inner]
+        anisotropy_map[(slice(None),) + core] = \
+            tile_anisotropy[(slice(None),) + inner]
+
+    with ProcessPoolExecutor(workers) as executor:
+        # a bounded number of tiles are read and sent to the workers at once
+        limit = 2 * (workers or os.cpu_count() or 1)
+        pending = {}
+        for tile, core, inner in tiles(shape, size, overlap):
+            index = (slice(None),) + tile
+            future = executor.submit(process_tile,
+                                     np.asarray(parallel[index]),
+                                     np.asarray(perpendicular[index]),
+                                     g_factor, compute._binned_bg(
+                                         dataclass, bg),
+                                     register, binning)
+            pending[future] = (core, inner)
+
+            if len(pending) >= limit:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stitch(future, *pending.pop(future))
+
+        for future in list(pending):
+            stitch(future, *pending.pop(future))
+
+    # nuclei are labelled and tracked a frame at a time
+    labels = segment.track(mask, out=_allocate(
+        (n_frames,) + shape, np.int32,
+        None if out is None else out + "_labels.npy"))
+    table = nucleus_table(labels, anisotropy_map)
+
+    dataclass.mask_roi = labels
+    dataclass.anisotropy_round_median = anisotropy_map
+
+    metadata = dataclass.metadata
+    metadata.update({"bg": bg, "g_factor": g_factor,
+                     "tiles": {"size": size, "overlap": overlap}})
+
+    data.retain(dataclass, ["parallel", "perpendicular"], keep)
+    return dataclass, table
+
+
+def nucleus_table(labels, anisotropy_map):
+    """Measure every labelled nucleus in every frame.
+
+    Parameters
+    ----------
+    labels : (S, N, M) int array
+        Tracked nuclei, see `segment.track`.
+
+    anisotropy_map : (S, N, M) array
+
+    Returns
+    -------
+    table : dict
+        `nucleus` label, `frame`, centroid `y` and `x`, `area` in pixels,
+        and `mean` and `median` anisotropy without the zeros, as arrays with
+        a row for every nucleus in every frame.
+    """
+    table = {column: [] for column in TABLE_COLUMNS}
+
+    for frame, (frame_labels, amap) in enumerate(zip(labels, anisotropy_map)):
+        index = np.unique(frame_labels[frame_labels > 0])
+        if index.size == 0:
+            continue
+
+        frame_labels = np.asarray(frame_labels)
+        amap = np.asarray(amap)
+        nonzero = np.where(amap != 0, frame_labels, 0)
+
+        centroids = np.array(ndi.center_of_mass(frame_labels > 0,
+                                                frame_labels, index))
+        area = ndi.sum_labels(np.ones_like(amap), frame_labels, index)
+        count = ndi.sum_labels(amap != 0, frame_labels, index)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = ndi.sum_labels(amap, frame_labels, index) / count
+        median = ndi.median(amap, nonzero, index)
+
+        table["nucleus"].append(index)
+        table["frame"].append(np.full(index.size, frame))
+        table["y"].append(centroids[:, 0])
+        table["x"].append(centroids[:, 1])
+        table["area"].append(area)
+        table["mean"].append(mean)
+        table["median"].append(median)
+
+    return {column: np.concatenate(values) if values else np.array([])
+            for column, values in table.items()}
@@ -1,8 +1,9 @@
 import os
 import glob
+import json
 import tifffile
 import numpy as np
-from fai import data
+from fai import config, data, profile
 
 
 def ls_only(file_list, keyword):
@@ -125,15 +126,30 @@ def file_exists(filename):
     return os.path.isfile(filename)
 
 
-def imread(filename):
-    """Wrapper for Tifffile to read images as int16 and returns a dataclass
-    with the image data.
+@profile.profiled
+def imread(filename, secondary=None, mmap=False):
+    """Wrapper for Tifffile to read images as `config.raw_dtype` (uint16 by
+    default) and returns a dataclass with the image data.
 
     Parameters
     ----------
     filename : str
         Image file that has to be opened.
 
+    secondary : str, optional
+        Image file of a second fluorophore, acquired along with `filename`,
+        which is stored in the `secondary_raw_data` attribute.
+
+    mmap : bool, optional
+        if `mmap` is False (default)
+            the images are read into memory as `config.raw_dtype`.
+
+        if `mmap` is True
+            the images are memory-mapped, read-only and in the type of the
+            file, and frames are only read from disk when they are used, for
+            instance when displayed by `interact.roi_rectangle`. The file
+            must be uncompressed.
+
     Returns
     -------
     dataclass
@@ -142,10 +158,24 @@ def imread(filename):
     -----
     The images can be opened and analysed as floating point numbers.
     """
-    raw_data = tifffile.imread(filename).astype(np.int16)
-    return data.AnisotropyData(filename=filename,
-                               raw_data=raw_data,
-                               metadata={})
+    def read(filename):
+        if mmap:
+            return tifffile.memmap(filename, mode="r")
+        return tifffile.imread(filename).astype(config.raw_dtype(),
+                                                copy=False)
+
+    dataclass = data.AnisotropyData(filename=filename,
+                                    raw_data=read(filename),
+                                    metadata={})
+
+    if secondary is not None:
+        dataclass.secondary_raw_data = read(secondary)
+        dataclass.metadata.update({"secondary": secondary})
+    return dataclass
+
+
+# Largest uncompressed size of a classic TIFF, with a margin for the tags
+CLASSIC_TIFF_NBYTES = 2**32 - 2**25
 
 
 def imsave(array, filename):
@@ -157,14 +187,180 @@ def imsave(array, filename):
         Image file that has to be saved.
 
     filename : str
-        Filename for the image to be saved as.
+        Filename for the image to be saved as. BigTIFF is used for images
+        that are too large for a classic TIFF.
+
+    Returns
+    -------
+    None
+    """
+    bigtiff = array.nbytes > CLASSIC_TIFF_NBYTES
+    with tifffile.TiffWriter(filename, bigtiff=bigtiff) as tif:
+        tif.write(array)
+    return
+
+
+def _jsonable(value):
+    """Convert metadata values, such as slices and arrays, to JSON types"""
+    if isinstance(value, dict):
+        return {str(key): _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, slice):
+        return [value.start, value.stop, value.step]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _downsample(frame):
+    """Average of every 2 x 2 block of pixels"""
+    n, m = frame.shape[0] // 2 * 2, frame.shape[1] // 2 * 2
+    blocks = frame[:n, :m].reshape(n // 2, 2, m // 2, 2)
+    return blocks.mean(axis=(1, 3)).astype(frame.dtype)
+
+
+def _tiles(frames, dtype, tile, levels):
+    """Tiles of every frame, in the order they are written, keeping the
+    downsampled frames of every level of the pyramid"""
+    for frame in frames:
+        frame = np.asarray(frame, dtype=dtype)
+
+        level = frame
+        for downsampled in levels:
+            level = _downsample(level)
+            downsampled.append(level)
+
+        if tile is None:
+            yield frame
+            continue
+
+        n, m = frame.shape
+        for y in range(0, n, tile[0]):
+            for x in range(0, m, tile[1]):
+                block = frame[y:y + tile[0], x:x + tile[1]]
+                if block.shape != tuple(tile):
+                    # tiles at the edges are padded
+                    padded = np.zeros(tile, dtype=dtype)
+                    padded[:block.shape[0], :block.shape[1]] = block
+                    block = padded
+                yield block
+
+
+def imwrite(frames, filename, shape, dtype, metadata=None, tile=(256, 256),
+            compression="zlib", pyramid=0, bigtiff=None):
+    """Write a stack of images to a tiled and compressed TIFF, one frame at
+    a time.
+
+    Parameters
+    ----------
+    frames : iterable of (N, M) arrays
+        Frames of the stack, for instance a generator, which are written as
+        they are produced.
+
+    filename : str
+
+    shape : (S, N, M) tuple
+        Shape of the stack.
+
+    dtype : numpy dtype
+        Type of the stack.
+
+    metadata : dict, optional
+        Metadata of the dataclass (bg, g_factor, coords, slice, ...) which is
+        embedded as JSON in the image description. Slices and arrays are
+        stored as lists, see `read_metadata`.
+
+    tile : (th, tw) tuple, optional
+        Shape of the tiles, multiples of 16. Frames smaller than a tile are
+        written in strips.
+
+    compression : str, optional
+        Lossless compression of the tiles, "zlib" (default), "zstd", "lzw"
+        or None.
+
+    pyramid : int, optional
+        Number of levels of downsampled images, each half the size of the
+        previous one, stored in SubIFDs for quick viewing. The downsampled
+        frames are kept in memory until the stack is written.
+
+    bigtiff : bool, optional
+        Defaults to BigTIFF when the stack is too large for a classic TIFF.
+
+    Returns
+    -------
+    None
+    """
+    shape = tuple(shape)
+    dtype = np.dtype(dtype)
+    if bigtiff is None:
+        bigtiff = np.prod(shape) * dtype.itemsize > CLASSIC_TIFF_NBYTES
+    if tile is not None and (shape[-2] < tile[0] or shape[-1] < tile[1]):
+        tile = None
+
+    levels = [[] for _ in range(pyramid)]
+    options = {"tile": tile, "compression": compression,
+               "photometric": "minisblack"}
+
+    with tifffile.TiffWriter(filename, bigtiff=bigtiff) as tif:
+        tif.write(_tiles(frames, dtype, tile, levels), shape=shape,
+                  dtype=dtype, subifds=pyramid or None,
+                  metadata=_jsonable(metadata or {}), **options)
+
+        for level in levels:
+            level = np.asarray(level)
+            if tile is not None and (level.shape[-2] < tile[0] or
+                                     level.shape[-1] < tile[1]):
+                options["tile"] = None
+            tif.write(level, subfiletype=1, **options)
+    return
+
+
+def read_metadata(filename):
+    """Read the metadata embedded by `imwrite`.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    metadata : dict
+    """
+    with tifffile.TiffFile(filename) as tif:
+        description = tif.pages[0].description
+    metadata = json.loads(description) if description else {}
+    metadata.pop("shape", None)
+    return metadata
+
+
+def save_anisotropy(dataclass, filename, attribute="anisotropy_round_median",
+                    **kwds):
+    """Write an anisotropy map of a dataclass with `imwrite`, along with its
+    metadata.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+
+    filename : str
+
+    attribute : str, optional
+        Attribute of the dataclass that is written.
+
+    kwds : optional kwds to pass to `imwrite`
 
     Returns
     -------
     None
     """
-    with tifffile.TiffWriter(filename, bigtiff=False) as tif:
-        tif.save(array)
+    array = getattr(dataclass, attribute)
+    imwrite(iter(array), filename, array.shape, array.dtype,
+            metadata=dataclass.metadata, **kwds)
     return
 
 
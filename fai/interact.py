@@ -23,29 +23,104 @@ def create_circular_mask(images, centers, radius):
     -------
     mask : (S, N, M) boolean numpy array
     """
-    masks = []
-    for image, center in zip(images, centers):
-        h, w = image.shape
-        Y, X = np.ogrid[:h, :w]
+    h, w = images.shape[-2:]
+    centers = np.asarray(centers, dtype=np.float64)[:len(images)]
+    Y, X = np.ogrid[:h, :w]
 
-        dist_from_center = np.sqrt((X - center[0])**2 + (Y - center[1])**2)
-        mask = dist_from_center <= radius
-        masks.append(mask)
-    return np.array(masks)
+    # squared distances of the whole stack at once, broadcast over the frames
+    x = centers[:, 0, np.newaxis, np.newaxis]
+    y = centers[:, 1, np.newaxis, np.newaxis]
+    return (X - x)**2 + (Y - y)**2 <= radius**2
 
 
-def roi_circle(img, radius=10):
+def _display(img, max_size=1024):
+    """Frames of a stack for display, downsampled to at most `max_size`
+    pixels on a side, read on demand and cached.
+
+    Returns a function that gives the frame for a slider value, and the extent
+    of the frames in the coordinates of the full resolution images.
+    """
+    h, w = img.shape[-2:]
+    step = max(1, int(np.ceil(max(h, w) / max_size)))
+    cache = {}
+
+    def frame(num):
+        if num not in cache:
+            # only the displayed pixels are read from a memory-mapped stack
+            cache[num] = np.asarray(img[num, ::step, ::step])
+        return cache[num]
+
+    extent = (-0.5, w - 0.5, h - 0.5, -0.5)
+    return frame, extent
+
+
+def _blitter(fig, image_ax, animated):
+    """Redraw a frame of the stack, the slider and the other `animated`
+    artists by blitting them over the saved figure, instead of redrawing the
+    whole figure on every move of the slider.
+
+    Returns a function that shows a new frame, and one that only redraws the
+    animated artists.
+    """
+    for artist in animated:
+        artist.set_animated(True)
+    background = [None]
+
+    def draw_animated():
+        for artist in animated:
+            fig.draw_artist(artist)
+
+    def on_draw(event):
+        background[0] = fig.canvas.copy_from_bbox(fig.bbox)
+        draw_animated()
+
+    def show_frame(data):
+        image_ax.set_data(data)
+        if background[0] is None:
+            fig.canvas.draw_idle()
+            return
+        fig.canvas.restore_region(background[0])
+        # the frame is opaque, and covers the previous one
+        fig.draw_artist(image_ax)
+        background[0] = fig.canvas.copy_from_bbox(fig.bbox)
+        draw_animated()
+        fig.canvas.blit(fig.bbox)
+
+    def show_animated():
+        if background[0] is None:
+            fig.canvas.draw_idle()
+            return
+        fig.canvas.restore_region(background[0])
+        draw_animated()
+        fig.canvas.blit(fig.bbox)
+
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    return show_frame, show_animated
+
+
+def _toolbar_active(fig):
+    """True if the zoom or pan tool of the toolbar is selected"""
+    toolbar = fig.canvas.manager.toolbar
+    return toolbar is not None and bool(getattr(toolbar, "mode", ""))
+
+
+def roi_circle(img, radius=10, max_size=1024):
     """
     Click to interactively draw a circular RoI for a stack of images.
 
     Parameters
     ----------
     img : (S, N, M) numpy array
-        Images for which to draw RoI
+        Images for which to draw RoI. Frames of a memory-mapped stack are
+        read when they are displayed.
 
     radius : int
         Radius of the RoI
 
+    max_size : int
+        Largest size of the displayed frames. Larger frames are downsampled
+        for display, the RoI is drawn in full resolution coordinates.
+
     Returns
     -------
     masked image : (S, N, M) numpy array
@@ -78,7 +153,7 @@ def roi_circle(img, radius=10):
         if event.inaxes is zbox:
             return
 
-        if fig.canvas.manager.toolbar._active is not None:
+        if _toolbar_active(fig):
             return
 
         center = [event.xdata, event.ydata]
@@ -89,33 +164,43 @@ def roi_circle(img, radius=10):
 
         draw_circle()
 
-    def draw_circle():
+    def update_circle():
         num = current_num[0]
-        circ.center = centers[num]
-        circ.radius = radius
-        fig.canvas.draw_idle()
+        if centers[num] != [None, None]:
+            circ.center = centers[num]
+            circ.radius = radius
+            circ.set_visible(True)
+
+    def draw_circle():
+        # only the circle and the slider are redrawn, over the saved image
+        update_circle()
+        show_animated()
 
     def update_image(num):
         num = int(num)
         current_num[0] = num
-        image = np.squeeze(img[num:num+1])
-        image_ax.set_data(image)
-        draw_circle()
-        fig.canvas.draw_idle()
+        update_circle()
+        show_frame(frame(num))
+
+    frame, extent = _display(img, max_size)
 
     fig, ax = plt.subplots()
     plt.subplots_adjust(bottom=0.2)
 
-    image_ax = ax.imshow(img[0], cmap=plt.cm.gray)
+    image_ax = ax.imshow(frame(0), cmap=plt.cm.gray, extent=extent)
     ax.axis("off")
 
-    circ = plt.Circle([None, None], 10, ec="k", alpha=0.7)
+    circ = plt.Circle([0, 0], radius, ec="k", alpha=0.7, visible=False)
     ax.add_patch(circ)
 
     zbox = plt.axes([0.1, 0.05, 0.8, 0.025])
 
-    zslide = Slider(zbox, 'Z', 0, img.shape[0] - 1, valinit=0, valfmt="%i")
+    zslide = Slider(zbox, 'Z', 0, img.shape[0] - 1, valinit=0, valfmt="%i",
+                    valstep=1)
+    # the slider is blitted along with the frame
+    zslide.drawon = False
     zslide.on_changed(update_image)
+    show_frame, show_animated = _blitter(fig, image_ax, [zbox, circ])
 
     cid = fig.canvas.mpl_connect('button_press_event', on_press)
 
@@ -152,14 +237,19 @@ def create_rectangular_mask(image, click, release):
     return image[:,  y1:y2, x1:x2]
 
 
-def roi_rectangle(img):
+def roi_rectangle(img, max_size=1024):
     """
     Click to interactively draw a rectangular RoI for a stack of images.
 
     Parameters
     ----------
     img : (S, N, M) numpy array
-        Images for which to draw RoI
+        Images for which to draw RoI. Frames of a memory-mapped stack are
+        read when they are displayed.
+
+    max_size : int
+        Largest size of the displayed frames. Larger frames are downsampled
+        for display, the RoI is drawn in full resolution coordinates.
 
     Returns
     -------
@@ -179,33 +269,37 @@ def roi_rectangle(img):
         if event.inaxes is zbox:
             return
 
-        if fig.canvas.manager.toolbar._active is not None:
+        if _toolbar_active(fig):
             return
 
     def update_image(num):
-        num = int(num)
-        image = np.squeeze(img[num:num+1])
-        image_ax.set_data(image)
-        fig.canvas.draw_idle()
+        show_frame(frame(int(num)))
+        # the selector is blitted over its own copy of the figure
+        rs_selector.update_background(None)
 
     def line_select_callback(eclick, erelease):
         click[:] = eclick.xdata, eclick.ydata
         release[:] = erelease.xdata, erelease.ydata
 
+    frame, extent = _display(img, max_size)
+
     fig, ax = plt.subplots()
     plt.subplots_adjust(bottom=0.2)
 
-    image_ax = ax.imshow(img[0], cmap=plt.cm.gray)
+    image_ax = ax.imshow(frame(0), cmap=plt.cm.gray, extent=extent)
     ax.axis("off")
 
     zbox = plt.axes([0.1, 0.05, 0.8, 0.025])
 
-    zslide = Slider(zbox, 'Z', 0, img.shape[0] - 1, valinit=0, valfmt="%i")
+    zslide = Slider(zbox, 'Z', 0, img.shape[0] - 1, valinit=0, valfmt="%i",
+                    valstep=1)
+    zslide.drawon = False
     zslide.on_changed(update_image)
+    show_frame, _ = _blitter(fig, image_ax, [zbox])
 
     cid = fig.canvas.mpl_connect('button_press_event', on_press)
     rs_selector = RectangleSelector(ax, line_select_callback,
-                                        drawtype="box", interactive=True)
+                                    useblit=True, interactive=True)
     plt.show()
 
     click = list(map(int, click))
@@ -0,0 +1,489 @@
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from fai import compute, data, files, roi, segment
+
+
+# Folders of the queue, one for every state of a job. A job is a json file
+# that is moved from one folder to the other with `os.rename`, which is
+# atomic on a filesystem shared by several nodes, so that a job is claimed
+# by a single worker.
+STATES = ("pending", "running", "done", "failed")
+
+# Image files of the acquisitions, which are enqueued from the output of
+# `files.ls` along with other files, such as `roi.spec_filename`
+IMAGE_EXTENSIONS = (".tif", ".tiff")
+
+
+def _job_id(filename):
+    """Identifier of the job of an acquisition, from its full path"""
+    return hashlib.sha1(os.path.abspath(filename).encode()).hexdigest()[:16]
+
+
+def _job_file(path, state, job_id):
+    return os.path.join(path, state, f"{job_id}.json")
+
+
+def _worker():
+    """Name of this worker, unique over the nodes"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _write(job, filename):
+    """Write a job, atomically replacing the file"""
+    temporary = f"{filename}.{_worker().replace(':', '-')}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(job, f, indent=2)
+    os.replace(temporary, filename)
+    return
+
+
+def _read(filename):
+    with open(filename) as f:
+        return json.load(f)
+
+
+def init(path):
+    """Create the folders of a queue.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue, on a filesystem shared by the workers.
+
+    Returns
+    -------
+    None
+    """
+    for state in STATES:
+        files.mkdir(os.path.join(path, state))
+    return
+
+
+def state(path, job_id):
+    """State of a job, one of `STATES`, or None if it is not in the queue"""
+    for name in STATES:
+        if os.path.isfile(_job_file(path, name, job_id)):
+            return name
+    return None
+
+
+def enqueue(path, filenames, outdir, catalog=None, **params):
+    """Add a job for every acquisition to the queue.
+
+    Acquisitions that are already in the queue, in any state, are skipped,
+    so that a cohort can be enqueued again as new acquisitions are added.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    filenames : list of str
+        Image files of the acquisitions, see `files.ls`. Files that are not
+        images, see `IMAGE_EXTENSIONS`, are skipped.
+
+    outdir : str
+        Folder where the results of the jobs are saved.
+
+    catalog : dict, optional
+        Catalog of regions of interest, see `roi.lookup`. The regions of
+        every acquisition are stored in its job, so that the workers do not
+        need the catalog.
+
+    params : keyword arguments
+        Parameters of the pipeline, such as `g_factor` and `bg`, see
+        `process`.
+
+    Returns
+    -------
+    job_ids : list of str
+        Jobs that were added.
+    """
+    init(path)
+    added = []
+    for filename in filenames:
+        if not filename.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        job_id = _job_id(filename)
+        if state(path, job_id) is not None:
+            continue
+
+        job = {"id": job_id,
+               "filename": os.path.abspath(filename),
+               "specs": roi.lookup(filename, catalog),
+               "outdir": os.path.abspath(outdir),
+               "params": params,
+               "attempts": 0,
+               "worker": None,
+               "outputs": [],
+               "error": None}
+        _write(job, _job_file(path, "pending", job_id))
+        added.append(job_id)
+    return added
+
+
+def claim(path):
+    """Claim the next pending job.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    Returns
+    -------
+    job : dict or None
+        The claimed job, now running, or None if no job is pending.
+    """
+    pending = os.path.join(path, "pending")
+    for name in sorted(os.listdir(pending)):
+        if not name.endswith(".json"):
+            continue
+        job_id = name[:-len(".json")]
+        running = _job_file(path, "running", job_id)
+        try:
+            os.rename(os.path.join(pending, name), running)
+        except FileNotFoundError:
+            # claimed by another worker
+            continue
+        # the pending file keeps its age, which would make it stale at once
+        os.utime(running)
+
+        # a stale job can be requeued after a slow worker finished it
+        if os.path.isfile(_job_file(path, "done", job_id)):
+            os.remove(running)
+            continue
+
+        job = _read(running)
+        job.update({"worker": _worker(),
+                    "attempts": job["attempts"] + 1,
+                    "claimed": time.time()})
+        _write(job, running)
+        return job
+    return None
+
+
+@contextmanager
+def heartbeat(path, job, interval=30):
+    """Touch the file of a running job every `interval` seconds, in a
+    background thread, so that the job is not requeued by `requeue_stale`
+    while it is being processed.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    job : dict
+        Job returned by `claim`.
+
+    interval : float, optional
+        Seconds between two heartbeats. The heartbeats stop when the job is
+        done or failed, or at the end of the context.
+    """
+    filename = _job_file(path, "running", job["id"])
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            for name in (filename, filename + ".stale"):
+                try:
+                    # a job that is being requeued by `requeue_stale` is
+                    # moved back to the running jobs when it is touched
+                    os.utime(name)
+                    break
+                except FileNotFoundError:
+                    continue
+            else:
+                if state(path, job["id"]) in ("done", "failed"):
+                    return
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(path, timeout=600, max_attempts=3):
+    """Requeue the running jobs whose worker stopped sending heartbeats, for
+    instance after a crash of its node.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    timeout : float, optional
+        Seconds since the last heartbeat after which a job is stale. Larger
+        than the `interval` of `heartbeat`.
+
+    max_attempts : int, optional
+        Stale jobs that were claimed as many times are moved to the failed
+        jobs instead.
+
+    Returns
+    -------
+    job_ids : list of str
+        Jobs that were requeued or failed.
+    """
+    running = os.path.join(path, "running")
+    now = time.time()
+    stale = []
+    for name in sorted(os.listdir(running)):
+        if not name.endswith(".json"):
+            continue
+        filename = os.path.join(running, name)
+        try:
+            if now - os.path.getmtime(filename) < timeout:
+                continue
+            job = _read(filename)
+        except FileNotFoundError:
+            continue
+
+        target = "pending" if job["attempts"] < max_attempts else "failed"
+        job["error"] = f"No heartbeat from {job['worker']} for {timeout} s"
+        try:
+            # claimed again by this function, so that only one node requeues
+            os.rename(filename, filename + ".stale")
+        except FileNotFoundError:
+            continue
+        if time.time() - os.path.getmtime(filename + ".stale") < timeout:
+            # claimed again, or touched by a heartbeat, since it was read
+            os.rename(filename + ".stale", filename)
+            continue
+        _write(job, _job_file(path, target, job["id"]))
+        os.remove(filename + ".stale")
+        stale.append(job["id"])
+    return stale
+
+
+def _owns(filename, job):
+    """Whether a running job file still belongs to the claim of `job`, and
+    was not requeued and claimed again by another worker"""
+    try:
+        current = _read(filename)
+    except FileNotFoundError:
+        return False
+    return (current["worker"], current["attempts"]) == (job["worker"],
+                                                         job["attempts"])
+
+
+def _finish(path, job, target):
+    """Move a running job to the done or failed jobs"""
+    _write(job, _job_file(path, target, job["id"]))
+    running = _job_file(path, "running", job["id"])
+    if _owns(running, job):
+        os.remove(running)
+    return
+
+
+def complete(path, job, outputs):
+    """Record the outputs of a job and mark it as done.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    job : dict
+        Job returned by `claim`.
+
+    outputs : list of str
+        Files written by the job.
+
+    Returns
+    -------
+    None
+    """
+    job.update({"outputs": list(outputs), "error": None,
+                "finished": time.time()})
+    _finish(path, job, "done")
+    return
+
+
+def fail(path, job, error):
+    """Record the error of a job and mark it as failed.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    job : dict
+        Job returned by `claim`.
+
+    error : str
+
+    Returns
+    -------
+    None
+    """
+    job.update({"error": error, "finished": time.time()})
+    _finish(path, job, "failed")
+    return
+
+
+def retry(path):
+    """Move the failed jobs back to the pending jobs.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    Returns
+    -------
+    job_ids : list of str
+    """
+    failed = os.path.join(path, "failed")
+    retried = []
+    for name in sorted(os.listdir(failed)):
+        if not name.endswith(".json"):
+            continue
+        try:
+            os.rename(os.path.join(failed, name),
+                      os.path.join(path, "pending", name))
+        except FileNotFoundError:
+            continue
+        retried.append(name[:-len(".json")])
+    return retried
+
+
+def process(job):
+    """Default pipeline of a job: crop the saved regions of interest of the
+    acquisition, register the channels, segment the nuclei and calculate
+    their anisotropy.
+
+    Parameters
+    ----------
+    job : dict
+        Job returned by `claim`. `params` are `g_factor` and `bg` of
+        `compute.anisotropy`, and optionally `keep`.
+
+    Returns
+    -------
+    outputs : list of str
+        Pickled dataclass of every region of interest, see `data.save`.
+    """
+    if not job["specs"]:
+        raise ValueError(f"No region of interest for {job['filename']}, "
+                         "see `roi.lookup`")
+
+    # SimpleElastix is only needed, in the workers, when registering
+    from fai import transform
+
+    params = dict(job["params"])
+    keep = params.pop("keep", "final")
+
+    dataclass = files.imread(job["filename"])
+    rois = segment.replay_roi(dataclass, job["specs"], keep=keep)
+
+    files.mkdir(job["outdir"])
+    name = os.path.splitext(os.path.basename(job["filename"]))[0]
+    outputs = []
+    for number, region in enumerate(rois):
+        transform.register(region, keep)
+        segment.nuclei(region, keep)
+        compute.anisotropy(region, keep=keep, **params)
+
+        filename = os.path.join(job["outdir"], f"{name}_{number}.pkl")
+        data.save(region, filename)
+        outputs.append(filename)
+    return outputs
+
+
+def work(path, pipeline=process, interval=30, timeout=600, max_attempts=3,
+         wait=False):
+    """Process jobs of the queue until none is left. Several workers can run
+    at once, on any node that shares the folder of the queue.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    pipeline : function, optional
+        Function that processes a job and returns the files it wrote, see
+        `process`.
+
+    interval : float, optional
+        Seconds between two heartbeats, see `heartbeat`.
+
+    timeout, max_attempts : optional
+        Stale jobs of the other workers are requeued, see `requeue_stale`.
+
+    wait : bool, optional
+        Wait for the jobs that are running on other workers, which can be
+        requeued if their worker crashes, instead of returning as soon as no
+        job is pending.
+
+    Returns
+    -------
+    job_ids : list of str
+        Jobs processed by this worker, done or failed.
+    """
+    processed = []
+    while True:
+        requeue_stale(path, timeout, max_attempts)
+        job = claim(path)
+        if job is None:
+            if wait and os.listdir(os.path.join(path, "running")):
+                time.sleep(interval)
+                continue
+            return processed
+
+        with heartbeat(path, job, interval):
+            try:
+                outputs = pipeline(job)
+            except Exception:
+                fail(path, job, traceback.format_exc())
+            else:
+                complete(path, job, outputs)
+        processed.append(job["id"])
+
+
+def status(path):
+    """Number of jobs in every state.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    Returns
+    -------
+    counts : dict
+    """
+    return {name: len([job for job in os.listdir(os.path.join(path, name))
+                       if job.endswith(".json")])
+            for name in STATES}
+
+
+def outputs(path):
+    """Files written by the finished jobs, for instance to build a cohort
+    with `cohort.update`, as the jobs finish on any node.
+
+    Parameters
+    ----------
+    path : str
+        Folder of the queue.
+
+    Returns
+    -------
+    filenames : list of str
+    """
+    done = os.path.join(path, "done")
+    result = []
+    for name in sorted(os.listdir(done)):
+        if name.endswith(".json"):
+            result.extend(_read(os.path.join(done, name))["outputs"])
+    return result
@@ -0,0 +1,221 @@
+from concurrent.futures import ProcessPoolExecutor
+import warnings
+import numpy as np
+from scipy import optimize
+
+
+def mono(t, a, k, c):
+    """Mono-exponential kinetics, a * exp(-k * t) + c"""
+    return a * np.exp(-k * t) + c
+
+
+def bi(t, a1, k1, a2, k2, c):
+    """Bi-exponential kinetics, a1 * exp(-k1 * t) + a2 * exp(-k2 * t) + c"""
+    return a1 * np.exp(-k1 * t) + a2 * np.exp(-k2 * t) + c
+
+
+def _mono_jacobian(t, a, k, c):
+    e = np.exp(-k * t)
+    return np.stack([e, -a * t * e, np.ones_like(e)], axis=-1)
+
+
+def _bi_jacobian(t, a1, k1, a2, k2, c):
+    e1 = np.exp(-k1 * t)
+    e2 = np.exp(-k2 * t)
+    return np.stack([e1, -a1 * t * e1, e2, -a2 * t * e2, np.ones_like(e1)],
+                    axis=-1)
+
+
+# Model, its jacobian, and the names of its parameters
+MODELS = {
+    "mono": (mono, _mono_jacobian, ("a", "k", "c")),
+    "bi": (bi, _bi_jacobian, ("a1", "k1", "a2", "k2", "c")),
+}
+
+
+def _evaluate(func, t, params):
+    """Model of every cell, for (cells, p) parameters"""
+    return func(t, *[params[:, [i]] for i in range(params.shape[1])])
+
+
+def _initial(values, t, model):
+    """Initial parameters of every cell, from a linear fit of the logarithm
+    of the series minus its last value"""
+    valid = ~np.isnan(values)
+    last = np.array([row[mask][-1] if mask.any() else np.nan
+                     for row, mask in zip(values, valid)])
+    first = np.array([row[mask][0] if mask.any() else np.nan
+                      for row, mask in zip(values, valid)])
+
+    # the plateau is extrapolated slightly beyond the last value, so that
+    # the logarithm is defined at the end of the series
+    amplitude = first - last
+    c = last - 0.05 * amplitude
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log = np.log((values - c[:, np.newaxis]) / amplitude[:, np.newaxis])
+    weights = valid & np.isfinite(log)
+    log = np.where(weights, log, 0)
+    tt = np.where(weights, t, 0)
+
+    # least squares slope of log(y - c) over t, for every cell
+    n = weights.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ((n * (tt * log).sum(axis=1) - tt.sum(axis=1) *
+                  log.sum(axis=1)) /
+                 (n * (tt**2).sum(axis=1) - tt.sum(axis=1)**2))
+    k = -slope
+    k = np.where(np.isfinite(k) & (k > 0), k, 1 / max(t[-1], 1))
+    amplitude = np.where(np.isfinite(amplitude), amplitude, 0)
+    c = np.where(np.isfinite(c), c, 0)
+
+    if model == "mono":
+        return np.stack([amplitude, k, c], axis=1)
+    return np.stack([amplitude / 2, 3 * k, amplitude / 2, k / 3, c], axis=1)
+
+
+def _curve_fit(arguments):
+    """Fit a single cell with `scipy.optimize.curve_fit`"""
+    model, t, values, p0 = arguments
+    func = MODELS[model][0]
+    valid = ~np.isnan(values)
+    try:
+        with warnings.catch_warnings():
+            # parameters whose covariance can not be estimated are rejected
+            warnings.simplefilter("error", optimize.OptimizeWarning)
+            params, _ = optimize.curve_fit(func, t[valid], values[valid],
+                                           p0=p0, maxfev=10000)
+    except (RuntimeError, ValueError, optimize.OptimizeWarning):
+        return None
+    return params
+
+
+def _r2(values, fitted):
+    """Coefficient of determination of every cell"""
+    residuals = np.nansum((values - fitted)**2, axis=1)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        total = np.nansum((values - np.nanmean(values, axis=1,
+                                               keepdims=True))**2, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 1 - residuals / total
+
+
+def fit(values, model="mono", time=None, max_iter=100, tol=1e-10,
+        workers=None):
+    """Fit a kinetics model to the time series of every cell at once.
+
+    The parameters of all the cells are refined together by a vectorized
+    Levenberg-Marquardt algorithm, starting from a linear fit of the
+    logarithm of the series. Cells that do not converge are fitted again
+    with `scipy.optimize.curve_fit`, in a pool of processes.
+
+    Parameters
+    ----------
+    values : (cells, time) array
+        Time series of every cell, for instance the `mean_norm` series of a
+        `cohort.CohortTable`. Missing values (nan) are ignored.
+
+    model : "mono" or "bi"
+        Mono- or bi-exponential model, see `MODELS`.
+
+    time : (time,) array, optional
+        Time of every point, 5 units apart by default as in `plot.PlotLines`.
+
+    max_iter : int, optional
+        Largest number of iterations.
+
+    tol : float, optional
+        Convergence threshold of the relative decrease of the residuals.
+
+    workers : int, optional
+        Number of processes of the fallback. The fallback is skipped when
+        `workers` is 0.
+
+    Returns
+    -------
+    results : dict
+        (cells, p) `params`, with their `names`, and `r2` and `converged` of
+        every cell. Cells that could not be fitted have nan parameters.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if model not in MODELS:
+        raise ValueError(f"Unknown model '{model}'")
+    func, jacobian, names = MODELS[model]
+
+    n_cells, n_frames = values.shape
+    t = np.arange(n_frames) * 5.0 if time is None else np.asarray(time, float)
+
+    valid = ~np.isnan(values)
+    weights = valid.astype(np.float64)
+    observed = np.where(valid, values, 0)
+
+    params = _initial(values, t, model)
+    damping = np.full(n_cells, 1e-3)
+    converged = np.zeros(n_cells, dtype=bool)
+    # cells with fewer points than parameters can not be fitted
+    active = valid.sum(axis=1) > len(names)
+
+    with np.errstate(over='ignore', invalid='ignore'):
+        residuals = (observed - _evaluate(func, t, params)) * weights
+        cost = (residuals**2).sum(axis=1)
+
+        for _ in range(max_iter):
+            if not active.any():
+                break
+
+            jac = _evaluate(jacobian, t, params) * weights[..., np.newaxis]
+            hessian = np.einsum("ctp,ctq->cpq", jac, jac)
+            gradient = np.einsum("ctp,ct->cp", jac, residuals)
+
+            diagonal = np.einsum("cpp->cp", hessian)
+            system = hessian + (damping[:, np.newaxis] * diagonal +
+                                1e-12)[..., np.newaxis] * np.eye(len(names))
+            system[~np.isfinite(system)] = 0
+            gradient[~np.isfinite(gradient)] = 0
+            step = np.linalg.solve(system, gradient[..., np.newaxis])[..., 0]
+
+            candidate = params + step
+            new_residuals = ((observed - _evaluate(func, t, candidate)) *
+                             weights)
+            new_cost = (new_residuals**2).sum(axis=1)
+
+            improved = active & np.isfinite(new_cost) & (new_cost < cost)
+            done = improved & (cost - new_cost <= tol * cost)
+            # no improvement with a negligible step is also convergence
+            done |= active & ~improved & (
+                np.abs(step) <= tol * (np.abs(params) + tol)).all(axis=1)
+
+            params[improved] = candidate[improved]
+            residuals[improved] = new_residuals[improved]
+            cost[improved] = new_cost[improved]
+
+            damping = np.where(improved, damping / 10, damping * 10)
+            converged |= done
+            active &= ~done & (damping < 1e12)
+
+        fitted = _evaluate(func, t, params)
+    r2 = _r2(values, fitted)
+
+    retry = np.flatnonzero(~converged & (valid.sum(axis=1) > len(names)))
+    if len(retry) and workers != 0:
+        arguments = [(model, t, values[cell], params[cell]) for cell in retry]
+        with ProcessPoolExecutor(workers) as executor:
+            refits = list(executor.map(_curve_fit, arguments))
+
+        for cell, refit in zip(retry, refits):
+            if refit is None:
+                continue
+            refit_r2 = _r2(values[[cell]], func(t, *refit)[np.newaxis])[0]
+            if not np.isfinite(r2[cell]) or refit_r2 >= r2[cell]:
+                params[cell] = refit
+                r2[cell] = refit_r2
+            converged[cell] = True
+
+    unfitted = valid.sum(axis=1) <= len(names)
+    params[unfitted] = np.nan
+    r2[unfitted] = np.nan
+
+    return {"params": params,
+            "names": names,
+            "r2": r2,
+            "converged": converged}
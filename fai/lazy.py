@@ -0,0 +1,285 @@
+from collections import namedtuple
+from dataclasses import dataclass
+import numpy as np
+from fai import compute, data, files, interact, segment
+
+
+# A stage of the pipeline: the fields it produces, the upstream fields and
+# metadata parameters it depends on, and the function that computes it.
+# `run` takes the dataclass and returns a dict with the produced fields.
+Stage = namedtuple("Stage", ["produces", "requires", "params", "run"])
+
+
+def _channels(dataclass):
+    scratch = data.AnisotropyData(filename=dataclass.filename,
+                                  raw_data=dataclass.raw_data,
+                                  metadata=dataclass.metadata)
+    segment.separate_channels(scratch)
+    return {"parallel": scratch.parallel,
+            "perpendicular": scratch.perpendicular}
+
+
+def _roi(dataclass):
+    coords = dataclass.metadata["coords"]
+    return {"parallel_roi": interact.create_rectangular_mask(
+                dataclass.parallel, *coords),
+            "perpendicular_roi": interact.create_rectangular_mask(
+                dataclass.perpendicular, *coords)}
+
+
+def _registration(dataclass):
+    # SimpleElastix is compiled separately, and is only needed once the
+    # registered channel is requested.
+    from fai import transform
+
+    scratch = data.AnisotropyData(
+        filename=dataclass.filename,
+        raw_data=None,
+        metadata=dataclass.metadata,
+        parallel_roi=dataclass.parallel_roi,
+        perpendicular_roi=dataclass.perpendicular_roi)
+    transform.register(scratch)
+    return {"perpendicular_roi_reg": scratch.perpendicular_roi_reg}
+
+
+def _segmentation(dataclass):
+    scratch = data.AnisotropyData(
+        filename=dataclass.filename,
+        raw_data=None,
+        metadata=dataclass.metadata,
+        parallel_roi=dataclass.parallel_roi,
+        perpendicular_roi_reg=dataclass.perpendicular_roi_reg)
+    segment.nuclei(scratch)
+    return {"mask_roi": scratch.mask_roi,
+            "mask_roi_cropped": scratch.mask_roi_cropped,
+            "parallel_roi_cropped": scratch.parallel_roi_cropped,
+            "perpendicular_roi_reg_cropped":
+                scratch.perpendicular_roi_reg_cropped}
+
+
+def _anisotropy_raw(dataclass):
+    metadata = dataclass.metadata
+    amap = compute._calculate_anisotropy(
+        dataclass.mask_roi_cropped,
+        dataclass.parallel_roi_cropped,
+        dataclass.perpendicular_roi_reg_cropped,
+        metadata["g_factor"], compute._binned_bg(dataclass, metadata["bg"]))
+    return {"anisotropy_raw": compute._pad(amap)}
+
+
+def _anisotropy_round(dataclass):
+    return {"anisotropy_round": compute._discretize(dataclass.anisotropy_raw)}
+
+
+def _anisotropy_round_median(dataclass):
+    return {"anisotropy_round_median":
+            compute._median_filter(dataclass.anisotropy_round)}
+
+
+def _stats(dataclass):
+    scratch = data.AnisotropyData(filename=dataclass.filename,
+                                  raw_data=None,
+                                  metadata=dataclass.metadata)
+    compute._update_stats(scratch, dataclass.anisotropy_round_median)
+    return {field: getattr(scratch, field)
+            for field in STAGES["stats"].produces}
+
+
+STAGES = {
+    "channels": Stage(("parallel", "perpendicular"),
+                      ("raw_data",), (), _channels),
+    "roi": Stage(("parallel_roi", "perpendicular_roi"),
+                 ("parallel", "perpendicular"), ("coords",), _roi),
+    "registration": Stage(("perpendicular_roi_reg",),
+                          ("parallel_roi", "perpendicular_roi"), (),
+                          _registration),
+    "segmentation": Stage(("mask_roi", "mask_roi_cropped",
+                           "parallel_roi_cropped",
+                           "perpendicular_roi_reg_cropped"),
+                          ("parallel_roi", "perpendicular_roi_reg"), (),
+                          _segmentation),
+    "anisotropy_raw": Stage(("anisotropy_raw",),
+                            ("mask_roi_cropped", "parallel_roi_cropped",
+                             "perpendicular_roi_reg_cropped"),
+                            ("g_factor", "bg"), _anisotropy_raw),
+    "anisotropy_round": Stage(("anisotropy_round",), ("anisotropy_raw",),
+                              (), _anisotropy_round),
+    "anisotropy_round_median": Stage(("anisotropy_round_median",),
+                                     ("anisotropy_round",), (),
+                                     _anisotropy_round_median),
+    "stats": Stage(("mean", "median", "mean_norm", "median_norm",
+                    "mean_delta", "median_delta"),
+                   ("anisotropy_round_median",), (), _stats),
+}
+
+# field -> name of the stage that produces it
+PRODUCERS = {field: name
+             for name, stage in STAGES.items() for field in stage.produces}
+
+# Fields that are kept when releasing memory, unless asked otherwise.
+FINAL = ("anisotropy_round_median",) + STAGES["stats"].produces
+
+
+def downstream(fields):
+    """Stages that depend, directly or indirectly, on the given fields or
+    metadata parameters.
+
+    Parameters
+    ----------
+    fields : iterable of str
+        Field names or metadata parameter names
+
+    Returns
+    -------
+    stages : list of str
+        Names of the dependent stages, in pipeline order
+    """
+    changed = set(fields)
+    stages = []
+    for name, stage in STAGES.items():
+        if changed.intersection(stage.requires + stage.params):
+            stages.append(name)
+            changed.update(stage.produces)
+    return stages
+
+
+@dataclass(repr=False, eq=False)
+class LazyAnisotropyData(data.AnisotropyData):
+    """AnisotropyData whose fields are computed when first accessed.
+
+    Every field produced by the pipeline is computed from its upstream
+    fields, as declared in `STAGES`, the first time it is read. The
+    parameters of the pipeline (`coords`, `g_factor` and `bg`) are read from
+    `metadata`, and are changed with `set_params`, which only invalidates the
+    fields downstream of the changed parameters. Assigning a new array to a
+    field invalidates the fields that depend on it, whereas assigning `None`
+    releases the field, to be recomputed when needed.
+
+    If `memory_budget` (in bytes) is set, intermediate fields are released
+    after every stage until the arrays fit in the budget.
+    """
+    memory_budget: int = None
+
+    # compared by identity, as comparing the fields would compute them
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        # the fields are read without computing them
+        fields = vars(self)
+        computed = [field for field in PRODUCERS
+                    if fields.get(field) is not None]
+        return (f"{type(self).__name__}(filename={fields['filename']!r}, "
+                f"computed={computed})")
+
+    def __getattribute__(self, name):
+        value = object.__getattribute__(self, name)
+        if value is None and name in PRODUCERS:
+            object.__getattribute__(self, "_compute")(PRODUCERS[name])
+            value = object.__getattribute__(self, name)
+        return value
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if value is not None and (name in PRODUCERS or name == "raw_data"):
+            self._invalidate(downstream([name]))
+
+    def set_params(self, **params):
+        """Update the pipeline parameters in `metadata`, and invalidate the
+        fields that depend on the parameters that changed.
+
+        Parameters
+        ----------
+        params : keyword arguments
+            For instance `g_factor`, `bg` or `coords`.
+
+        Returns
+        -------
+        None
+        """
+        metadata = self.metadata
+        # parameters such as `coords` can be arrays
+        changed = [key for key, value in params.items()
+                   if key not in metadata or
+                   not np.array_equal(metadata[key], value)]
+        metadata.update(params)
+        self._invalidate(downstream(changed))
+        return
+
+    def release(self, budget=0, keep=FINAL):
+        """Release intermediate fields, largest first, until the arrays fit in
+        the given budget. Released fields are recomputed when accessed.
+
+        Parameters
+        ----------
+        budget : int
+            Memory budget in bytes.
+
+        keep : iterable of str
+            Fields that are never released.
+
+        Returns
+        -------
+        None
+        """
+        candidates = [field for field in PRODUCERS
+                      if field not in keep
+                      and vars(self)[field] is not None
+                      and hasattr(vars(self)[field], "nbytes")]
+        candidates.sort(key=lambda field: vars(self)[field].nbytes,
+                        reverse=True)
+
+        for field in candidates:
+            if data.nbytes(self) <= budget:
+                break
+            object.__setattr__(self, field, None)
+        return
+
+    def _invalidate(self, stages):
+        for name in stages:
+            for field in STAGES[name].produces:
+                object.__setattr__(self, field, None)
+
+    def _compute(self, name):
+        stage = STAGES[name]
+
+        for param in stage.params:
+            if param not in self.metadata:
+                raise ValueError(f"'{param}' has to be set in metadata to "
+                                 f"compute {', '.join(stage.produces)}")
+
+        for field in stage.requires:
+            if getattr(self, field) is None:
+                raise ValueError(f"'{field}' is required to compute "
+                                 f"{', '.join(stage.produces)}")
+
+        for field, value in stage.run(self).items():
+            object.__setattr__(self, field, value)
+
+        if self.memory_budget is not None:
+            self.release(self.memory_budget,
+                         keep=FINAL + stage.produces + stage.requires)
+
+
+def imread(filename, **params):
+    """Read an image as a lazily evaluated dataclass.
+
+    Parameters
+    ----------
+    filename : str
+        Image file that has to be opened.
+
+    params : keyword arguments
+        Pipeline parameters stored in `metadata`, for instance `coords`,
+        `g_factor` and `bg`.
+
+    Returns
+    -------
+    dataclass : LazyAnisotropyData
+    """
+    raw = files.imread(filename)
+    dataclass = LazyAnisotropyData(filename=raw.filename,
+                                   raw_data=raw.raw_data,
+                                   metadata=raw.metadata)
+    dataclass.set_params(**params)
+    return dataclass
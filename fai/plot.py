@@ -1,4 +1,4 @@
-from fai import stats, files
+from fai import cohort, files
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib
@@ -7,38 +7,22 @@ matplotlib.rc('savefig', dpi=300, bbox="tight", pad_inches=0)
 matplotlib.rc('font', size=20)
 
 
-def data_for_all_plots(list_of_dataclass):
-    n_mean = []
-    n_delta_mean = []
-    n_norm_mean = []
-
-    n_ks = []
-    n_std = []
+# Series of the cohort table, and their labels
+LABELS = {
+    "mean": ["Mean Anisotropy", "mean"],
+    "delta": [r"$\Delta$ Anisotropy", "mean_delta"],
+    "norm": [r"$r_t/r_0$", "mean_norm"],
+    "ks": ["KS (0, t)", "ks"],
+    "sd": ["SD Anisotropy", "sd"],
+}
 
-    for dataclass in list_of_dataclass:
-        if len(dataclass.mean) != 27:
-            continue
-        n_mean.append(dataclass.mean)
-        n_delta_mean.append(dataclass.mean_delta)
-        n_norm_mean.append(dataclass.mean_norm)
 
-        amaps = dataclass.anisotropy_round_median
-
-        ks_ = []
-        std_ = []
-        for amap in amaps:
-            ks_.append(stats.ks(amaps[0], amap)[0])
-            std_.append(stats.std(amap))
-        n_ks.append(ks_)
-        n_std.append(std_)
+def data_for_all_plots(list_of_dataclass):
+    table = cohort.build(list_of_dataclass)
 
-    data = {
-        "mean": ["Mean Anisotropy", n_mean],
-        "delta": [r"$\Delta$ Anisotropy", n_delta_mean],
-        "norm": [r"$r_t/r_0$", n_norm_mean],
-        "ks": ["KS (0, t)", n_ks],
-        "sd": ["SD Anisotropy", n_std],
-    }
+    # time series of different lengths are padded with nan
+    data = {savename: [ylabel, table.series[series]]
+            for savename, (ylabel, series) in LABELS.items()}
 
     return data
 
@@ -50,7 +34,7 @@ class PlotLines:
         self.ax.set_ylabel(ylabel)
         self.ax.set_xticks([0, 60, 120])
         self.list_of_means = list_of_means
-        self.time = np.arange(27) * 5
+        self.time = np.arange(np.shape(list_of_means)[1]) * 5
 
     def scatter_plot(self):
         starting_num = self.list_of_means[0][0]
@@ -62,8 +46,9 @@ class PlotLines:
         return self.ax
 
     def average_plot(self):
-        mean_value = stats.mean(self.list_of_means, without_zero=False, axis=0)
-        error_value = stats.sem(self.list_of_means, without_zero=False, axis=0)
+        aggregated = cohort.aggregate(self.list_of_means)
+        mean_value = aggregated["mean"][0]
+        error_value = aggregated["sem"][0]
         self.ax.errorbar(self.time, mean_value, yerr=error_value, capthick=2)
         self.ax.axhline(mean_value[0], c="k", linewidth=1, linestyle="--")
         return self.ax
@@ -1,3 +1,4 @@
+import numpy as np
 import scipy.ndimage as ndi
 from skimage import filters, segmentation, morphology
 
@@ -102,3 +103,32 @@ def fill_holes(image, **kwds):
 
     """
     return ndi.binary_fill_holes(image, **kwds)
+
+
+def bin_pixels(images, factor):
+    """Sum the intensity of blocks of factor x factor pixels.
+
+    Parameters
+    ----------
+    images : (..., N, M) array
+        Input images. Rows and columns beyond a multiple of `factor` are
+        left out.
+
+    factor : int
+        Size of the blocks.
+
+    Returns
+    -------
+    images : (..., N // factor, M // factor) array
+        Binned images. Integer images are summed in 32 bits, so that the sums
+        do not overflow.
+    """
+    *shape, n, m = images.shape
+    n, m = n // factor, m // factor
+    blocks = images[..., :n * factor, :m * factor].reshape(
+        *shape, n, factor, m, factor)
+
+    kind = images.dtype.kind
+    dtype = {"u": np.uint32, "i": np.int32, "b": np.uint32}.get(kind,
+                                                               images.dtype)
+    return blocks.sum(axis=(-3, -1), dtype=dtype)
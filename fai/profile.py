@@ -0,0 +1,260 @@
+import functools
+import json
+import os
+import time
+import numpy as np
+from fai import data
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is not recorded
+    resource = None
+
+
+# profiling is disabled by default, and can be enabled for a whole run by
+# setting the FAI_PROFILE environment variable
+_state = {"enabled": bool(os.environ.get("FAI_PROFILE")),
+          "trace": os.environ.get("FAI_PROFILE_TRACE")}
+
+# dataclasses of the stages that are running, innermost last
+_active = []
+
+
+def enable(trace=None):
+    """Record the time and memory used by every stage of the pipeline.
+
+    Parameters
+    ----------
+    trace : str, optional
+        JSON-lines file to which every record is appended, in addition to
+        `metadata["profile"]` of the dataclass.
+
+    Returns
+    -------
+    None
+    """
+    _state.update({"enabled": True, "trace": trace})
+    return
+
+
+def disable():
+    """Stop recording the stages of the pipeline.
+
+    Returns
+    -------
+    None
+    """
+    _state.update({"enabled": False, "trace": None})
+    return
+
+
+def _maxrss():
+    """Peak resident set size of the process, in bytes"""
+    if resource is None:
+        return 0
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _nbytes(values):
+    """Size of the arrays, and the arrays of the dataclasses, in bytes"""
+    size = 0
+    for value in values:
+        if isinstance(value, np.ndarray):
+            size += value.nbytes
+        elif isinstance(value, data.AnisotropyData):
+            size += data.nbytes(value)
+    return size
+
+
+def _dataclass(values):
+    """First AnisotropyData dataclass among the values, if any"""
+    for value in values:
+        if isinstance(value, data.AnisotropyData):
+            return value
+    return None
+
+
+class stage:
+    """Context manager that records the time and memory used by a stage of
+    the pipeline.
+
+    The record is appended to `metadata["profile"]` of the dataclass. Stages
+    that are run inside another stage without a dataclass of their own,
+    such as `segment.nuclei_mask` in `segment.nuclei`, are recorded in the
+    dataclass of the enclosing stage.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+
+    dataclass : AnisotropyData dataclass, optional
+
+    inputs : list, optional
+        Arguments of the stage, whose arrays are measured.
+
+    Examples
+    --------
+    >>> with profile.stage("registration", dataclass):
+    ...     transform.register(dataclass)
+    """
+
+    def __init__(self, name, dataclass=None, inputs=()):
+        self.name = name
+        self.dataclass = dataclass
+        self.inputs = inputs
+        self.outputs = ()
+
+    def __enter__(self):
+        if not _state["enabled"]:
+            return self
+
+        if self.dataclass is None and _active:
+            self.dataclass = _active[-1]
+        _active.append(self.dataclass)
+
+        self.depth = len(_active) - 1
+        self.input_nbytes = _nbytes(self.inputs)
+        self.maxrss = _maxrss()
+        self.cpu = time.process_time()
+        self.wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if not _state["enabled"] or not hasattr(self, "wall"):
+            return False
+
+        record = {"stage": self.name,
+                  "depth": self.depth,
+                  "wall": time.perf_counter() - self.wall,
+                  "cpu": time.process_time() - self.cpu,
+                  # ru_maxrss is the peak of the whole process, and only
+                  # grows when the stage needs more memory than before
+                  "maxrss_delta": _maxrss() - self.maxrss,
+                  "input_nbytes": self.input_nbytes,
+                  "output_nbytes": _nbytes(self.outputs)}
+        _active.pop()
+
+        dataclass = self.dataclass
+        if dataclass is None:
+            # e.g. files.imread, which creates the dataclass
+            dataclass = _dataclass(self.outputs)
+
+        if dataclass is not None:
+            record["filename"] = dataclass.filename
+            if dataclass.metadata is None:
+                dataclass.metadata = {}
+            dataclass.metadata.setdefault("profile", []).append(record)
+
+        if _state["trace"] is not None:
+            with open(_state["trace"], "a") as trace:
+                trace.write(json.dumps(record) + "\n")
+        return False
+
+
+def profiled(func):
+    """Decorator that records every call of a function of the pipeline as a
+    `stage`, when profiling is enabled.
+
+    Parameters
+    ----------
+    func : function
+
+    Returns
+    -------
+    wrapper : function
+    """
+    name = func.__module__.rsplit(".", 1)[-1] + "." + func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwds):
+        if not _state["enabled"]:
+            return func(*args, **kwds)
+
+        values = args + tuple(kwds.values())
+        with stage(name, _dataclass(values), values) as record:
+            result = func(*args, **kwds)
+            record.outputs = (result,)
+        return result
+    return wrapper
+
+
+def read_trace(filename):
+    """Read the records of a JSON-lines trace.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    records : list of dict
+    """
+    with open(filename) as trace:
+        return [json.loads(line) for line in trace if line.strip()]
+
+
+def summary(batch):
+    """Aggregate the records of the stages across a batch.
+
+    Parameters
+    ----------
+    batch : list of AnisotropyData dataclass or list of dict
+        Dataclasses with `metadata["profile"]`, or records read with
+        `read_trace`.
+
+    Returns
+    -------
+    summary : dict
+        `calls`, `wall`, `cpu` in total, `mean_wall`, `max_wall`, and largest
+        `maxrss_delta` and `input_nbytes` of every stage, slowest first.
+    """
+    records = []
+    for item in batch:
+        if isinstance(item, dict):
+            records.append(item)
+        else:
+            records.extend((item.metadata or {}).get("profile", []))
+
+    stages = {}
+    for record in records:
+        entry = stages.setdefault(record["stage"],
+                                  {"calls": 0, "wall": 0.0, "cpu": 0.0,
+                                   "max_wall": 0.0, "maxrss_delta": 0,
+                                   "input_nbytes": 0})
+        entry["calls"] += 1
+        entry["wall"] += record["wall"]
+        entry["cpu"] += record["cpu"]
+        entry["max_wall"] = max(entry["max_wall"], record["wall"])
+        entry["maxrss_delta"] = max(entry["maxrss_delta"],
+                                    record["maxrss_delta"])
+        entry["input_nbytes"] = max(entry["input_nbytes"],
+                                    record["input_nbytes"])
+
+    for entry in stages.values():
+        entry["mean_wall"] = entry["wall"] / entry["calls"]
+
+    return dict(sorted(stages.items(), key=lambda item: -item[1]["wall"]))
+
+
+def report(summary_):
+    """Print the summary of a batch as a table.
+
+    Parameters
+    ----------
+    summary_ : dict
+        Summary returned by `summary`.
+
+    Returns
+    -------
+    None
+    """
+    print(f"{'stage':<28}{'calls':>7}{'wall (s)':>11}{'mean (s)':>11}"
+          f"{'max (s)':>10}{'cpu (s)':>10}{'rss (MB)':>10}")
+    for name, entry in summary_.items():
+        print(f"{name:<28}{entry['calls']:>7}{entry['wall']:>11.3f}"
+              f"{entry['mean_wall']:>11.3f}{entry['max_wall']:>10.3f}"
+              f"{entry['cpu']:>10.3f}{entry['maxrss_delta'] / 1e6:>10.1f}")
+    return
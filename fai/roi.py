@@ -0,0 +1,217 @@
+import csv
+import json
+import os
+import numpy as np
+
+
+# Columns of the csv files with region of interest specifications.
+# Rectangles are described by the corners (x1, y1) and (x2, y2); circles by
+# their center (x1, y1) and radius, in every frame.
+CSV_COLUMNS = ["roi", "shape", "frame", "x1", "y1", "x2", "y2", "radius"]
+
+
+def rectangle(coords):
+    """Specification of a rectangular region of interest.
+
+    Parameters
+    ----------
+    coords : list
+        `[click, release]` coordinates returned by `interact.roi_rectangle`.
+
+    Returns
+    -------
+    spec : dict
+    """
+    click, release = coords
+    return {"shape": "rectangle",
+            "coords": [[int(_) for _ in click], [int(_) for _ in release]]}
+
+
+def circle(centers, radius):
+    """Specification of a circular region of interest.
+
+    Parameters
+    ----------
+    centers : (S, 2) array
+        x, y coordinates of the center of the region in every frame, as
+        returned by `interact.roi_circle`.
+
+    radius : int
+        Radius of the region.
+
+    Returns
+    -------
+    spec : dict
+    """
+    return {"shape": "circle",
+            "centers": np.asarray(centers, dtype=float).tolist(),
+            "radius": radius}
+
+
+def scale(spec, factor):
+    """Region of interest in the coordinates of images scaled by a factor,
+    for instance binned images (factor 1 / k) or the full resolution images
+    of binned ones (factor k).
+
+    Parameters
+    ----------
+    spec : dict
+        Specification returned by `rectangle` or `circle`.
+
+    factor : float
+
+    Returns
+    -------
+    spec : dict
+    """
+    if factor == 1:
+        return spec
+    if spec["shape"] == "circle":
+        return circle(np.asarray(spec["centers"]) * factor,
+                      spec["radius"] * factor)
+    return rectangle(np.floor(np.asarray(spec["coords"]) * factor))
+
+
+def spec_filename(filename):
+    """Name of the region of interest file of an acquisition.
+
+    Parameters
+    ----------
+    filename : str
+        Image file of the acquisition.
+
+    Returns
+    -------
+    spec_filename : str
+    """
+    return os.path.splitext(filename)[0] + ".roi.json"
+
+
+def write(specs, filename):
+    """Write region of interest specifications to a json or csv file.
+
+    Parameters
+    ----------
+    specs : list of dict
+        Specifications returned by `rectangle` or `circle`.
+
+    filename : str
+        File ending with `.csv` is written as csv, otherwise as json.
+
+    Returns
+    -------
+    None
+    """
+    if not filename.endswith(".csv"):
+        with open(filename, "w") as file:
+            json.dump(specs, file, indent=1)
+        return
+
+    with open(filename, "w", newline="") as csvfile:
+        wr = csv.writer(csvfile)
+        wr.writerow(CSV_COLUMNS)
+        for number, spec in enumerate(specs):
+            if spec["shape"] == "rectangle":
+                (x1, y1), (x2, y2) = spec["coords"]
+                wr.writerow([number, "rectangle", "", x1, y1, x2, y2, ""])
+            else:
+                for frame, (x, y) in enumerate(spec["centers"]):
+                    wr.writerow([number, "circle", frame, x, y, "", "",
+                                 spec["radius"]])
+    return
+
+
+def read(filename):
+    """Read region of interest specifications from a json or csv file.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    specs : list of dict
+    """
+    if not filename.endswith(".csv"):
+        with open(filename) as file:
+            return json.load(file)
+
+    specs = {}
+    with open(filename, newline="") as csvfile:
+        for row in csv.DictReader(csvfile):
+            number = int(row["roi"])
+            if row["shape"] == "rectangle":
+                specs[number] = rectangle(
+                    [[row["x1"], row["y1"]], [row["x2"], row["y2"]]])
+            else:
+                spec = specs.setdefault(number,
+                                        circle([], float(row["radius"])))
+                spec["centers"].append([float(row["x1"]), float(row["y1"])])
+    return [specs[number] for number in sorted(specs)]
+
+
+def write_catalog(catalog, filename):
+    """Write the region of interest specifications of many acquisitions to a
+    single json file.
+
+    Parameters
+    ----------
+    catalog : dict
+        Image file of every acquisition mapped to its list of specifications.
+
+    filename : str
+
+    Returns
+    -------
+    None
+    """
+    with open(filename, "w") as file:
+        json.dump(catalog, file, indent=1)
+    return
+
+
+def read_catalog(filename):
+    """Read a catalog written by `write_catalog`.
+
+    Parameters
+    ----------
+    filename : str
+
+    Returns
+    -------
+    catalog : dict
+    """
+    with open(filename) as file:
+        return json.load(file)
+
+
+def lookup(filename, catalog=None):
+    """Find the region of interest specifications of an acquisition, either
+    in a catalog or in the file returned by `spec_filename`.
+
+    Parameters
+    ----------
+    filename : str
+        Image file of the acquisition.
+
+    catalog : dict, optional
+        Catalog read by `read_catalog`. Acquisitions are matched by their full
+        path, or else by their file name.
+
+    Returns
+    -------
+    specs : list of dict
+        Empty if no specification is found.
+    """
+    if catalog is not None:
+        if filename in catalog:
+            return catalog[filename]
+        basename = os.path.basename(filename)
+        for key, specs in catalog.items():
+            if os.path.basename(key) == basename:
+                return specs
+        return []
+
+    if os.path.isfile(spec_filename(filename)):
+        return read(spec_filename(filename))
+    return []
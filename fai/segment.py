@@ -1,20 +1,57 @@
-from fai import interact, process, util
+from fai import calibration, data, interact, process, profile, roi, util
 import numpy as np
 import scipy.ndimage as ndi
 
 
-def separate_channels(dataclass):
+# Channels separated from the raw data, for both fluorophores
+CHANNELS = ["parallel", "perpendicular",
+            "secondary_parallel", "secondary_perpendicular"]
+
+# Registered regions of interest, and their crops around the nucleus
+CROPPED = {"parallel_roi": "parallel_roi_cropped",
+           "perpendicular_roi_reg": "perpendicular_roi_reg_cropped",
+           "secondary_parallel_roi": "secondary_parallel_roi_cropped",
+           "secondary_perpendicular_roi_reg":
+               "secondary_perpendicular_roi_reg_cropped"}
+
+
+@profile.profiled
+def separate_channels(dataclass, keep="all", binning=None, split=None):
     """Separate the parallel and perpendicular channels of the image.
 
     Parameters
     ----------
     dataclass : AnisotropyData dataclass
-        Image stored in the `raw_data` attribute.
+        Image stored in the `raw_data` attribute, and `secondary_raw_data`
+        when multiplexing.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    binning : int, optional
+        Sum the intensity of blocks of binning x binning pixels of the
+        channels, see `process.bin_pixels`, for fast analysis of dim samples.
+        Defaults to `metadata["binning"]`, so that the later stages that
+        separate the channels again bin them the same way. The regions of
+        interest, the segmentation and the background are scaled
+        accordingly by the later stages.
+
+    split : dict or str, optional
+        Channel split profile of the instrument, see
+        `calibration.estimate_split`, or the name of the instrument whose
+        profile is read with `calibration.load_split`. Defaults to
+        `metadata["split"]`, or to the profile of `metadata["instrument"]`.
+        Without a profile, the sensor is split at its middle and the
+        channels are only roughly aligned, leaving a larger misalignment to
+        `transform.register`.
 
     Returns
     -------
     dataclass : AnisotropyData dataclass
-        Channels are stored in the `parallel` and `perpendicular` attributes.
+        Channels are stored in the `parallel` and `perpendicular` attributes,
+        and in `secondary_parallel` and `secondary_perpendicular` when
+        multiplexing.
 
     """
     image = dataclass.raw_data
@@ -22,24 +59,51 @@ def separate_channels(dataclass):
     if image.ndim is not 3:
         raise("Not a 3D image")
 
-    z, x, y = image.shape
-    midpoint = int(x / 2)
-
-    diff = 50  # workaround to get roughly aligned parallel channel
-
-    perpendicular = image[:, :midpoint, ]
-    parallel = image[:, midpoint - diff:, ]
-
-    dataclass.parallel = parallel
-    dataclass.perpendicular = perpendicular
-
     metadata = dataclass.metadata
-    metadata.update({"midpoint": midpoint, "diff": diff})
+    if split is None:
+        split = metadata.get("split", metadata.get("instrument"))
+    if isinstance(split, str):
+        split = calibration.load_split(split)
 
+    z, x, y = image.shape
+    if split is None:
+        midpoint = int(x / 2)
+        diff = 50  # workaround to get roughly aligned parallel channel
+        shift = 0
+    else:
+        midpoint = split["split"]
+        diff, shift = split["offset"]
+
+    dataclass.perpendicular, dataclass.parallel = \
+        calibration.split_channels(image, midpoint, diff, shift)
+
+    # The second fluorophore is imaged through the same splitter
+    secondary = dataclass.secondary_raw_data
+    if secondary is not None:
+        dataclass.secondary_perpendicular, dataclass.secondary_parallel = \
+            calibration.split_channels(secondary, midpoint, diff, shift)
+
+    if binning is None:
+        binning = metadata.get("binning", 1)
+
+    if binning > 1:
+        for channel in CHANNELS:
+            image = getattr(dataclass, channel)
+            if image is not None:
+                setattr(dataclass, channel,
+                        process.bin_pixels(image, binning))
+
+    metadata.update({"midpoint": midpoint, "diff": diff, "shift": shift,
+                     "binning": binning})
+    if split is not None:
+        metadata.update({"split": split})
+
+    data.retain(dataclass, ["raw_data", "secondary_raw_data"], keep)
     return dataclass
 
 
-def define_roi(dataclass):
+def define_roi(dataclass, keep="all", shape="rectangle", radius=10,
+               roi_file=None):
     """Interactively define the region of interest to crop a smaller region
     from the field of view. This is useful to semi-automatically segment
     nucleus from the field when automatic segmentation results in sub-optimal
@@ -50,6 +114,21 @@ def define_roi(dataclass):
     dataclass : AnisotropyData dataclass
         Channels stored in the `parallel` and `perpendicular` attribute.
 
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    shape : "rectangle" or "circle", optional
+        Draw the region with `interact.roi_rectangle` or `interact.roi_circle`.
+
+    radius : int, optional
+        Radius of the circular region, in pixels of the full resolution
+        images.
+
+    roi_file : str, optional
+        File to save the region to, to be replayed later with `apply_roi` or
+        `replay_roi`. See `roi.write`.
+
     Returns
     -------
     dataclass : AnisotropyData dataclass.
@@ -57,24 +136,240 @@ def define_roi(dataclass):
         `perpendicular_roi` attributes.
 
     """
-    separate_channels(dataclass)
+    separate_channels(dataclass, keep)
     img_parallel = dataclass.parallel
-    image_perpendicular = dataclass.perpendicular
 
-    roi_parallel, coords = interact.roi_rectangle(img_parallel)
-    roi_perpendicular = interact.create_rectangular_mask(
-        image_perpendicular, *coords)
+    binning = dataclass.metadata["binning"]
 
-    dataclass.parallel_roi = roi_parallel
-    dataclass.perpendicular_roi = roi_perpendicular
+    if shape == "circle":
+        # the radius is drawn in whole pixels of the binned channel
+        radius = max(radius // binning, 1)
+        centers = interact.roi_circle(img_parallel, radius)[1]
+        if centers is None:
+            raise ValueError("No region of interest was selected.")
+        spec = roi.circle(centers, radius)
+    else:
+        coords = interact.roi_rectangle(img_parallel)[1]
+        spec = roi.rectangle(coords)
+
+    # regions are saved in the coordinates of the full resolution images
+    spec = roi.scale(spec, binning)
+
+    if roi_file is not None:
+        roi.write([spec], roi_file)
+
+    _crop_roi(dataclass, spec)
+
+    data.retain(dataclass, CHANNELS, keep)
+    return dataclass
 
-    metadata = dataclass.metadata
-    metadata.update({"coords": coords})
 
+@profile.profiled
+def apply_roi(dataclass, spec, keep="all"):
+    """Crop the region of interest from a saved specification, without any
+    interaction.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        Image stored in the `raw_data` attribute.
+
+    spec : dict
+        Rectangular or circular region, see `roi.rectangle` and `roi.circle`.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    Returns
+    -------
+    dataclass : AnisotropyData dataclass.
+        Segmented regions are stored in the `parallel_roi` and
+        `perpendicular_roi` attributes.
+    """
+    separate_channels(dataclass, keep)
+    _crop_roi(dataclass, spec)
+
+    data.retain(dataclass, CHANNELS, keep)
     return dataclass
 
 
-def identify_nucleus(image):
+def replay_roi(dataclass, specs=None, catalog=None, keep="all"):
+    """Crop every saved region of interest of an acquisition, without any
+    interaction.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        Image stored in the `raw_data` attribute.
+
+    specs : list of dict, optional
+        Regions to crop. By default, they are looked up for the file of the
+        dataclass with `roi.lookup`.
+
+    catalog : dict, optional
+        Catalog of regions, read by `roi.read_catalog`.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    Returns
+    -------
+    rois : list of AnisotropyData dataclass
+        One dataclass for every region, see `auto_roi`.
+    """
+    if specs is None:
+        specs = roi.lookup(dataclass.filename, catalog)
+
+    separate_channels(dataclass, keep)
+
+    rois = [_roi_dataclass(dataclass, spec, number, keep)
+            for number, spec in enumerate(specs)]
+
+    data.retain(dataclass, CHANNELS, keep)
+    return rois
+
+
+def _crop_roi(dataclass, spec):
+    """Store the region of interest described by `spec`, in the coordinates
+    of the full resolution images, in the dataclass"""
+    metadata = dataclass.metadata
+
+    # the coordinates of the binned channels are stored in the metadata
+    spec = roi.scale(spec, 1 / metadata.get("binning", 1))
+
+    if spec["shape"] == "circle":
+        centers, radius = spec["centers"], spec["radius"]
+        metadata.update({"centers": centers, "radius": radius})
+    else:
+        coords = spec["coords"]
+        metadata.update({"coords": coords})
+
+    for channel in CHANNELS:
+        image = getattr(dataclass, channel)
+        if image is None:
+            continue
+
+        if spec["shape"] == "circle":
+            region = image * interact.create_circular_mask(
+                image, centers, radius)
+        else:
+            region = interact.create_rectangular_mask(image, *coords)
+        setattr(dataclass, channel + "_roi", region)
+
+
+def _roi_dataclass(dataclass, spec, number, keep):
+    """New dataclass for one of the regions of interest of a field of view"""
+    metadata = dict(dataclass.metadata)
+    metadata.update({"nucleus": number})
+
+    region = data.AnisotropyData(filename=dataclass.filename,
+                                 raw_data=dataclass.raw_data,
+                                 metadata=metadata,
+                                 parallel=dataclass.parallel,
+                                 perpendicular=dataclass.perpendicular)
+    region.secondary_parallel = dataclass.secondary_parallel
+    region.secondary_perpendicular = dataclass.secondary_perpendicular
+    _crop_roi(region, spec)
+
+    data.retain(region, CHANNELS, keep)
+    return region
+
+
+def propose_rois(images, downsample=4, padding=20, min_size=1000):
+    """Automatically find the region of interest around every nucleus in a
+    field of view.
+
+    Nuclei are detected in the temporal mean of the images, downsampled by
+    averaging blocks of pixels, which makes the detection cheap even on whole
+    camera frames.
+
+    Parameters
+    ----------
+    images : (S, N, M) array
+        Images of the field of view, usually the parallel channel.
+
+    downsample : int, optional
+        Size of the blocks of pixels that are averaged.
+
+    padding : int, optional
+        Number of pixels added around the bounding box of every nucleus.
+
+    min_size : int, optional
+        Nuclei smaller than this number of pixels, at full resolution, are
+        ignored.
+
+    Returns
+    -------
+    rois : list
+        `[click, release]` coordinates of the region of interest of every
+        nucleus, in the format returned by `interact.roi_rectangle`.
+    """
+    projection = images.mean(axis=0, dtype=np.float32)
+
+    n, m = projection.shape
+    n_blocks, m_blocks = n // downsample, m // downsample
+    small = projection[:n_blocks * downsample, :m_blocks * downsample]
+    small = small.reshape(n_blocks, downsample,
+                          m_blocks, downsample).mean(axis=(1, 3))
+
+    small = process.gaussian(small, sigma=1)
+    mask = small > process.otsu(small)
+    mask = process.fill_holes(mask)
+    mask = process.remove_small(mask, max(1, min_size // downsample**2))
+
+    rois = []
+    for y, x in ndi.find_objects(ndi.label(mask)[0]):
+        y1 = max(y.start * downsample - padding, 0)
+        y2 = min(y.stop * downsample + padding, n)
+        x1 = max(x.start * downsample - padding, 0)
+        x2 = min(x.stop * downsample + padding, m)
+        rois.append([[x1, y1], [x2, y2]])
+    return rois
+
+
+@profile.profiled
+def auto_roi(dataclass, keep="all", **kwds):
+    """Automatically define the regions of interest around all the nuclei in
+    the field of view. This replaces `define_roi` when the nuclei are well
+    separated.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        Image stored in the `raw_data` attribute.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    kwds : optional kwds to pass to `propose_rois`. `padding` and
+        `min_size` are in pixels of the full resolution images.
+
+    Returns
+    -------
+    rois : list of AnisotropyData dataclass
+        One dataclass for every nucleus, with the regions stored in the
+        `parallel_roi` and `perpendicular_roi` attributes, ready to be
+        registered and segmented.
+    """
+    separate_channels(dataclass, keep)
+
+    binning = dataclass.metadata["binning"]
+    kwds["padding"] = kwds.get("padding", 20) // binning
+    kwds["min_size"] = kwds.get("min_size", 1000) // binning**2
+
+    specs = [roi.scale(roi.rectangle(coords), binning)
+             for coords in propose_rois(dataclass.parallel, **kwds)]
+    rois = [_roi_dataclass(dataclass, spec, number, keep)
+            for number, spec in enumerate(specs)]
+
+    data.retain(dataclass, CHANNELS, keep)
+    return rois
+
+
+def identify_nucleus(image, binning=1):
     """Segment nucleus from an image
 
     Parameters
@@ -82,21 +377,27 @@ def identify_nucleus(image):
     image : (N, M) array
         Image to segment
 
+    binning : int, optional
+        Binning of the image, see `separate_channels`. The smoothing, the
+        offset of the threshold and the smallest nucleus are scaled to the
+        binned pixels.
+
     Returns
     -------
     mask : (N, M) bool array
         Masked image
     """
-    image = process.gaussian(image, sigma=3)
+    image = process.gaussian(image, sigma=3 / binning)
     thres = process.otsu(image)
-    mask = image > thres - 60
+    mask = image > thres - 60 * binning**2
     mask = process.clear_border(mask)
     mask = process.fill_holes(mask)
-    mask = process.remove_small(mask, 1000)
+    mask = process.remove_small(mask, 1000 // binning**2)
     return mask
 
 
-def nuclei_mask(images):
+@profile.profiled
+def nuclei_mask(images, binning=1):
     """Helper function for `identify_nucleus`
 
     Parameters
@@ -104,6 +405,9 @@ def nuclei_mask(images):
     images : (S, N, M) array
         Images to segment
 
+    binning : int, optional
+        Binning of the images, see `identify_nucleus`.
+
     Returns
     -------
     masks : (S, N, M) bool array
@@ -112,64 +416,96 @@ def nuclei_mask(images):
     masks = []
 
     for img in images:
-        mask = identify_nucleus(img)
+        mask = identify_nucleus(img, binning)
         masks.append(mask)
     masks = np.array(masks)
 
     return masks
 
 
-def nuclei(dataclass):
+@profile.profiled
+def nuclei(dataclass, keep="all", drift=False):
     """Segment nuclei in a series of image.
 
     Parameters
     ----------
     dataclass : AnisotropyData dataclass
-        `parallel_roi` and `perpendicular_roi` is used.
+        `parallel_roi` and `perpendicular_roi` is used. When multiplexing,
+        the secondary channels are cropped the same way.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    drift : bool, optional
+        if `drift` is False (default)
+            the nucleus is cropped with its bounding box over all the frames.
+
+        if `drift` is True
+            every frame is cropped with a tight box centered on the centroid
+            of the nucleus, see `drift_slices`.
 
     Returns
     -------
     dataclass : AnisotropyData dataclass
 
-    Updates 
+    Updates
     -------
     `mask_roi` : binary mask of the region of interest
+    `mask_roi_cropped` : cropped binary mask of the nucleus
     `parallel_roi_cropped` : cropped parallel nucleus channel
     `perpendicular_roi_reg_cropped` : cropped perpendicular nucleus channel
+    `secondary_*_cropped` : cropped channels of the second fluorophore
 
     """
 
-    # Read the parallel and perpendicular RoI region
+    # Read the parallel RoI region
     # This has the manually defined approximate region around the cells
     parallel_roi = dataclass.parallel_roi
-    perpendicular_roi = dataclass.perpendicular_roi_reg
 
     # Binarize the image, with True values corresponding
     # to region of the nucleus
-    mask_roi = nuclei_mask(parallel_roi)
+    mask_roi = nuclei_mask(parallel_roi,
+                           dataclass.metadata.get("binning", 1))
 
     # Store the mask over the RoI
     dataclass.mask_roi = mask_roi
 
-    # Find best way to crop the cell out of the mask
-    z, x, y = crop_mask(mask_roi)
-
-    # Crop the parallel and perpendicular RoI with the calculated slice objects
-    # and multiply with the mask to eliminate the pixels outside the nucleus
-    cropped_mask_roi = mask_roi[z, x, y]
-    cropped_parallel_roi = cropped_mask_roi * parallel_roi[z, x, y]
-    cropped_perpendicular_roi = cropped_mask_roi * perpendicular_roi[z, x, y]
-
-    # Store the cropped parallel and perpendicular images channels,
-    # containing the nuclei information alone, to the dataclass
-    dataclass.mask_roi_cropped = util.pad(cropped_mask_roi)
-    dataclass.parallel_roi_cropped = util.pad(cropped_parallel_roi)
-    dataclass.perpendicular_roi_reg_cropped = util.pad(
-        cropped_perpendicular_roi)
-    
-    # Update slice information to metadata
     metadata = dataclass.metadata
-    metadata.update({"slice": [z, x, y]})
+
+    if drift:
+        # Follow the same nucleus as `crop_mask`, and crop it frame by frame
+        mask_nucleus = ndi.label(mask_roi)[0] == 1
+        slices, centroids = drift_slices(mask_nucleus)
+
+        dataclass.mask_roi_cropped = crop_frames(mask_nucleus, slices)
+
+        metadata.update({"slice": slices,
+                         "drift": centroids - centroids[0]})
+    else:
+        # Find best way to crop the cell out of the mask
+        z, x, y = crop_mask(mask_roi)
+
+        dataclass.mask_roi_cropped = mask_roi[z, x, y]
+
+        # Update slice information to metadata
+        metadata.update({"slice": [z, x, y]})
+
+    # Crop the parallel and perpendicular RoI with the calculated slice
+    # objects. Without drift, the crops are views into the RoI, in their
+    # native dtype; the pixels outside the nucleus are masked once, while
+    # calculating anisotropy
+    for roi_field, cropped_field in CROPPED.items():
+        image = getattr(dataclass, roi_field)
+        if image is None:
+            continue
+        if drift:
+            cropped = crop_frames(image, slices)
+        else:
+            cropped = image[z, x, y]
+        setattr(dataclass, cropped_field, cropped)
+
+    data.retain(dataclass, list(CROPPED) + ["mask_roi"], keep)
     return dataclass
 
 
@@ -191,3 +527,271 @@ def crop_mask(mask):
     slice_ = ndi.find_objects(labelled_mask, max_label=1)[0]
 
     return slice_
+
+
+@profile.profiled
+def track_nuclei(dataclass, keep="all", max_distance=20, drift=False):
+    """Segment and track every nucleus in a series of image.
+
+    Unlike `nuclei`, which keeps a single nucleus in a bounding box over the
+    whole series, every nucleus is tracked over time and cropped tightly in
+    each frame.
+
+    Parameters
+    ----------
+    dataclass : AnisotropyData dataclass
+        `parallel_roi` and `perpendicular_roi_reg` is used.
+
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
+    max_distance : float, optional
+        See `track`.
+
+    drift : bool, optional
+        if `drift` is False (default)
+            every frame is cropped with the bounding box of the nucleus, and
+            the crops are padded to the same size.
+
+        if `drift` is True
+            every frame is cropped with a box of the same size centered on
+            the centroid of the nucleus, see `drift_slices`.
+
+    Returns
+    -------
+    cells : list of AnisotropyData dataclass
+        One dataclass for every tracked nucleus, with the attributes updated
+        by `nuclei`. The frames in which the nucleus is not found are left
+        empty.
+    """
+    parallel_roi = dataclass.parallel_roi
+
+    mask_roi = nuclei_mask(parallel_roi,
+                           dataclass.metadata.get("binning", 1))
+    dataclass.mask_roi = mask_roi
+
+    tracked = track(mask_roi, max_distance)
+
+    # Registered regions of interest, of both fluorophores when multiplexing
+    regions = {field: getattr(dataclass, field) for field in CROPPED
+               if getattr(dataclass, field) is not None}
+
+    cells = []
+    for number, slices in crop_tracks(tracked).items():
+        mask_track = tracked == number
+        metadata = dict(dataclass.metadata)
+        metadata.update({"nucleus": number})
+
+        cell = data.AnisotropyData(filename=dataclass.filename,
+                                   raw_data=dataclass.raw_data,
+                                   metadata=metadata,
+                                   mask_roi=mask_track,
+                                   **regions)
+
+        if drift:
+            slices, centroids = drift_slices(mask_track)
+            cell.mask_roi_cropped = crop_frames(mask_track, slices)
+            for field, image in regions.items():
+                setattr(cell, CROPPED[field], crop_frames(image, slices))
+            metadata.update({"drift": centroids - centroids[0]})
+        else:
+            cell.mask_roi_cropped = _crop_padded(mask_track,
+                                                 slices).astype(bool)
+            for field, image in regions.items():
+                setattr(cell, CROPPED[field], _crop_padded(image, slices))
+
+        metadata.update({"slice": slices})
+        cells.append(cell)
+
+    for cell in cells + [dataclass]:
+        data.retain(cell, list(CROPPED) + ["mask_roi"], keep)
+    return cells
+
+
+def _crop_padded(images, slices):
+    """Crop every frame with its own slice, and pad the crops to the same
+    size. Frames without a slice are left empty."""
+    crops = [np.zeros((0, 0), dtype=images.dtype) if slice_ is None
+             else image[slice_]
+             for image, slice_ in zip(images, slices)]
+    return util.pad(crops)
+
+
+@profile.profiled
+def track(mask, max_distance=20, out=None):
+    """Label the objects in every frame of a mask, and link them over time.
+
+    Objects are labelled frame by frame. An object is linked to the track it
+    overlaps the most in the previous frame, or else to the nearest track, by
+    centroid, that is not already linked.
+
+    Parameters
+    ----------
+    mask : (S, N, M) array
+        Mask with the objects to track
+
+    max_distance : float, optional
+        Largest distance, in pixels, between the centroids of an object and
+        of the track it is linked to, when they do not overlap.
+
+    out : (S, N, M) int array, optional
+        Array where the tracked objects are written, for instance a
+        memory-mapped array, so that only a frame of labels is held in
+        memory at once.
+
+    Returns
+    -------
+    tracked : (S, N, M) int array
+        Mask where the pixels of every tracked object share the same label.
+    """
+    structure = ndi.generate_binary_structure(2, 1)
+
+    tracked = np.zeros(mask.shape, dtype=np.int32) if out is None else out
+    last_centroid = {}  # track -> (frame, centroid)
+    n_tracks = 0
+
+    for frame in range(len(mask)):
+        frame_labels, n_labels = ndi.label(mask[frame], structure)
+        objects = np.unique(frame_labels[frame_labels > 0])
+        if objects.size == 0:
+            continue
+        centroids = dict(zip(objects, ndi.center_of_mass(
+            mask[frame], frame_labels, objects)))
+
+        links = {}  # object -> track
+        if frame > 0:
+            previous = tracked[frame - 1]
+            both = (previous > 0) & (frame_labels > 0)
+            pairs, overlap = np.unique(
+                np.stack([previous[both], frame_labels[both]]),
+                axis=1, return_counts=True)
+            for index in np.argsort(overlap)[::-1]:
+                track_, object_ = pairs[:, index]
+                if object_ not in links and track_ not in links.values():
+                    links[object_] = track_
+
+        for object_ in objects:
+            if object_ in links:
+                continue
+            distances = {
+                track_: np.hypot(*np.subtract(centroid, centroids[object_]))
+                for track_, (_, centroid) in last_centroid.items()
+                if track_ not in links.values()}
+            nearest = min(distances, key=distances.get, default=None)
+            if nearest is not None and distances[nearest] <= max_distance:
+                links[object_] = nearest
+            else:
+                n_tracks += 1
+                links[object_] = n_tracks
+
+        lookup = np.zeros(n_labels + 1, dtype=tracked.dtype)
+        for object_, track_ in links.items():
+            lookup[object_] = track_
+            last_centroid[track_] = (frame, centroids[object_])
+        tracked[frame] = lookup[frame_labels]
+
+    return tracked
+
+
+def crop_tracks(tracked):
+    """Bounding box of every tracked object, in every frame.
+
+    Parameters
+    ----------
+    tracked : (S, N, M) int array
+        Mask returned by `track`
+
+    Returns
+    -------
+    slices : dict
+        Label of every tracked object mapped to the list of its (N, M) slice
+        objects in every frame, or `None` where it is absent.
+    """
+    n_tracks = tracked.max()
+    slices = {number: [] for number in range(1, n_tracks + 1)}
+
+    for frame in tracked:
+        objects = ndi.find_objects(frame, max_label=n_tracks)
+        for number, slice_ in enumerate(objects, start=1):
+            slices[number].append(slice_)
+    return slices
+
+
+def drift_slices(mask):
+    """Boxes of the same size, centered on the centroid of an object in every
+    frame, that compensate for the drift of the object over time.
+
+    Parameters
+    ----------
+    mask : (S, N, M) array
+        Mask with a single object
+
+    Returns
+    -------
+    slices : list
+        (N, M) slice objects for every frame. They may extend beyond the
+        edges of the image, see `crop_frames`.
+
+    centroids : (S, 2) array
+        Centroid of the object in every frame. Frames without the object take
+        the centroid interpolated from the other frames.
+    """
+    centroids = np.full((len(mask), 2), np.nan)
+    extent = np.zeros(2)
+
+    for frame, frame_mask in enumerate(mask):
+        box = ndi.find_objects(frame_mask.astype(np.uint8))
+        if not box:
+            continue
+        centroid = ndi.center_of_mass(frame_mask)
+        centroids[frame] = centroid
+        for axis, slice_ in enumerate(box[0]):
+            extent[axis] = max(extent[axis],
+                               centroid[axis] - slice_.start,
+                               slice_.stop - centroid[axis])
+
+    found = ~np.isnan(centroids[:, 0])
+    if not found.any():
+        raise ValueError("No object in the mask.")
+
+    frames = np.arange(len(mask))
+    for axis in range(2):
+        centroids[:, axis] = np.interp(frames, frames[found],
+                                       centroids[found, axis])
+
+    half = np.ceil(extent).astype(int)
+    slices = [tuple(slice(center - size, center + size + 1)
+                    for center, size in zip(centroid, half))
+              for centroid in np.round(centroids).astype(int)]
+    return slices, centroids
+
+
+def crop_frames(images, slices):
+    """Crop every frame with its own slice, padding with zeros where the
+    slice extends beyond the image.
+
+    Parameters
+    ----------
+    images : (S, N, M) array
+        Images to crop
+
+    slices : list
+        (N, M) slice objects of the same size for every frame, as returned by
+        `drift_slices`.
+
+    Returns
+    -------
+    cropped : (S, n, m) array
+        Cropped images, in the dtype of `images`
+    """
+    y, x = slices[0]
+    cropped = np.zeros((len(images), y.stop - y.start, x.stop - x.start),
+                       dtype=images.dtype)
+
+    for image, crop, (y, x) in zip(images, cropped, slices):
+        y1, y2 = max(y.start, 0), min(y.stop, image.shape[0])
+        x1, x2 = max(x.start, 0), min(x.stop, image.shape[1])
+        crop[y1 - y.start:y2 - y.start,
+             x1 - x.start:x2 - x.start] = image[y1:y2, x1:x2]
+    return cropped
@@ -1,7 +1,12 @@
+import warnings
 import numpy as np
 from scipy import stats
 
 
+# Curves of a group of cells compared by `bootstrap` and `permutation_test`
+CURVES = ("mean", "median", "mean_delta", "median_delta")
+
+
 def delta(data):
     """Difference for each datapoint with that of the 0th point. 
 
@@ -62,7 +67,8 @@ def pearson(x, y, without_zero=True):
 
     without_zero : bool
         if `without_zero` is True (default)
-            PCC for the array, without counting the zeros.
+            PCC for the array, without counting the pairs where x or y is
+            zero.
 
         if `without_zero` is False
             PCC for the array, counting the zeros.
@@ -76,12 +82,86 @@ def pearson(x, y, without_zero=True):
         2-tailed p-value
     """
     if without_zero:
-        x = ignore_zero(x)
-        y = ignore_zero(y)
+        # drop the pairs, so that x and y stay aligned
+        nonzero = (x != 0) & (y != 0)
+        x = x[nonzero]
+        y = y[nonzero]
 
     return stats.pearsonr(x, y)
 
 
+def correlate(x, y, method="pearson", without_zero=True):
+    """Calculate the correlation coefficient between two stacks of images,
+    frame by frame, in a single vectorized pass.
+
+    Parameters
+    ----------
+    x : (S, N, M) array
+
+    y : (S, N, M) or (N, M) array
+        A single image is compared with every frame of `x`, for instance
+        `y = x[0]` to compare the frame t with the frame 0.
+
+    method : "pearson" or "spearman"
+
+    without_zero : bool
+        if `without_zero` is True (default)
+            coefficients without counting the pixels where x or y is zero.
+
+        if `without_zero` is False
+            coefficients counting the zeros.
+
+    Returns
+    -------
+    r : (S,) array
+        Correlation coefficient of every frame
+
+    p-value : (S,) array
+        2-tailed p-value of every frame
+    """
+    x, y = np.broadcast_arrays(x, y)
+    x = x.reshape(len(x), -1).astype(np.float64)
+    y = y.reshape(len(y), -1).astype(np.float64)
+
+    if without_zero:
+        mask = (x != 0) & (y != 0)
+    else:
+        mask = np.ones(x.shape, dtype=bool)
+
+    if method == "spearman":
+        x = _rank(x, mask)
+        y = _rank(y, mask)
+    elif method != "pearson":
+        raise ValueError(f"Unknown correlation method '{method}'")
+
+    n = mask.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = np.where(mask, x, 0).sum(axis=1) / n
+        y_mean = np.where(mask, y, 0).sum(axis=1) / n
+
+        dx = np.where(mask, x - x_mean[:, np.newaxis], 0)
+        dy = np.where(mask, y - y_mean[:, np.newaxis], 0)
+
+        r = (dx * dy).sum(axis=1) / np.sqrt(
+            (dx**2).sum(axis=1) * (dy**2).sum(axis=1))
+        r = np.clip(r, -1, 1)
+
+        # t-test with n - 2 degrees of freedom, as in `scipy.stats`
+        dof = n - 2
+        t = r * np.sqrt(dof / ((1 - r) * (1 + r)))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+
+    p = np.where(np.abs(r) == 1, 0, p)
+    return r, p
+
+
+def _rank(data, mask):
+    """Rank the masked values of every row, averaging ties"""
+    # values outside the mask rank above all the others, and are ignored
+    data = np.where(mask, data, np.inf)
+    return stats.rankdata(data, axis=1)
+
+
 def mean(array, without_zero=True):
     """Calculate the mean value of an array.
 
@@ -204,3 +284,163 @@ def ks(image1, image2):
     image2_without_zero = ignore_zero(image2)
 
     return stats.ks_2samp(image1_without_zero, image2_without_zero)
+
+
+def curve(values, statistic="mean"):
+    """Curve of a group of cells over time.
+
+    Parameters
+    ----------
+    values : (..., cells, time) array
+        Time series of every cell, padded with nan.
+
+    statistic : str
+        One of `CURVES`. The delta curves are the difference of every time
+        point with the first one, as `delta`.
+
+    Returns
+    -------
+    curve : (..., time) array
+    """
+    if statistic not in CURVES:
+        raise ValueError(f"Unknown statistic '{statistic}'")
+
+    with warnings.catch_warnings():
+        # time points without any cell give nan
+        warnings.simplefilter("ignore", RuntimeWarning)
+        if statistic.startswith("mean"):
+            result = np.nanmean(values, axis=-2)
+        else:
+            result = np.nanmedian(values, axis=-2)
+
+    if statistic.endswith("delta"):
+        result = result - result[..., :1]
+    return result
+
+
+def _chunks(n_resamples, chunk):
+    """Number of replicates of every chunk"""
+    for start in range(0, n_resamples, chunk):
+        yield min(chunk, n_resamples - start)
+
+
+def bootstrap(values, statistic="mean", n_resamples=1000, confidence=0.95,
+              chunk=100, seed=None):
+    """Bootstrap confidence interval of the curve of a group of cells.
+
+    The cells of every replicate are drawn with replacement through an
+    index matrix, and the curves of `chunk` replicates are computed at once.
+
+    Parameters
+    ----------
+    values : (cells, time) array
+        Time series of every cell, padded with nan.
+
+    statistic : str
+        One of `CURVES`.
+
+    n_resamples : int
+
+    confidence : float
+        Confidence level of the percentile interval.
+
+    chunk : int
+        Number of replicates computed at once, which bounds the memory to
+        `chunk * cells * time` values.
+
+    seed : int, optional
+        Seed of the random number generator, for reproducible intervals.
+
+    Returns
+    -------
+    results : dict
+        `curve` of the cells, `low` and `high` bounds of the confidence
+        interval as (time,) arrays, and the (n_resamples, time) `replicates`.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    n_cells = len(values)
+
+    replicates = []
+    for size in _chunks(n_resamples, chunk):
+        indices = rng.integers(0, n_cells, size=(size, n_cells))
+        replicates.append(curve(values[indices], statistic))
+    replicates = np.concatenate(replicates)
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanquantile(replicates, [alpha, 1 - alpha], axis=0)
+
+    return {"curve": curve(values, statistic),
+            "low": low,
+            "high": high,
+            "replicates": replicates}
+
+
+def permutation_test(values1, values2, statistic="mean", n_resamples=1000,
+                     chunk=100, seed=None):
+    """Permutation test of the difference of the curves of two groups of
+    cells, at every time point.
+
+    The cells of both groups are pooled and shuffled through an index
+    matrix, and the differences of `chunk` replicates are computed at once.
+
+    Parameters
+    ----------
+    values1, values2 : (cells, time) array
+        Time series of the cells of each group, padded with nan.
+
+    statistic : str
+        One of `CURVES`.
+
+    n_resamples : int
+
+    chunk : int
+        Number of replicates computed at once, which bounds the memory to
+        `chunk * cells * time` values.
+
+    seed : int, optional
+        Seed of the random number generator, for reproducible p-values.
+
+    Returns
+    -------
+    results : dict
+        `difference` of the curves (values2 - values1) and two-tailed
+        `p_value` as (time,) arrays, nan where the difference is not
+        defined, and the (n_resamples, time) `null` distribution of the
+        difference.
+    """
+    values1 = np.asarray(values1, dtype=np.float64)
+    values2 = np.asarray(values2, dtype=np.float64)
+
+    # series of different lengths are padded to the longest one
+    n_frames = max(values1.shape[1], values2.shape[1])
+    pooled = np.full((len(values1) + len(values2), n_frames), np.nan)
+    pooled[:len(values1), :values1.shape[1]] = values1
+    pooled[len(values1):, :values2.shape[1]] = values2
+
+    rng = np.random.default_rng(seed)
+    n1 = len(values1)
+    difference = (curve(pooled[n1:], statistic) -
+                  curve(pooled[:n1], statistic))
+
+    null = []
+    for size in _chunks(n_resamples, chunk):
+        indices = rng.permuted(np.tile(np.arange(len(pooled)), (size, 1)),
+                               axis=1)
+        shuffled = pooled[indices]
+        null.append(curve(shuffled[:, n1:], statistic) -
+                    curve(shuffled[:, :n1], statistic))
+    null = np.concatenate(null)
+
+    # replicates without cells in a group, at a time point, are left out,
+    # and time points without cells in either group have no p-value
+    with np.errstate(invalid='ignore'):
+        extreme = (np.abs(null) >= np.abs(difference)).sum(axis=0)
+    p_value = (extreme + 1) / (np.isfinite(null).sum(axis=0) + 1)
+    p_value[~np.isfinite(difference)] = np.nan
+
+    return {"difference": difference,
+            "p_value": p_value,
+            "null": null}
@@ -0,0 +1,219 @@
+import numpy as np
+import scipy.ndimage as ndi
+from fai import data
+
+
+def nuclei(shape, n_frames=27, n_nuclei=1, radius=(40, 60), margin=0,
+           velocity=0, rng=None):
+    """Masks of elliptical nuclei moving over time.
+
+    Parameters
+    ----------
+    shape : (N, M) tuple
+        Shape of the images.
+
+    n_frames : int, optional
+
+    n_nuclei : int, optional
+
+    radius : (min, max) tuple, optional
+        Range of the semi-axes of the nuclei, in pixels.
+
+    margin : int, optional
+        Rows at the top and at the bottom of the image kept free of nuclei.
+
+    velocity : float, optional
+        Distance moved by every nucleus between frames, in pixels, in a
+        random direction.
+
+    rng : numpy.random.Generator, optional
+
+    Returns
+    -------
+    labels : (S, N, M) int array
+        Label of the nucleus of every pixel, 0 in the background.
+    """
+    n, m = shape
+    # the nuclei, and the distance they move, fit in the image
+    extent = 2 * (max(radius) + velocity * n_frames)
+    if extent + 2 * margin > n or extent > m:
+        raise ValueError(f"Nuclei of radius up to {max(radius)} moving by "
+                         f"{velocity} over {n_frames} frames need a shape "
+                         f"of at least {(extent + 2 * margin, extent)}, "
+                         f"with a margin of {margin}, not {tuple(shape)}")
+
+    rng = np.random.default_rng(rng)
+    rows, cols = np.ogrid[:n, :m]
+
+    labels = np.zeros((n_frames, n, m), dtype=np.int32)
+    for number in range(1, n_nuclei + 1):
+        a, b = rng.uniform(*radius, size=2)
+        angle = rng.uniform(0, np.pi)
+        direction = rng.uniform(0, 2 * np.pi)
+
+        extent = max(a, b) + velocity * n_frames
+        y0 = rng.uniform(margin + extent, n - margin - extent)
+        x0 = rng.uniform(extent, m - extent)
+
+        for frame in range(n_frames):
+            y = y0 + velocity * frame * np.sin(direction)
+            x = x0 + velocity * frame * np.cos(direction)
+            u = (cols - x) * np.cos(angle) + (rows - y) * np.sin(angle)
+            v = (rows - y) * np.cos(angle) - (cols - x) * np.sin(angle)
+            labels[frame][(u / a)**2 + (v / b)**2 <= 1] = number
+    return labels
+
+
+def anisotropy_field(labels, anisotropy=0.2, spread=0.05, gradient=0.02,
+                     change=0.0, rng=None):
+    """Ground truth anisotropy of every pixel of the nuclei.
+
+    Parameters
+    ----------
+    labels : (S, N, M) int array
+        Nuclei returned by `nuclei`.
+
+    anisotropy : float, optional
+        Mean anisotropy of the nuclei.
+
+    spread : float, optional
+        Standard deviation of the anisotropy between nuclei.
+
+    gradient : float, optional
+        Largest change of anisotropy across the image.
+
+    change : float, optional
+        Relative change of anisotropy from the first to the last frame,
+        for instance -0.2 for a 20 % decrease.
+
+    rng : numpy.random.Generator, optional
+
+    Returns
+    -------
+    field : (S, N, M) float array
+        Anisotropy in the nuclei, 0 in the background.
+    """
+    rng = np.random.default_rng(rng)
+    n_frames, n, m = labels.shape
+
+    per_nucleus = np.zeros(labels.max() + 1)
+    per_nucleus[1:] = np.clip(rng.normal(anisotropy, spread,
+                                         size=labels.max()), 0.01, 0.39)
+
+    rows, cols = np.mgrid[:n, :m]
+    slope = gradient * (rows / n + cols / m - 1)
+
+    time = 1 + change * np.linspace(0, 1, n_frames)
+    field = (per_nucleus[labels] + slope) * time[:, np.newaxis, np.newaxis]
+    return np.where(labels > 0, np.clip(field, 0, 0.99), 0)
+
+
+def acquisition(n_frames=27, shape=(256, 256), n_nuclei=1, radius=(40, 60),
+                anisotropy=0.2, g_factor=1.0, photons=800.0, offset=100,
+                read_noise=2.0, shift=(3.0, -2.0), matrix=None, velocity=0,
+                diff=50, seed=None):
+    """Simulate a split-view FAI acquisition with a known anisotropy.
+
+    The perpendicular channel is imaged on the top half of the sensor, and
+    the parallel channel on the bottom half, laid out such that
+    `segment.separate_channels` returns aligned channels, except for the
+    given misalignment of the perpendicular channel.
+
+    Parameters
+    ----------
+    n_frames : int, optional
+
+    shape : (N, M) tuple, optional
+        Shape of each channel. The raw images are (2 * N, M). The nuclei,
+        `diff` rows away from the top and the bottom, must fit in it.
+
+    n_nuclei : int, optional
+
+    radius : (min, max) tuple, optional
+        Range of the semi-axes of the nuclei, in pixels.
+
+    anisotropy : float, optional
+        Mean anisotropy of the nuclei, see `anisotropy_field`.
+
+    g_factor : float, optional
+        Bias in detection of the perpendicular channel.
+
+    photons : float, optional
+        Mean total intensity of the nuclei, in photons per pixel.
+
+    offset : float, optional
+        Baseline of the sensor.
+
+    read_noise : float, optional
+        Standard deviation of the gaussian noise of the sensor.
+
+    shift : (dy, dx) tuple, optional
+        Translation of the perpendicular channel, in pixels.
+
+    matrix : (2, 2) array, optional
+        Linear part of an affine misalignment of the perpendicular channel,
+        applied about the center of the image along with `shift`.
+
+    velocity : float, optional
+        Drift of the nuclei between frames, in pixels.
+
+    diff : int, optional
+        Overlap of the channels, as in `segment.separate_channels`.
+
+    seed : int, optional
+        Seed of the random number generator.
+
+    Returns
+    -------
+    dataclass : AnisotropyData dataclass
+        Simulated images stored in the `raw_data` attribute.
+
+    truth : dict
+        `anisotropy` field and nuclei `labels` in the coordinates of the
+        parallel channel, `mask` of the nuclei in every frame, and the
+        parameters of the simulation.
+    """
+    rng = np.random.default_rng(seed)
+    n, m = shape
+
+    labels = nuclei(shape, n_frames, n_nuclei, radius, margin=diff,
+                    velocity=velocity, rng=rng)
+    field = anisotropy_field(labels, anisotropy, rng=rng)
+
+    # chromatin-like texture of the total intensity
+    texture = ndi.gaussian_filter(rng.normal(1, 0.4, size=(n, m)), 2)
+    intensity = photons * np.clip(texture, 0.2, None) * (labels > 0)
+
+    parallel = intensity * (1 + 2 * field) / 3
+    perpendicular = intensity * (1 - field) / (3 * g_factor)
+
+    if matrix is None:
+        matrix = np.eye(2)
+    center = np.array([n, m]) / 2
+    warp_offset = center - np.dot(matrix, center) - np.asarray(shift)
+    perpendicular = np.array([
+        ndi.affine_transform(frame, matrix, warp_offset, order=1)
+        for frame in perpendicular])
+
+    signal = np.zeros((n_frames, 2 * n, m))
+    signal[:, :n] = perpendicular
+    signal[:, n:2 * n - diff] = parallel[:, diff:]
+
+    raw_data = (rng.poisson(signal) + offset +
+                rng.normal(0, read_noise, size=signal.shape))
+    raw_data = np.clip(np.round(raw_data), 0, np.iinfo(np.uint16).max)
+
+    # the parallel channel of `segment.separate_channels` is diff rows longer
+    padding = ((0, 0), (0, diff), (0, 0))
+    truth = {"anisotropy": np.pad(field, padding),
+             "labels": np.pad(labels, padding),
+             "mask": np.pad(labels > 0, padding),
+             "g_factor": g_factor,
+             "offset": offset,
+             "shift": shift,
+             "matrix": matrix}
+
+    dataclass = data.AnisotropyData(filename="synthetic",
+                                    raw_data=raw_data.astype(np.uint16),
+                                    metadata={"synthetic": True})
+    return dataclass, truth
@@ -1,8 +1,17 @@
 import numpy as np
 import SimpleITK as sitk
+from fai import config, data, profile
 
 
-def estimate(img1, img2):
+# Registration of channels that are already aligned by the channel split
+# profile of the instrument (see `calibration.estimate_split`), whose residual
+# misalignment is at most a few pixels
+CALIBRATED = {"NumberOfResolutions": ["2"],
+              "MaximumNumberOfIterations": ["128"]}
+
+
+@profile.profiled
+def estimate(img1, img2, calibrated=False):
     """Estimate the transformation matrix for img2, with respect to fixed img1.
 
     Parameters
@@ -13,13 +22,21 @@ def estimate(img1, img2):
     img2 : (N, M) numpy array
         Misaligned image
 
+    calibrated : bool, optional
+        The images are roughly aligned already, and are registered with fewer
+        resolutions and iterations, see `CALIBRATED`.
+
     Returns
     -------
     Transformation Parameter Map : SuperElastix transformation parameters
     """
     elastix = sitk.ElastixImageFilter()
     elastix.LogToConsoleOff()
-    elastix.SetParameterMap(sitk.GetDefaultParameterMap("affine"))
+    parameter_map = sitk.GetDefaultParameterMap("affine")
+    if calibrated:
+        for key, value in CALIBRATED.items():
+            parameter_map[key] = value
+    elastix.SetParameterMap(parameter_map)
 
     elastix.SetFixedImage(sitk.GetImageFromArray(img1))
     elastix.SetMovingImage(sitk.GetImageFromArray(img2))
@@ -28,6 +45,7 @@ def estimate(img1, img2):
     return elastix.GetTransformParameterMap()
 
 
+@profile.profiled
 def align(estimation, img2):
     """Align the given image with the given transformation parameter map.
 
@@ -53,7 +71,8 @@ def align(estimation, img2):
     return sitk.GetArrayFromImage(transformix.GetResultImage())
 
 
-def register(dataclass):
+@profile.profiled
+def register(dataclass, keep="all"):
     """Register the parallel and perpendicular channels.
 
     Parameters
@@ -62,20 +81,46 @@ def register(dataclass):
         `parallel_roi` and `perpendicular_roi` attributes of the dataclass
         are used.
 
+    keep : "all", "final" or list of str, optional
+        Retention policy for the intermediate arrays consumed by this step,
+        see `data.retain`.
+
     Returns
     -------
     dataclass : AnisotropyData object
         `perpendicular_roi_reg` attribute is populated with the registered
-        perpendicular channel.
+        perpendicular channel. When multiplexing, the transformation estimated
+        for the primary fluorophore is also applied to
+        `secondary_perpendicular_roi`, which is stored in
+        `secondary_perpendicular_roi_reg`.
     """
     parallel_roi = dataclass.parallel_roi
     perpendicular_roi = dataclass.perpendicular_roi
+    secondary_roi = dataclass.secondary_perpendicular_roi
+
+    # channels split with the profile of the instrument are nearly aligned
+    calibrated = "split" in dataclass.metadata
 
     registered = []
+    secondary_registered = []
+
+    for frame, (img1, img2) in enumerate(zip(parallel_roi, perpendicular_roi)):
+        estimation = estimate(img1, img2, calibrated)
+        registered.append(config.to_raw(align(estimation, img2),
+                                        img2.dtype))
 
-    for img1, img2 in zip(parallel_roi, perpendicular_roi):
-        estimation = estimate(img1, img2)
-        registered.append(align(estimation, img2).astype(np.int16))
+        # Both fluorophores are imaged through the same optical path
+        if secondary_roi is not None:
+            secondary_registered.append(
+                config.to_raw(align(estimation, secondary_roi[frame]),
+                              secondary_roi.dtype))
 
     dataclass.perpendicular_roi_reg = np.array(registered)
+
+    if secondary_roi is not None:
+        dataclass.secondary_perpendicular_roi_reg = np.array(
+            secondary_registered)
+
+    data.retain(dataclass,
+                ["perpendicular_roi", "secondary_perpendicular_roi"], keep)
     return dataclass
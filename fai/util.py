@@ -11,7 +11,7 @@ def pad(list_of_images):
     Return
     ------
     padded_list : ndarray
-        Images with same x, y dimension
+        Images with same x, y dimension, in the type of the images
     """
     padded_list = []
     a = 0
@@ -28,13 +28,13 @@ def pad(list_of_images):
         if b > a:
             limit_a = int(round(b/2)) - int(round(nuc_a/2))
             limit_b = int(round((b - nuc_b)/2))
-            padded = np.zeros([b, b])
+            padded = np.zeros([b, b], dtype=nuclei.dtype)
             padded[limit_a:nuc_a + limit_a,
                    limit_b:nuc_b + limit_b] = nuclei
         else:
             limit_a = int(round((a - nuc_a)/2))
             limit_b = int(round(a/2)) - int(round(nuc_b/2))
-            padded = np.zeros([a, a])
+            padded = np.zeros([a, a], dtype=nuclei.dtype)
             padded[limit_a:nuc_a + limit_a,
                    limit_b:nuc_b + limit_b] = nuclei
 
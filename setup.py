@@ -7,11 +7,13 @@ setup(name='fai',
       author='Kesavan Subburam',
       author_email='pskesavan@tifrh.res.in',
       packages=['fai'],
-      install_requires=['numpy>=1.16.1',
+      install_requires=['numpy>=1.20',
                         'scikit-image>=0.14.2',
                         'matplotlib>=3.0.2',
                         'tqdm>=4.30.0',
-                        'scipy>=1.2.0',
+                        'scipy>=1.6',
+                        'tifffile>=2020.9.30',
                         'matplotlib-scalebar>=0.5.1',
                         'matplotlib-colorbar>=0.3.7'],
+      extras_require={'parquet': ['pyarrow']},
       zip_safe=False)
@@ -0,0 +1,124 @@
+"""Benchmark of the stages of the pipeline on synthetic acquisitions of
+different sizes, with pytest-benchmark. The throughput in MB/s, the frames
+per second and the peak memory of every stage are stored in `extra_info`.
+
+    pytest tests/test_benchmark.py --benchmark-columns=min,mean,rounds
+"""
+import copy
+import tracemalloc
+import pytest
+from fai import compute, files, roi, segment, synthetic
+
+pytest.importorskip("pytest_benchmark")
+
+try:
+    from fai import transform
+except ImportError:
+    # SimpleElastix is compiled separately, registration is skipped
+    transform = None
+
+
+# (frames, rows, columns) of each channel
+SIZES = [(27, 256, 256), (27, 512, 512), (27, 1024, 1024)]
+
+STAGES = ("files.imread",
+          "segment.separate_channels",
+          "transform.register",
+          "segment.nuclei_mask",
+          "segment.nuclei",
+          "compute.anisotropy",
+          "compute._update_stats",
+          "plot.data_for_all_plots")
+
+
+def peak_memory(func, args):
+    """Peak memory allocated by a run of the function, in bytes. Traced
+    apart from the timed runs, as tracing slows down the function."""
+    args = copy.deepcopy(args)
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+@pytest.fixture(scope="module", params=SIZES,
+                ids=["x".join(map(str, size)) for size in SIZES])
+def stages(request, tmp_path_factory):
+    """Function, arguments and size of the input of every stage, for a
+    synthetic acquisition. Every stage is run once, to prepare the input of
+    the next one."""
+    n_frames, n, m = request.param
+    dataclass, truth = synthetic.acquisition(n_frames, (n, m),
+                                             radius=(n / 8, n / 6), seed=0)
+    result = {}
+
+    filename = str(tmp_path_factory.mktemp("benchmark") /
+                   f"synthetic_{n_frames}_{n}_{m}.tif")
+    files.imsave(dataclass.raw_data, filename)
+    result["files.imread"] = (files.imread, (filename,),
+                              dataclass.raw_data.nbytes)
+
+    result["segment.separate_channels"] = (segment.separate_channels,
+                                           (dataclass,),
+                                           dataclass.raw_data.nbytes)
+    dataclass = copy.deepcopy(dataclass)
+    segment.separate_channels(dataclass)
+    segment.apply_roi(dataclass, roi.rectangle([[0, 0], [m, n]]))
+    roi_nbytes = dataclass.parallel_roi.nbytes
+
+    if transform is not None:
+        result["transform.register"] = (transform.register, (dataclass,),
+                                        2 * roi_nbytes)
+        dataclass = copy.deepcopy(dataclass)
+        transform.register(dataclass)
+    else:
+        dataclass.perpendicular_roi_reg = dataclass.perpendicular_roi
+
+    result["segment.nuclei_mask"] = (segment.nuclei_mask,
+                                     (dataclass.parallel_roi,), roi_nbytes)
+
+    result["segment.nuclei"] = (segment.nuclei, (dataclass,),
+                                2 * roi_nbytes)
+    dataclass = copy.deepcopy(dataclass)
+    segment.nuclei(dataclass)
+
+    result["compute.anisotropy"] = (
+        compute.anisotropy,
+        (dataclass, truth["g_factor"], truth["offset"]),
+        2 * dataclass.parallel_roi_cropped.nbytes)
+    dataclass = copy.deepcopy(dataclass)
+    compute.anisotropy(dataclass, truth["g_factor"], truth["offset"])
+
+    amaps = dataclass.anisotropy_round_median
+    result["compute._update_stats"] = (compute._update_stats,
+                                       (dataclass, amaps), amaps.nbytes)
+
+    try:
+        from fai import plot
+    except (ImportError, OSError):
+        # the styles of the plots are not available in every matplotlib
+        pass
+    else:
+        result["plot.data_for_all_plots"] = (plot.data_for_all_plots,
+                                             ([dataclass] * 10,),
+                                             10 * amaps.nbytes)
+    return n_frames, result
+
+
+@pytest.mark.parametrize("stage", STAGES)
+def test_stage(benchmark, stages, stage):
+    n_frames, result = stages
+    if stage not in result:
+        pytest.skip(f"{stage} is not available")
+    func, args, nbytes = result[stage]
+
+    # the stages modify the dataclass they are given, so that every run gets
+    # fresh copies of the arguments, made outside of the timing
+    benchmark.pedantic(func, setup=lambda: (copy.deepcopy(args), {}),
+                       rounds=3)
+
+    seconds = benchmark.stats["min"]
+    benchmark.extra_info.update({"throughput": nbytes / seconds / 1e6,
+                                 "frames_per_s": n_frames / seconds,
+                                 "peak": peak_memory(func, args)})
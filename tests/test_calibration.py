@@ -0,0 +1,78 @@
+import numpy as np
+import scipy.ndimage as ndi
+from fai import calibration, data, files, roi, segment
+
+
+def beads(shape, n_beads=40, seed=0):
+    rng = np.random.default_rng(seed)
+    image = np.zeros(shape)
+    y = rng.integers(5, shape[0] - 5, n_beads)
+    x = rng.integers(5, shape[1] - 5, n_beads)
+    image[y, x] = rng.uniform(500, 1000, n_beads)
+    return ndi.gaussian_filter(image, 1)
+
+
+def test_estimate_split_off_centre():
+    split, dy, dx = 264, 30, 4
+    perpendicular = beads((split, 256))
+
+    # the parallel channel starts dy rows before the split line, and is
+    # shifted by dx columns
+    raw = np.full((512, 256), 100.0)
+    raw[:split] += perpendicular
+    parallel = np.roll(perpendicular, -dx, axis=1)
+    raw[split:2 * split - dy] += parallel[dy:]
+
+    profile = calibration.estimate_split(raw, split=split)
+    assert profile["split"] == split
+    assert profile["offset"] == [dy, dx]
+
+    dataclass = data.AnisotropyData(filename="beads",
+                                    raw_data=raw[np.newaxis]
+                                    .astype(np.uint16), metadata={})
+    segment.separate_channels(dataclass, split=profile)
+    # the first dy rows of the parallel channel are on the top half of the
+    # sensor
+    overlap = slice(dy, split)
+    assert np.array_equal(dataclass.perpendicular[:, overlap],
+                          dataclass.parallel[:, overlap])
+
+
+def test_correct_flattens_known_gain(tmp_path):
+    split, dy, dx = 264, 30, 4
+    profile = {"split": split, "offset": [dy, dx], "shape": [512, 128]}
+    rng = np.random.default_rng(0)
+    dark = rng.uniform(90, 110, size=(512, 128))
+    gain = rng.uniform(0.7, 1.3, size=(512, 128))
+    # the halves of the splitter pass different intensities
+    top = np.broadcast_to(np.arange(512)[:, np.newaxis] < split, (512, 128))
+
+    def acquire(filename, top_level, bottom_level):
+        level = np.where(top, top_level, bottom_level)
+        image = np.round(dark + gain * level).astype(np.uint16)
+        files.imsave(image[np.newaxis], filename)
+        return image
+
+    dark_file, flat_file = str(tmp_path / "dark.tif"), str(tmp_path /
+                                                           "flat.tif")
+    acquire(dark_file, 0, 0)
+    acquire(flat_file, 4000, 3000)
+    image = acquire(str(tmp_path / "sample.tif"), 1000, 800)
+
+    maps = calibration.build([dark_file], [flat_file],
+                             cachedir=str(tmp_path / "cache"), split=profile)
+    dataclass = data.AnisotropyData(filename="sample",
+                                    raw_data=image[np.newaxis], metadata={})
+    segment.separate_channels(dataclass, split=profile)
+    # the parallel region is below the split line, from row 40
+    segment.apply_roi(dataclass, roi.rectangle([[10, 40], [110, 250]]))
+    calibration.correct(dataclass, maps)
+
+    # the correction keeps the mean gain of every half of the sensor
+    expected = {"perpendicular": 1000 * gain[top].mean(),
+                "parallel": 800 * gain[~top].mean()}
+    for channel, level in expected.items():
+        corrected = getattr(dataclass, channel + "_roi")
+        assert corrected.shape == (1, 210, 100)
+        np.testing.assert_allclose(corrected, level, rtol=2e-3)
+    assert dataclass.metadata["calibration"] == maps["path"]
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+from fai import cohort, data
+
+
+def cell(filename, mean):
+    return data.AnisotropyData(filename=filename, raw_data=None, metadata={},
+                               mean=list(mean), median=list(mean))
+
+
+@pytest.fixture
+def table():
+    table = cohort.build([cell("a", [1, 2, 3]), cell("b", [3, 4])],
+                         treatment="control")
+    return cohort.add(table, [cell("c", [5, 6, 7, 8])], "drug")
+
+
+def test_add_pads_shorter_series(table):
+    assert table.cells == ["a", "b", "c"]
+    assert table.treatments == ["control", "control", "drug"]
+    np.testing.assert_array_equal(table.series["mean"],
+                                  [[1, 2, 3, np.nan],
+                                   [3, 4, np.nan, np.nan],
+                                   [5, 6, 7, 8]])
+    assert table.series["ks"].shape == (3, 4)
+    assert np.isnan(table.series["ks"]).all()
+
+
+def test_aggregate_sample_sem():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(6, 5))
+    values[0, 1] = values[1, 1] = np.nan
+    values[:5, 4] = np.nan
+
+    aggregated = cohort.aggregate(values)
+
+    count = (~np.isnan(values)).sum(axis=0)
+    np.testing.assert_array_equal(aggregated["count"][0], count)
+    np.testing.assert_allclose(aggregated["mean"][0],
+                               np.nanmean(values, axis=0))
+    np.testing.assert_allclose(aggregated["median"][0],
+                               np.nanmedian(values, axis=0))
+    sem = np.nanstd(values[:, :4], axis=0, ddof=1) / np.sqrt(count[:4])
+    np.testing.assert_allclose(aggregated["sem"][0, :4], sem)
+    # a single cell has no standard error
+    assert np.isnan(aggregated["sem"][0, 4])
+
+
+def test_group_by(table):
+    treatments, aggregated = cohort.group_by(table)
+
+    assert treatments == ["control", "drug"]
+    np.testing.assert_array_equal(aggregated["count"],
+                                  [[2, 2, 1, 0], [1, 1, 1, 1]])
+    np.testing.assert_allclose(aggregated["mean"][0, :3], [2, 3, 3])
+    np.testing.assert_array_equal(aggregated["mean"][1], [5, 6, 7, 8])
+    assert np.isnan(aggregated["mean"][0, 3])
+
+
+def test_select(table):
+    selected = cohort.select(table, "control")
+
+    assert selected.cells == ["a", "b"]
+    assert selected.treatments == ["control", "control"]
+    np.testing.assert_array_equal(selected.series["mean"],
+                                  table.series["mean"][:2])
+
+
+def test_save_read(table, tmp_path):
+    filename = str(tmp_path / "cohort.npz")
+    cohort.save(table, filename)
+    loaded = cohort.read(filename)
+
+    assert loaded.cells == table.cells
+    assert loaded.treatments == table.treatments
+    assert loaded.series.keys() == table.series.keys()
+    for name, values in table.series.items():
+        np.testing.assert_array_equal(loaded.series[name], values)
+
+
+def test_update_reads_only_series(tmp_path, monkeypatch):
+    filenames = [str(tmp_path / f"{name}.pkl") for name in "ab"]
+    data.save(cell("a", [1, 2]), filenames[0])
+    data.save(cell("b", [3, 4, 5]), filenames[1])
+
+    def read(filename):
+        raise AssertionError("the dataclass was read")
+    monkeypatch.setattr(data, "read", read)
+
+    table = cohort.update(cohort.CohortTable(), filenames[:1], "control")
+    table = cohort.update(table, filenames, "control")
+
+    assert table.cells == filenames
+    np.testing.assert_array_equal(table.series["mean"],
+                                  [[1, 2, np.nan], [3, 4, 5]])
+    assert np.isnan(table.series["ks"]).all()
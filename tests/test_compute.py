@@ -0,0 +1,94 @@
+import warnings
+import numpy as np
+from fai import compute, data
+
+
+STATS = ("mean", "median", "mean_norm", "median_norm", "mean_delta",
+         "median_delta")
+
+
+def cropped(seed=0, shape=(4, 20, 26)):
+    """Cropped channels of a nucleus with a known anisotropy"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.ogrid[:shape[1], :shape[2]]
+    mask = np.broadcast_to((rows - 10)**2 / 8**2 + (cols - 13)**2 / 11**2
+                           <= 1, shape).copy()
+    intensity = rng.uniform(400, 900, size=shape)
+    anisotropy = rng.uniform(0.1, 0.3, size=shape)
+    parallel = 100 + intensity * (1 + 2 * anisotropy) / 3
+    perpendicular = 100 + intensity * (1 - anisotropy) / 3
+    return (mask, parallel.astype(np.uint16),
+            perpendicular.astype(np.uint16))
+
+
+def dataclass_of(mask, parallel, perpendicular, **kwds):
+    return data.AnisotropyData(filename="", raw_data=None, metadata={},
+                               mask_roi_cropped=mask,
+                               parallel_roi_cropped=parallel,
+                               perpendicular_roi_reg_cropped=perpendicular,
+                               **kwds)
+
+
+def anisotropy(dataclass, *args, **kwds):
+    with warnings.catch_warnings():
+        # the background of the synthetic channels is not 100
+        warnings.simplefilter("ignore", UserWarning)
+        return compute.anisotropy(dataclass, *args, **kwds)
+
+
+def test_secondary_equals_single_channel():
+    mask, parallel, perpendicular = cropped(seed=0)
+    _, secondary_parallel, secondary_perpendicular = cropped(seed=1)
+
+    multiplexed = anisotropy(dataclass_of(
+        mask, parallel, perpendicular,
+        secondary_parallel_roi_cropped=secondary_parallel,
+        secondary_perpendicular_roi_reg_cropped=secondary_perpendicular),
+        1.1, 100, secondary_g_factor=0.9)
+    primary = anisotropy(dataclass_of(mask, parallel, perpendicular),
+                         1.1, 100)
+    secondary = anisotropy(dataclass_of(mask, secondary_parallel,
+                                        secondary_perpendicular), 0.9, 100)
+
+    for name in ("anisotropy_raw", "anisotropy_round",
+                 "anisotropy_round_median") + STATS:
+        np.testing.assert_array_equal(getattr(multiplexed, name),
+                                      getattr(primary, name))
+        np.testing.assert_array_equal(
+            getattr(multiplexed, "secondary_" + name),
+            getattr(secondary, name))
+    assert multiplexed.metadata["secondary_g_factor"] == 0.9
+
+
+def test_secondary_g_factor_defaults_to_g_factor():
+    mask, parallel, perpendicular = cropped(seed=0)
+    multiplexed = anisotropy(dataclass_of(
+        mask, parallel, perpendicular,
+        secondary_parallel_roi_cropped=parallel,
+        secondary_perpendicular_roi_reg_cropped=perpendicular), 1.1, 100)
+
+    assert multiplexed.metadata["secondary_g_factor"] == 1.1
+    np.testing.assert_array_equal(multiplexed.secondary_anisotropy_round,
+                                  multiplexed.anisotropy_round)
+
+
+def test_sweep_equals_anisotropy():
+    mask, parallel, perpendicular = cropped(seed=0)
+    g_factors = [0.9, 1.0, 1.2]
+    bgs = [90, 100, 105]
+
+    results = compute.sweep(dataclass_of(mask, parallel, perpendicular),
+                            g_factors, bgs)
+
+    np.testing.assert_array_equal(results["g_factor"], g_factors)
+    np.testing.assert_array_equal(results["bg"], bgs)
+    for i, g_factor in enumerate(g_factors):
+        for j, bg in enumerate(bgs):
+            expected = anisotropy(dataclass_of(mask, parallel,
+                                               perpendicular), g_factor, bg)
+            # the statistics of `anisotropy` are in the precision of
+            # `config.compute_dtype`, and the deltas are differences of them
+            for name in STATS:
+                np.testing.assert_allclose(results[name][i, j],
+                                           getattr(expected, name),
+                                           rtol=1e-6, atol=1e-7)
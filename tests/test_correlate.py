@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from scipy import stats as scipy_stats
+from fai import stats
+
+
+def stacks(seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(1, 1, size=(4, 16, 16))
+    noise = (0.5 + np.arange(4))[:, np.newaxis, np.newaxis]
+    y = x[0] + noise * rng.normal(size=x.shape)
+    # background pixels, and ties
+    x[:, :3] = 0
+    y[:, :, :2] = 0
+    x[:, 5] = np.round(x[:, 5])
+    return x, y
+
+
+@pytest.mark.parametrize("method, reference",
+                         [("pearson", scipy_stats.pearsonr),
+                          ("spearman", scipy_stats.spearmanr)])
+@pytest.mark.parametrize("without_zero", [True, False])
+def test_correlate_matches_scipy(method, reference, without_zero):
+    x, y = stacks()
+    r, p = stats.correlate(x, y, method=method, without_zero=without_zero)
+
+    for frame in range(len(x)):
+        a, b = x[frame].ravel(), y[frame].ravel()
+        if without_zero:
+            keep = (a != 0) & (b != 0)
+            a, b = a[keep], b[keep]
+        expected = reference(a, b)
+        np.testing.assert_allclose(r[frame], expected[0], rtol=1e-10)
+        np.testing.assert_allclose(p[frame], expected[1], rtol=1e-6,
+                                   atol=1e-300)
+
+
+def test_correlate_single_image():
+    x, _ = stacks()
+    r, _ = stats.correlate(x, x[0])
+    assert r[0] == pytest.approx(1)
+    np.testing.assert_allclose(r, [stats.pearson(frame, x[0])[0]
+                                   for frame in x])
@@ -0,0 +1,29 @@
+import gc
+import weakref
+import numpy as np
+from fai import data, segment, synthetic
+
+
+def test_retain_frees_raw_data():
+    dataclass, _ = synthetic.acquisition(n_frames=2, seed=0)
+    raw = weakref.ref(dataclass.raw_data)
+
+    segment.separate_channels(dataclass, keep="final")
+    gc.collect()
+
+    assert dataclass.raw_data is None
+    assert raw() is None
+    assert dataclass.parallel.base is None
+    assert data.nbytes(dataclass) == (dataclass.parallel.nbytes +
+                                      dataclass.perpendicular.nbytes)
+
+
+def test_retain_keeps_views_of_held_arrays():
+    raw = np.zeros((2, 8, 8))
+    dataclass = data.AnisotropyData(filename="", raw_data=raw, metadata={},
+                                    parallel=raw[:, :4])
+
+    data.retain(dataclass, ["perpendicular"], keep="final")
+
+    assert dataclass.parallel.base is raw
+    assert data.nbytes(dataclass) == raw.nbytes
@@ -0,0 +1,37 @@
+import numpy as np
+from fai import cohort, data, export
+
+
+def cell(filename, mean):
+    return data.AnisotropyData(filename=filename, raw_data=None, metadata={},
+                               mean=list(mean), median=list(mean),
+                               mean_delta=list(mean), mean_norm=list(mean))
+
+
+def test_append_csv(tmp_path):
+    path = str(tmp_path / "results.csv.gz")
+    control = cohort.build([cell("a", [1, 2, 3]), cell("b", [4, np.nan])],
+                           "control")
+
+    # every writer appends a gzip member, after the header of the first one
+    export.append(control, path)
+    export.append([cell("c", [5])], path, treatment="drug")
+    export.append([], path, treatment="drug")
+    export.append([cell("d", [6, 7])], path, treatment="drug")
+    result = export.read(path)
+
+    # time points without any value, as the end of "b", are left out
+    assert result["cell"].tolist() == ["a", "a", "a", "b", "c", "d", "d"]
+    assert result["treatment"].tolist() == ["control"] * 4 + ["drug"] * 3
+    assert result["frame"].tolist() == [0, 1, 2, 0, 0, 0, 1]
+    assert result["frame"].dtype == np.int32
+    np.testing.assert_array_equal(result["mean"], [1, 2, 3, 4, 5, 6, 7])
+    assert np.isnan(result["ks"]).all()
+
+
+def test_append_existing_csv_without_extension(tmp_path):
+    path = str(tmp_path / "results")
+    export.append([cell("a", [1, 2])], path, format="csv")
+    export.append([cell("b", [3])], path)
+
+    assert export.read(path)["cell"].tolist() == ["a", "a", "b"]
@@ -0,0 +1,48 @@
+import copy
+import numpy as np
+from fai import field, segment, synthetic
+
+
+def test_tiles_cover_image():
+    covered = np.zeros((300, 250), dtype=int)
+    for tile, core, inner in field.tiles(covered.shape, size=128,
+                                         overlap=40):
+        covered[core] += 1
+        assert all(c.start - t.start == i.start and c.stop - c.start ==
+                   i.stop - i.start for t, c, i in zip(tile, core, inner))
+        assert all(t.start >= 0 and t.stop <= n
+                   for t, n in zip(tile, covered.shape))
+    assert (covered == 1).all()
+
+
+def test_whole_field_tiles_match_single_tile():
+    dataclass, truth = synthetic.acquisition(
+        n_frames=2, shape=(384, 384), n_nuclei=6, radius=(22, 28),
+        shift=(0, 0), seed=4)
+    segment.separate_channels(dataclass)
+    single = copy.deepcopy(dataclass)
+
+    _, expected = field.whole_field(single, 1.0, 100, size=384, overlap=0,
+                                    register=False, workers=1)
+    # nuclei span the cores of several tiles, and are whole in the overlap
+    _, table = field.whole_field(dataclass, 1.0, 100, size=128, overlap=64,
+                                 register=False, workers=2)
+
+    assert len(expected["nucleus"]) == 2 * truth["labels"].max()
+    np.testing.assert_array_equal(table["frame"], expected["frame"])
+    order = np.lexsort((table["x"], table["y"], table["frame"]))
+    expected_order = np.lexsort((expected["x"], expected["y"],
+                                 expected["frame"]))
+    for column, atol in (("y", 1), ("x", 1), ("mean", 0.005),
+                         ("median", 0.005)):
+        np.testing.assert_allclose(table[column][order],
+                                   expected[column][expected_order],
+                                   atol=atol)
+    # the threshold of every tile moves the edges of the nuclei slightly
+    np.testing.assert_allclose(table["area"][order],
+                               expected["area"][expected_order], rtol=0.03)
+
+    # tracks are kept over the frames
+    for column in ("nucleus", "y", "x"):
+        first, second = np.split(table[column], 2)
+        np.testing.assert_allclose(np.sort(first), np.sort(second), atol=1)
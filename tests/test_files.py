@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+import tifffile
+from fai import files
+
+
+@pytest.fixture
+def stack():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 4000, size=(3, 72, 88), dtype=np.uint16)
+
+
+def write(stack, filename, **kwds):
+    files.imwrite(iter(stack), filename, stack.shape, stack.dtype, **kwds)
+
+
+@pytest.mark.parametrize("compression", ["zlib", None])
+def test_imwrite_tiles(stack, tmp_path, compression):
+    filename = str(tmp_path / "stack.tif")
+    write(stack, filename, tile=(32, 32), compression=compression)
+
+    with tifffile.TiffFile(filename) as tif:
+        page = tif.pages[0]
+        assert page.is_tiled
+        assert (page.tilelength, page.tilewidth) == (32, 32)
+        assert not tif.is_bigtiff
+        np.testing.assert_array_equal(tif.asarray(), stack)
+
+
+def test_imwrite_small_frames_in_strips(stack, tmp_path):
+    filename = str(tmp_path / "stack.tif")
+    write(stack, filename, tile=(256, 256))
+
+    with tifffile.TiffFile(filename) as tif:
+        assert not tif.pages[0].is_tiled
+        np.testing.assert_array_equal(tif.asarray(), stack)
+
+
+def test_imwrite_bigtiff(stack, tmp_path, monkeypatch):
+    filename = str(tmp_path / "stack.tif")
+    monkeypatch.setattr(files, "CLASSIC_TIFF_NBYTES", stack.nbytes - 1)
+    write(stack, filename, tile=(32, 32))
+
+    with tifffile.TiffFile(filename) as tif:
+        assert tif.is_bigtiff
+        np.testing.assert_array_equal(tif.asarray(), stack)
+
+    write(stack, filename, tile=(32, 32), bigtiff=False)
+    with tifffile.TiffFile(filename) as tif:
+        assert not tif.is_bigtiff
+
+
+def test_imwrite_pyramid(stack, tmp_path):
+    filename = str(tmp_path / "stack.tif")
+    write(stack, filename, tile=(32, 32), pyramid=2)
+
+    with tifffile.TiffFile(filename) as tif:
+        levels = tif.series[0].levels
+        assert len(levels) == 3
+        np.testing.assert_array_equal(levels[0].asarray(), stack)
+        half = levels[1].asarray()
+        assert half.shape == (3, 36, 44)
+        np.testing.assert_array_equal(
+            half, stack.reshape(3, 36, 2, 44, 2).mean(axis=(2, 4)).astype(
+                stack.dtype))
+        assert levels[2].asarray().shape == (3, 18, 22)
+
+
+def test_read_metadata(stack, tmp_path):
+    filename = str(tmp_path / "stack.tif")
+    metadata = {"bg": np.float32(100.5), "g_factor": 1.2,
+                "coords": np.array([[10, 20], [30, 40]]),
+                "slice": slice(2, 8, None), "binning": 2, "nucleus": None}
+    write(stack, filename, metadata=metadata, tile=(32, 32), pyramid=1)
+
+    assert files.read_metadata(filename) == {
+        "bg": 100.5, "g_factor": 1.2, "coords": [[10, 20], [30, 40]],
+        "slice": [2, 8, None], "binning": 2, "nucleus": None}
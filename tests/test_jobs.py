@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+import pytest
+from fai import jobs
+
+
+@pytest.fixture
+def queue(tmp_path):
+    path = str(tmp_path / "queue")
+    filenames = [str(tmp_path / f"cell_{number}.tif") for number in range(8)]
+    jobs.enqueue(path, filenames, str(tmp_path / "results"), g_factor=1.0)
+    return path
+
+
+def age(path, job_id, seconds):
+    """Make a running job look like it sent no heartbeat for `seconds`"""
+    filename = jobs._job_file(path, "running", job_id)
+    then = time.time() - seconds
+    os.utime(filename, (then, then))
+
+
+def test_enqueue_skips_known_and_other_files(queue, tmp_path):
+    filenames = [str(tmp_path / "cell_0.tif"), str(tmp_path / "new.tif"),
+                 str(tmp_path / "new_roi.json")]
+    added = jobs.enqueue(queue, filenames, str(tmp_path / "results"))
+
+    assert added == [jobs._job_id(filenames[1])]
+    assert jobs.status(queue)["pending"] == 9
+
+
+def test_claim_is_exclusive(queue):
+    claimed = []
+
+    def worker():
+        while True:
+            job = jobs.claim(queue)
+            if job is None:
+                return
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 8
+    assert len(set(claimed)) == 8
+    assert jobs.status(queue) == {"pending": 0, "running": 8, "done": 0,
+                                  "failed": 0}
+
+
+def test_requeue_after_timeout(queue):
+    job = jobs.claim(queue)
+    assert jobs.requeue_stale(queue, timeout=60) == []
+
+    age(queue, job["id"], 120)
+    assert jobs.requeue_stale(queue, timeout=60) == [job["id"]]
+    assert jobs.state(queue, job["id"]) == "pending"
+
+    claimed = [jobs.claim(queue) for _ in range(8)]
+    again, = [other for other in claimed if other["id"] == job["id"]]
+    assert again["attempts"] == 2
+
+
+def test_max_attempts_fails(queue):
+    for attempt in range(2):
+        job = jobs.claim(queue)
+        age(queue, job["id"], 120)
+        jobs.requeue_stale(queue, timeout=60, max_attempts=2)
+
+    assert jobs.state(queue, job["id"]) == "failed"
+    assert "No heartbeat" in jobs._read(
+        jobs._job_file(queue, "failed", job["id"]))["error"]
+
+
+def test_heartbeat_keeps_a_job_being_requeued(queue):
+    job = jobs.claim(queue)
+    filename = jobs._job_file(queue, "running", job["id"])
+    age(queue, job["id"], 120)
+
+    with jobs.heartbeat(queue, job, interval=0.01):
+        # as `requeue_stale` does, before it checks the heartbeat again
+        os.rename(filename, filename + ".stale")
+        time.sleep(0.1)
+        assert time.time() - os.path.getmtime(filename + ".stale") < 60
+        os.rename(filename + ".stale", filename)
+        time.sleep(0.1)
+        assert time.time() - os.path.getmtime(filename) < 60
+
+
+def test_work_and_retry(queue):
+    pending = sorted(os.listdir(os.path.join(queue, "pending")))
+    failing = {name[:-len(".json")] for name in pending[:2]}
+
+    def pipeline(job):
+        if job["id"] in failing:
+            raise RuntimeError("broken acquisition")
+        return [job["filename"] + ".pkl"]
+
+    assert len(jobs.work(queue, pipeline=pipeline, interval=0.01)) == 8
+    assert jobs.status(queue) == {"pending": 0, "running": 0, "done": 6,
+                                  "failed": 2}
+    assert len(jobs.outputs(queue)) == 6
+    job = jobs._read(jobs._job_file(queue, "failed", min(failing)))
+    assert "broken acquisition" in job["error"]
+
+    assert sorted(jobs.retry(queue)) == sorted(failing)
+    retried = set(failing)
+    failing.clear()
+    assert set(jobs.work(queue, pipeline=pipeline, interval=0.01)) == retried
+    assert jobs.status(queue)["done"] == 8
+    assert len(jobs.outputs(queue)) == 8
+
+
+def test_work_fails_without_roi(queue):
+    processed = jobs.work(queue, interval=0.01)
+
+    assert len(processed) == 8
+    assert jobs.status(queue)["failed"] == 8
+    job = jobs._read(jobs._job_file(queue, "failed", processed[0]))
+    assert "No region of interest" in job["error"]
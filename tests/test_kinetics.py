@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+from fai import kinetics
+
+
+T = np.arange(40) * 5.0
+
+
+def noisy(model, truth, sigma, seed=0):
+    rng = np.random.default_rng(seed)
+    func = kinetics.MODELS[model][0]
+    values = func(T, *[column[:, np.newaxis] for column in truth.T])
+    return values + rng.normal(0, sigma, size=values.shape)
+
+
+def test_fit_mono():
+    rng = np.random.default_rng(1)
+    truth = np.stack([rng.uniform(0.5, 1, 20), rng.uniform(0.02, 0.1, 20),
+                      rng.uniform(0, 0.3, 20)], axis=1)
+    values = noisy("mono", truth, 0.01)
+    values[:3, 30:] = np.nan
+
+    results = kinetics.fit(values, workers=0)
+
+    assert results["names"] == ("a", "k", "c")
+    assert results["converged"].all()
+    assert (results["r2"] > 0.99).all()
+    np.testing.assert_allclose(results["params"], truth, rtol=0.1,
+                               atol=0.01)
+
+
+def test_fit_bi():
+    rng = np.random.default_rng(2)
+    truth = np.stack([rng.uniform(0.4, 0.6, 10), rng.uniform(0.15, 0.3, 10),
+                      rng.uniform(0.4, 0.6, 10), rng.uniform(0.01, 0.03, 10),
+                      rng.uniform(0, 0.3, 10)], axis=1)
+    values = noisy("bi", truth, 0.002)
+
+    results = kinetics.fit(values, "bi", workers=1)
+
+    assert results["converged"].all()
+    np.testing.assert_allclose(results["params"], truth, rtol=0.1,
+                               atol=0.01)
+
+
+def test_fit_too_short():
+    values = noisy("mono", np.array([[1, 0.05, 0]]), 0.01)
+    values[:, 3:] = np.nan
+
+    results = kinetics.fit(values, workers=0)
+
+    assert np.isnan(results["params"]).all()
+    assert np.isnan(results["r2"]).all()
+
+
+def test_curve_fit_rejects_undetermined_parameters():
+    # the rate of a flat series is not determined
+    assert kinetics._curve_fit(("mono", T, np.ones(len(T)),
+                                [0, 0.1, 1])) is None
+    params = kinetics._curve_fit(("mono", T, np.exp(-0.1 * T), [1, 0.2, 0]))
+    np.testing.assert_allclose(params, [1, 0.1, 0], atol=1e-6)
+
+
+def test_unknown_model():
+    with pytest.raises(ValueError):
+        kinetics.fit(np.ones((1, 10)), "tri")
@@ -0,0 +1,69 @@
+import numpy as np
+from fai import data, lazy, synthetic
+
+
+def lazy_acquisition(**params):
+    dataclass, truth = synthetic.acquisition(n_frames=3, shift=(0, 0),
+                                             seed=1)
+    result = lazy.LazyAnisotropyData(filename="synthetic",
+                                     raw_data=dataclass.raw_data,
+                                     metadata={})
+    result.set_params(coords=np.array([[20, 20], [236, 236]]),
+                      g_factor=truth["g_factor"], bg=truth["offset"],
+                      **params)
+    # the channels are aligned, registration is skipped
+    result.perpendicular_roi_reg = result.perpendicular_roi
+    return result
+
+
+def test_repr_does_not_compute():
+    result = lazy.LazyAnisotropyData(filename="synthetic",
+                                     raw_data=np.zeros((2, 8, 8)),
+                                     metadata={})
+
+    assert "synthetic" in repr(result)
+    assert result == result
+    assert all(vars(result)[field] is None for field in lazy.PRODUCERS)
+
+
+def test_g_factor_recomputes_only_anisotropy():
+    result = lazy_acquisition()
+    before = result.mean
+    mask = result.mask_roi_cropped
+
+    result.set_params(g_factor=1.2)
+
+    fields = vars(result)
+    for name in lazy.downstream(["g_factor"]):
+        assert all(fields[field] is None
+                   for field in lazy.STAGES[name].produces)
+    assert fields["mask_roi_cropped"] is mask
+    assert result.mean != before
+    assert result.mask_roi_cropped is mask
+
+
+def test_unchanged_array_parameter_does_not_invalidate():
+    result = lazy_acquisition()
+    parallel_roi = result.parallel_roi
+    amap = result.anisotropy_round_median
+
+    result.set_params(coords=np.array([[20, 20], [236, 236]]))
+
+    assert vars(result)["parallel_roi"] is parallel_roi
+    assert vars(result)["anisotropy_round_median"] is amap
+
+
+def test_release_to_budget_keeps_final():
+    result = lazy_acquisition()
+    result.mean
+    final = {field: vars(result)[field] for field in lazy.FINAL}
+    # the raw data is not produced by the pipeline, and is never released
+    budget = result.raw_data.nbytes + sum(
+        value.nbytes for value in final.values()
+        if isinstance(value, np.ndarray))
+    assert data.nbytes(result) > budget
+
+    result.release(budget)
+
+    assert data.nbytes(result) <= budget
+    assert all(vars(result)[field] is final[field] for field in lazy.FINAL)
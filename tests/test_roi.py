@@ -0,0 +1,12 @@
+from fai import roi
+
+
+def test_csv_round_trip(tmp_path):
+    specs = [roi.rectangle([[10, 20], [110, 140]]),
+             roi.circle([[50.5, 60.0], [52.0, 61.5]], 10),
+             roi.scale(roi.circle([[25.0, 30.0]], 10), 1 / 4)]
+    filename = str(tmp_path / "rois.csv")
+
+    roi.write(specs, filename)
+
+    assert roi.read(filename) == specs
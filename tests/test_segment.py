@@ -0,0 +1,90 @@
+import numpy as np
+from fai import segment
+
+
+def disks(centers, shape=(64, 96), radius=4):
+    """Mask of disks, with a list of (y, x) centers or None in every frame"""
+    rows, cols = np.ogrid[:shape[0], :shape[1]]
+    mask = np.zeros((len(centers),) + shape, dtype=bool)
+    for frame, frame_centers in enumerate(centers):
+        for center in frame_centers:
+            if center is not None:
+                mask[frame] |= ((rows - center[0])**2 +
+                                (cols - center[1])**2 <= radius**2)
+    return mask
+
+
+def test_track_keeps_identities():
+    # "a" drifts slowly and overlaps itself, "b" jumps by more than its size,
+    # closer to "a" than before, and is missing in a frame
+    centers = [[(20, 20), (44, 60)],
+               [(21, 22), (38, 50)],
+               [(22, 24), None],
+               [(23, 26), (32, 40)],
+               [(24, 28), (30, 36)]]
+    tracked = segment.track(disks(centers), max_distance=15)
+
+    assert tracked.dtype == np.int32
+    for frame, (a, b) in enumerate(centers):
+        assert tracked[frame][a] == 1
+        if b is not None:
+            assert tracked[frame][b] == 2
+    assert set(np.unique(tracked)) == {0, 1, 2}
+
+
+def test_track_new_object_beyond_max_distance():
+    centers = [[(20, 20)], [(20, 22)], [(20, 22), (50, 80)]]
+    tracked = segment.track(disks(centers), max_distance=15)
+
+    assert tracked[2][50, 80] == 2
+    assert tracked[2][20, 22] == 1
+
+
+def test_crop_tracks():
+    centers = [[(20, 20), (44, 60)], [(21, 22), None], [(22, 24), (40, 56)]]
+    tracked = segment.track(disks(centers))
+    slices = segment.crop_tracks(tracked)
+
+    assert sorted(slices) == [1, 2]
+    assert slices[1] == [(slice(16, 25), slice(16, 25)),
+                         (slice(17, 26), slice(18, 27)),
+                         (slice(18, 27), slice(20, 29))]
+    assert slices[2][1] is None
+    assert slices[2][2] == (slice(36, 45), slice(52, 61))
+
+
+def test_drift_crops_stay_centred():
+    rng = np.random.default_rng(0)
+    rows, cols = np.ogrid[:15, :21]
+    nucleus = ((rows - 7)**2 / 7**2 + (cols - 10)**2 / 10**2 <= 1)
+    texture = np.where(nucleus, rng.integers(100, 1000, size=nucleus.shape),
+                       0).astype(np.uint16)
+
+    # known translation of every frame, up to the edge of the image
+    offsets = [(20, 30), (23, 28), (27, 33), (30, 40), (49, 75)]
+    images = np.zeros((len(offsets), 64, 96), dtype=np.uint16)
+    for image, (y, x) in zip(images, offsets):
+        image[y:y + 15, x:x + 21] = texture
+    mask = images > 0
+
+    slices, centroids = segment.drift_slices(mask)
+    cropped = segment.crop_frames(images, slices)
+
+    np.testing.assert_allclose(centroids, np.add(offsets, (7, 10)))
+    assert cropped.dtype == np.uint16
+    assert len({(y.stop - y.start, x.stop - x.start) for y, x in slices}) == 1
+    # every crop holds the whole nucleus at the same place, padded with
+    # zeros beyond the edge of the image
+    y, x = slices[-1]
+    assert y.stop > images.shape[1] and x.stop > images.shape[2]
+    for crop in cropped[1:]:
+        np.testing.assert_array_equal(crop, cropped[0])
+    assert cropped[0].sum() == texture.sum()
+
+
+def test_drift_interpolates_missing_frames():
+    centers = [[(20, 20)], [None], [(24, 30)]]
+    slices, centroids = segment.drift_slices(disks(centers))
+
+    np.testing.assert_allclose(centroids, [(20, 20), (22, 25), (24, 30)])
+    assert slices[1] == (slice(17, 28), slice(20, 31))
@@ -0,0 +1,49 @@
+import numpy as np
+from fai import stats
+
+
+def groups(seed=0):
+    rng = np.random.default_rng(seed)
+    values1 = rng.normal(0, 1, size=(20, 6))
+    values2 = rng.normal(0, 1, size=(15, 4))
+    # a large difference at the first time point, none after
+    values2[:, 0] += 5
+    # cells that were lost during the acquisition
+    values1[:5, 3:] = np.nan
+    return values1, values2
+
+
+def test_bootstrap():
+    values, _ = groups()
+    results = stats.bootstrap(values, n_resamples=200, seed=1)
+
+    np.testing.assert_allclose(results["curve"], np.nanmean(values, axis=0))
+    assert results["replicates"].shape == (200, 6)
+    assert np.isfinite(results["replicates"]).all()
+    assert (results["low"] <= results["curve"]).all()
+    assert (results["curve"] <= results["high"]).all()
+
+    again = stats.bootstrap(values, n_resamples=200, chunk=30, seed=1)
+    np.testing.assert_array_equal(again["low"], results["low"])
+    np.testing.assert_array_equal(again["high"], results["high"])
+
+
+def test_permutation_test():
+    values1, values2 = groups()
+    n_resamples = 500
+    results = stats.permutation_test(values1, values2,
+                                     n_resamples=n_resamples, seed=1)
+    p_value = results["p_value"]
+
+    difference = (np.nanmean(values2, axis=0) -
+                  np.nanmean(values1[:, :4], axis=0))
+    np.testing.assert_allclose(results["difference"][:4], difference)
+
+    # time points without cells in the second group have no p-value
+    assert np.isnan(results["difference"][4:]).all()
+    assert np.isnan(p_value[4:]).all()
+
+    assert ((p_value[:4] >= 1 / (n_resamples + 1)) &
+            (p_value[:4] <= 1)).all()
+    assert p_value[0] == 1 / (n_resamples + 1)
+    assert (p_value[1:4] > 0.01).all()
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from fai import segment, synthetic
+
+
+def test_acquisition_layout():
+    dataclass, truth = synthetic.acquisition(n_frames=3, shape=(160, 96),
+                                             n_nuclei=2, radius=(10, 14),
+                                             seed=0)
+
+    assert dataclass.raw_data.shape == (3, 320, 96)
+    assert dataclass.raw_data.dtype == np.uint16
+
+    segment.separate_channels(dataclass)
+    assert dataclass.parallel.shape == truth["labels"].shape
+    assert set(np.unique(truth["labels"])) == {0, 1, 2}
+    # the nuclei are brighter than the background in the parallel channel
+    inside = dataclass.parallel[truth["mask"]].mean()
+    assert inside > dataclass.parallel[~truth["mask"]].mean() + 100
+
+
+def test_acquisition_too_small():
+    with pytest.raises(ValueError, match="shape of at least"):
+        synthetic.acquisition(n_frames=2, shape=(128, 128), radius=(20, 30))
+
+    with pytest.raises(ValueError, match="shape of at least"):
+        synthetic.nuclei((256, 256), n_frames=10, radius=(20, 30),
+                         velocity=10)